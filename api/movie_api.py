@@ -12,19 +12,34 @@ sys.path.append('./src')
 from flask import Flask, jsonify, request, render_template
 from flask_cors import CORS
 from src.database import execute_query
+from src.json_provider import FastJSONProvider
+from src.compression import init_compression
+from src.response_cache import cached_response
+from src.catalog import ChangeFeedExpired, enable_document_cache, get_actor_movies, get_catalog_changes, get_catalog_changes_head, get_catalog_stats, get_director_movies, get_movie_document, get_movie_documents, get_movie_documents_by_id, genre_filter_sql, parse_genre_filter, parse_movie_ids, warm_movie_documents
+from src.catalog_events import CatalogCache, start_catalog_listener
+from src.key_cache import start_revocation_listener
+from src.catalog_snapshot import get_catalog_snapshot, start_catalog_snapshot
+from src.similarity import get_similarity_index, start_similarity_index
+from src.leaderboards import MAX_LEADERBOARD_SIZE, decade_of, get_leaderboards, start_leaderboards
+from src.popularity import get_popularity_tracker, start_popularity_tracking, track_movie_hits
+from src.semantic_search import get_semantic_index, start_semantic_index
+from src.password_hashing import PasswordHashingBusy
 from src.auth import (
     create_user, verify_user_email, resend_verification, 
-    validate_api_key, log_api_usage, AuthError, RateLimitError,
+    validate_api_key, AuthError, RateLimitError,
     init_firebase, generate_api_key, hash_api_key, 
-    check_user_rate_limit, get_user_usage_stats, upgrade_user_to_premium
+    check_and_increment_user_rate_limit, get_user_usage_stats, upgrade_user_to_premium,
+    rate_limit_headers
 )
 import json
 from functools import wraps
 
 app = Flask(__name__, template_folder='../templates', static_folder='../static')
+app.json = FastJSONProvider(app)
+init_compression(app)
 
 # Configure CORS for Replit environment - allow all origins for development
-CORS(app, origins="*")
+CORS(app, origins="*", expose_headers=["RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After"])
 
 # Configure Flask for development
 app.config['DEBUG'] = True
@@ -35,6 +50,19 @@ app.config['SERVER_NAME'] = None
 # Initialize Firebase (will be set up when credentials are provided)
 firebase_initialized = init_firebase()
 
+# Listen for catalog writes (importer, admin endpoints) so cached catalog data
+# is dropped as soon as it changes
+start_catalog_listener()
+start_revocation_listener()
+catalog_cache = CatalogCache(ttl=24 * 3600)
+enable_document_cache(CatalogCache(ttl=24 * 3600, max_entries=5000))
+start_catalog_snapshot()
+start_similarity_index()
+start_leaderboards()
+start_semantic_index()
+get_popularity_tracker().add_warmer(warm_movie_documents)
+start_popularity_tracking()
+
 def require_api_key(f):
     """Decorator to require API key for protected endpoints"""
     @wraps(f)
@@ -46,28 +74,27 @@ def require_api_key(f):
         if not api_key:
             return jsonify({'error': 'API key required'}), 401
         
+        # Key, user and plan come from the key cache; the quota check is an
+        # atomic check-and-consume in the shared rate limiter
         user_info = validate_api_key(api_key)
         if not user_info:
             return jsonify({'error': 'Invalid API key'}), 401
         
-        # Check user rate limit before processing request
         try:
-            from src.auth import check_user_rate_limit
-            check_user_rate_limit(user_info['user_id'])
+            decision = check_and_increment_user_rate_limit(
+                user_info['user_id'], user_info['api_key_id'], request.endpoint, user_info
+            )
         except RateLimitError as e:
-            return jsonify({'error': str(e)}), 429
-        except:
-            pass  # Don't fail request if rate limiting check fails
-        
-        # Log API usage
-        try:
-            log_api_usage(user_info['api_key_id'], request.endpoint, 200)
-        except:
-            pass  # Don't fail request if logging fails
+            response = jsonify({'error': str(e)})
+            if e.decision is not None:
+                response.headers.update(rate_limit_headers(e.decision))
+            return response, 429
         
         # Add user info to request context
         request.user_info = user_info
-        return f(*args, **kwargs)
+        response = app.make_response(f(*args, **kwargs))
+        response.headers.update(rate_limit_headers(decision))
+        return response
     
     return decorated_function
 
@@ -86,89 +113,97 @@ def home():
     })
 
 @app.route('/api/movies', methods=['GET'])
+@cached_response()
 def get_movies():
     """Get all movies with optional filtering and pagination"""
     try:
         # Get query parameters
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 20))
-        genre = request.args.get('genre')
+        try:
+            genres, match_all = parse_genre_filter(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         year = request.args.get('year')
         search = request.args.get('search')
         
         # Calculate offset
         offset = (page - 1) * limit
         
-        # Build base query
-        query = """
-            SELECT DISTINCT m.id, m.title, m.year, m.runtime, m.rating, 
-                   m.director, m.plot, m.poster_url
-            FROM movies m
-        """
-        
-        conditions = []
-        params = []
-        
-        # Add genre filter
-        if genre:
-            query += " LEFT JOIN movie_genres mg ON m.id = mg.movie_id"
-            conditions.append("mg.genre = %s")
-            params.append(genre)
-        
-        # Add search filter
-        if search:
-            conditions.append("(m.title ILIKE %s OR m.director ILIKE %s OR m.plot ILIKE %s)")
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param])
-        
-        # Add year filter
-        if year:
-            conditions.append("m.year = %s")
-            params.append(int(year))
-        
-        # Add WHERE clause if we have conditions
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        # Add ordering and pagination
-        query += " ORDER BY m.year DESC, m.title LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
+        # Answer from the in-memory columnar snapshot when it is enabled and
+        # current; text search and anything else it can't answer go to SQL
+        snapshot = get_catalog_snapshot() if not search else None
+        result = snapshot.query(genres, match_all, int(year) if year else None, offset, limit) if snapshot else None
         
-        movies = execute_query(query, tuple(params), fetch=True)
-        
-        # Enrich with genres and cast for each movie
-        enriched_movies = []
-        for movie in movies:
-            movie_dict = dict(movie)
+        if result is not None:
+            enriched_movies, total_movies = result
+        else:
+            # Build base query
+            query = """
+                SELECT m.id, m.title, m.year, m.runtime, m.rating, 
+                       m.director, m.plot, m.poster_url
+                FROM movies m
+            """
+        
+            conditions = []
+            params = []
+        
+            # Add genre filter
+            if genres:
+                genre_clause, genre_params = genre_filter_sql(genres, match_all)
+                conditions.append(genre_clause)
+                params.extend(genre_params)
+        
+            # Add search filter
+            if search:
+                conditions.append("(m.title ILIKE %s OR m.director ILIKE %s OR m.plot ILIKE %s)")
+                search_param = f"%{search}%"
+                params.extend([search_param, search_param, search_param])
+        
+            # Add year filter
+            if year:
+                conditions.append("m.year = %s")
+                params.append(int(year))
+        
+            # Add WHERE clause if we have conditions
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+        
+            # Add ordering and pagination
+            query += " ORDER BY m.year DESC, m.title LIMIT %s OFFSET %s"
+            params.extend([limit, offset])
+        
+            movies = execute_query(query, tuple(params), fetch=True)
+        
+            # Enrich with genres and cast for each movie
+            enriched_movies = []
+            for movie in movies:
+                movie_dict = dict(movie)
             
-            # Get genres
-            genres_result = execute_query(
-                "SELECT genre FROM movie_genres WHERE movie_id = %s ORDER BY genre",
-                (movie['id'],), fetch=True
-            )
-            movie_dict['genres'] = [g['genre'] for g in genres_result]
+                # Get genres
+                genres_result = execute_query(
+                    "SELECT genre FROM movie_genres WHERE movie_id = %s ORDER BY genre",
+                    (movie['id'],), fetch=True
+                )
+                movie_dict['genres'] = [g['genre'] for g in genres_result]
             
-            # Get cast
-            cast_result = execute_query(
-                "SELECT actor_name FROM movie_cast WHERE movie_id = %s ORDER BY actor_name",
-                (movie['id'],), fetch=True
-            )
-            movie_dict['cast'] = [c['actor_name'] for c in cast_result]
+                # Get cast
+                cast_result = execute_query(
+                    "SELECT actor_name FROM movie_cast WHERE movie_id = %s ORDER BY actor_name",
+                    (movie['id'],), fetch=True
+                )
+                movie_dict['cast'] = [c['actor_name'] for c in cast_result]
             
-            enriched_movies.append(movie_dict)
+                enriched_movies.append(movie_dict)
         
-        # Get total count for pagination
-        count_query = "SELECT COUNT(DISTINCT m.id) as total FROM movies m"
-        if genre:
-            count_query += " LEFT JOIN movie_genres mg ON m.id = mg.movie_id"
-        if conditions:
-            count_query += " WHERE " + " AND ".join(conditions[:-2] if year else conditions)
-            count_params = params[:-2] if conditions else []
-        else:
-            count_params = []
+            # Get total count for pagination
+            count_query = "SELECT COUNT(*) as total FROM movies m"
+            if conditions:
+                count_query += " WHERE " + " AND ".join(conditions)
+            count_params = params[:-2]
         
-        total_result = execute_query(count_query, tuple(count_params), fetch=True)
-        total_movies = total_result[0]['total']
+            total_result = execute_query(count_query, tuple(count_params), fetch=True)
+            total_movies = total_result[0]['total']
         
         return jsonify({
             'movies': enriched_movies,
@@ -184,89 +219,243 @@ def get_movies():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/movies/<int:movie_id>', methods=['GET'])
+@track_movie_hits(lambda movie_id: [movie_id])
+@cached_response(movie_ids=lambda movie_id: [movie_id])
 def get_movie(movie_id):
     """Get a specific movie by ID"""
     try:
-        # Get movie details
-        movie_result = execute_query(
-            "SELECT * FROM movies WHERE id = %s",
-            (movie_id,), fetch=True
-        )
+        # Precomputed document (movie + genres + cast), sent through as-is
+        document = get_movie_document(movie_id)
         
-        if not movie_result:
+        if document is None:
             return jsonify({'error': 'Movie not found'}), 404
         
-        movie = dict(movie_result[0])
+        return app.response_class('{"movie": ' + document + '}', mimetype='application/json')
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/movies/batch', methods=['GET'])
+@track_movie_hits(lambda: parse_movie_ids(request.args.get('ids', '')))
+@cached_response(movie_ids=lambda: parse_movie_ids(request.args.get('ids', '')))
+def get_movies_batch():
+    """Get several movies by ID (?ids=1,2,3)"""
+    try:
+        try:
+            movie_ids = parse_movie_ids(request.args.get('ids', ''))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Get genres
-        genres_result = execute_query(
-            "SELECT genre FROM movie_genres WHERE movie_id = %s ORDER BY genre",
-            (movie_id,), fetch=True
+        documents, missing = get_movie_documents(movie_ids)
+        
+        return app.response_class(
+            '{"movies": [' + ', '.join(documents) + '], "missing": ' + json.dumps(missing) + '}',
+            mimetype='application/json'
+        )
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/movies/popular', methods=['GET'])
+def get_popular_movies():
+    """Get the most viewed movies, weighted towards recent views (?n=)"""
+    try:
+        n = min(max(int(request.args.get('n', 10)), 1), 100)
+        
+        tracker = get_popularity_tracker()
+        popular = tracker.top(n)
+        documents = get_movie_documents_by_id([movie_id for movie_id, _ in popular])
+        entries = [
+            '{"score": %.2f, "movie": %s}' % (score, documents[movie_id])
+            for movie_id, score in popular if movie_id in documents
+        ]
+        as_of = tracker.ranked_at.isoformat() if tracker.ranked_at else None
+        
+        return app.response_class(
+            '{"movies": [' + ', '.join(entries) + '], "as_of": ' + json.dumps(as_of) + '}',
+            mimetype='application/json'
         )
-        movie['genres'] = [g['genre'] for g in genres_result]
+    
+    except ValueError:
+        return jsonify({'error': 'n must be an integer'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/movies/<int:movie_id>/similar', methods=['GET'])
+@cached_response()
+def get_similar_movies(movie_id):
+    """Get movies similar to a movie ("more like this")"""
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+        
+        similar = get_similarity_index().similar(movie_id, limit)
+        if similar is None:
+            return jsonify({'error': 'Movie not found'}), 404
+        
+        documents = get_movie_documents_by_id([similar_id for similar_id, _ in similar])
+        entries = [
+            '{"score": %.4f, "movie": %s}' % (score, documents[similar_id])
+            for similar_id, score in similar if similar_id in documents
+        ]
         
-        # Get cast
-        cast_result = execute_query(
-            "SELECT actor_name, role FROM movie_cast WHERE movie_id = %s ORDER BY actor_name",
-            (movie_id,), fetch=True
+        return app.response_class(
+            '{"movie_id": %d, "similar": [%s]' % (movie_id, ', '.join(entries)) + '}',
+            mimetype='application/json'
         )
-        movie['cast'] = [{'name': c['actor_name'], 'role': c['role']} for c in cast_result]
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/actors/<name>/movies', methods=['GET'])
+@cached_response()
+def get_actor_filmography(name):
+    """Get an actor's movies (?cursor= from the previous page, ?limit=)"""
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
         
-        return jsonify({'movie': movie})
+        movies, next_cursor = get_actor_movies(name, after=cursor, limit=limit)
+        
+        return jsonify({
+            'actor': name,
+            'movies': movies,
+            'pagination': {
+                'limit': limit,
+                'next_cursor': next_cursor
+            }
+        })
     
+    except ValueError:
+        return jsonify({'error': 'cursor and limit must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/directors/<name>/movies', methods=['GET'])
+@cached_response()
+def get_director_filmography(name):
+    """Get a director's movies (?cursor= from the previous page, ?limit=)"""
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        
+        movies, next_cursor = get_director_movies(name, after=cursor, limit=limit)
+        
+        return jsonify({
+            'director': name,
+            'movies': movies,
+            'pagination': {
+                'limit': limit,
+                'next_cursor': next_cursor
+            }
+        })
+    
+    except ValueError:
+        return jsonify({'error': 'cursor and limit must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/top', methods=['GET'])
+@cached_response()
+def get_top_movies():
+    """Get the top rated movies, optionally for a genre and/or decade (?genre=&decade=&n=)"""
+    try:
+        genre = request.args.get('genre') or None
+        decade = request.args.get('decade')
+        n = min(max(int(request.args.get('n', 10)), 1), MAX_LEADERBOARD_SIZE)
+        
+        if decade:
+            decade = decade_of(int(decade.rstrip('sS')))
+        else:
+            decade = None
+        
+        top = get_leaderboards().top(genre, decade, n)
+        documents = get_movie_documents_by_id([movie_id for movie_id, _ in top])
+        entries = [documents[movie_id] for movie_id, _ in top if movie_id in documents]
+        
+        return app.response_class(
+            '{"genre": %s, "decade": %s, "movies": [%s]' % (
+                json.dumps(genre), json.dumps(decade), ', '.join(entries)
+            ) + '}',
+            mimetype='application/json'
+        )
+    
+    except ValueError:
+        return jsonify({'error': 'decade and n must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Get catalog changes after a sequence number (?since=<seq>&limit=), oldest first"""
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(max(int(request.args.get('limit', 500)), 1), 5000)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    
+    try:
+        return jsonify(get_catalog_changes(since, limit))
+    
+    except ChangeFeedExpired as e:
+        return jsonify({'error': str(e), 'purged_through': e.purged_through, 'head_seq': e.head_seq}), 410
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/changes/head', methods=['GET'])
+def get_changes_head():
+    """Get the current change feed position (where to start after a full resync)"""
+    try:
+        return jsonify(get_catalog_changes_head())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/genres', methods=['GET'])
+@cached_response()
 def get_genres():
     """Get all available genres"""
     try:
-        genres_result = execute_query(
-            "SELECT DISTINCT genre FROM movie_genres ORDER BY genre",
-            fetch=True
-        )
-        genres = [g['genre'] for g in genres_result]
+        genres = catalog_cache.get_or_set('genres', lambda: [
+            g['genre'] for g in execute_query(
+                "SELECT DISTINCT genre FROM movie_genres ORDER BY genre",
+                fetch=True
+            )
+        ])
         return jsonify({'genres': genres})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/years', methods=['GET'])
+@cached_response()
 def get_years():
     """Get all available years"""
     try:
-        years_result = execute_query(
-            "SELECT DISTINCT year FROM movies ORDER BY year DESC",
-            fetch=True
-        )
-        years = [y['year'] for y in years_result]
+        years = catalog_cache.get_or_set('years', lambda: [
+            y['year'] for y in execute_query(
+                "SELECT DISTINCT year FROM movies ORDER BY year DESC",
+                fetch=True
+            )
+        ])
         return jsonify({'years': years})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/stats', methods=['GET'])
+@cached_response()
 def get_stats():
     """Get database statistics"""
     try:
-        # Get counts
-        movies_count = execute_query("SELECT COUNT(*) as count FROM movies", fetch=True)[0]['count']
-        genres_count = execute_query("SELECT COUNT(*) as count FROM movie_genres", fetch=True)[0]['count']
-        cast_count = execute_query("SELECT COUNT(*) as count FROM movie_cast", fetch=True)[0]['count']
-        
-        # Get year range
-        year_range = execute_query(
-            "SELECT MIN(year) as min_year, MAX(year) as max_year FROM movies",
-            fetch=True
-        )[0]
+        # Single-row read of the trigger-maintained summary
+        stats = get_catalog_stats()
         
         return jsonify({
-            'movies_total': movies_count,
-            'genres_total': genres_count,
-            'cast_total': cast_count,
+            'movies_total': stats['movies_total'],
+            'genres_total': stats['genres_total'],
+            'cast_total': stats['cast_total'],
             'year_range': {
-                'min': year_range['min_year'],
-                'max': year_range['max_year']
+                'min': stats['min_year'],
+                'max': stats['max_year']
             }
         })
     
@@ -274,6 +463,7 @@ def get_stats():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/search', methods=['GET'])
+@cached_response()
 def search_movies():
     """Search movies by title, director, or plot"""
     try:
@@ -281,6 +471,25 @@ def search_movies():
         if not query:
             return jsonify({'error': 'Search query is required'}), 400
         
+        mode = request.args.get('mode', 'text')
+        if mode not in ('text', 'semantic'):
+            return jsonify({'error': "mode must be 'text' or 'semantic'"}), 400
+        
+        if mode == 'semantic':
+            # Ranked by what the title and plot are about, not by substring matches
+            matches = get_semantic_index().search(query, 50)
+            documents = get_movie_documents_by_id([movie_id for movie_id, _ in matches])
+            entries = [
+                '{"score": %.4f, "movie": %s}' % (score, documents[movie_id])
+                for movie_id, score in matches if movie_id in documents
+            ]
+            
+            return app.response_class(
+                '{"movies": [' + ', '.join(entries) + '], "query": ' + json.dumps(query)
+                + ', "mode": "semantic", "count": ' + str(len(entries)) + '}',
+                mimetype='application/json'
+            )
+        
         search_param = f"%{query}%"
         movies = execute_query("""
             SELECT DISTINCT m.id, m.title, m.year, m.runtime, m.rating, 
@@ -416,6 +625,8 @@ def signup():
         result = create_user(email, password)
         return jsonify(result), 201
         
+    except PasswordHashingBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except (AuthError, RateLimitError) as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
@@ -496,11 +707,11 @@ def get_user_usage():
             ORDER BY date DESC
         """, (user_id,), fetch=True)
         
-        # Get total usage
+        # Get total usage (daily rollup, not the raw request log)
         total_usage = execute_query("""
-            SELECT COUNT(*) as total_requests
-            FROM usage_logs ul
-            JOIN api_keys ak ON ul.api_key_id = ak.id
+            SELECT COALESCE(SUM(du.request_count), 0) as total_requests
+            FROM daily_usage du
+            JOIN api_keys ak ON du.api_key_id = ak.id
             WHERE ak.user_id = %s
         """, (user_id,), fetch=True)
         
@@ -552,10 +763,19 @@ if __name__ == '__main__':
     print("  GET /                     - Frontend interface")
     print("  GET /api/movies          - List movies (with pagination & filters)")
     print("  GET /api/movies/{id}     - Get specific movie")
+    print("  GET /api/movies/batch?ids=1,2 - Get several movies")
+    print("  GET /api/movies/popular  - Most viewed movies (recent views weigh more)")
+    print("  GET /api/movies/{id}/similar - Similar movies")
+    print("  GET /api/actors/{name}/movies - Actor filmography")
+    print("  GET /api/directors/{name}/movies - Director filmography")
+    print("  GET /api/top             - Top rated by genre/decade")
+    print("  GET /api/changes         - Catalog change feed")
+    print("  GET /api/changes/head    - Change feed position")
     print("  GET /api/genres          - List all genres")
     print("  GET /api/years           - List all years")
     print("  GET /api/stats           - Database statistics")
     print("  GET /api/search?q=term   - Search movies")
+    print("  GET /api/search?q=term&mode=semantic - Search plots by meaning")
     
     # Start the server on all interfaces for Replit
     app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-request API key gate against the configured database
+Compares the old validate -> plan -> usage chain with the current gate,
+key validation (cold key cache and warm) plus a shared rate limiter check,
+each followed by the usage log write the gate also does. Then times
+building the response quota meta from a usage query versus from the
+limiter decision.
+
+Usage: python bench_auth_gate.py <api_key> [iterations]
+"""
+
+import sys
+import time
+sys.path.append('.')
+sys.path.append('./src')
+
+from src.auth import (
+    _end_of_day, _key_cache, _load_api_key, get_user_daily_usage,
+    get_user_subscription, get_user_usage_stats, log_api_usage, quota_usage,
+    rate_limit_headers, validate_api_key
+)
+from src.rate_limiter import get_rate_limiter
+
+def old_gate(api_key):
+    """The chain require_api_key used to run: key join, subscription, usage, log"""
+    user_info = _load_api_key(api_key)
+    get_user_subscription(user_info['user_id'])
+    get_user_daily_usage(user_info['user_id'])
+    return user_info
+
+def limiter_gate(api_key):
+    """Cached key plus a check-and-consume in the shared limiter (no quota, so it never denies)"""
+    user_info = validate_api_key(api_key)
+    get_rate_limiter().fixed_window(f"bench:{user_info['user_id']}", 10 ** 9, _end_of_day())
+    return user_info
+
+def cold_gate(api_key):
+    _key_cache.clear()
+    return limiter_gate(api_key)
+
+def bench(label, gate, api_key, iterations):
+    # Each iteration logs one request, as the real gate does
+    start = time.perf_counter()
+    for _ in range(iterations):
+        user_info = gate(api_key)
+        log_api_usage(user_info['api_key_id'], 'bench_auth_gate', 200, user_info['user_id'])
+    seconds = time.perf_counter() - start
+
+    check_start = time.perf_counter()
+    for _ in range(iterations):
+        gate(api_key)
+    check_seconds = time.perf_counter() - check_start
+
+    print(f"  {label:<32} {check_seconds / iterations * 1e3:8.2f} ms check   "
+          f"{seconds / iterations * 1e3:8.2f} ms check + log")
+    return check_seconds
+
+def bench_meta(user_id, iterations):
+    """Per-request cost of the quota meta: usage stats queries vs. the limiter decision"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        get_user_usage_stats(user_id)
+    queried = (time.perf_counter() - start) / iterations
+
+    decision = get_rate_limiter().fixed_window(f"bench:{user_id}", 10 ** 9, _end_of_day())
+    start = time.perf_counter()
+    for _ in range(iterations):
+        rate_limit_headers(decision)
+        quota_usage(decision)
+    derived = (time.perf_counter() - start) / iterations
+
+    print(f"  {'meta from get_user_usage_stats':<32} {queried * 1e3:8.3f} ms")
+    print(f"  {'meta from limiter decision':<32} {derived * 1e3:8.3f} ms")
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python bench_auth_gate.py <api_key> [iterations]")
+        sys.exit(1)
+    api_key = sys.argv[1]
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    if validate_api_key(api_key) is None:
+        print("❌ API key is not valid for src.auth (sha256-hashed keys)")
+        sys.exit(1)
+
+    print(f"📊 API key gate benchmark: {iterations} iterations (requests are logged as 'bench_auth_gate')")
+    print("-" * 78)
+    old = bench("validate + plan + usage (old)", old_gate, api_key, iterations)
+    cold = bench("validate + limiter (cold cache)", cold_gate, api_key, iterations)
+    warm = bench("validate + limiter (warm cache)", limiter_gate, api_key, iterations)
+    print("-" * 78)
+    print(f"  Check speedup: cold {old / cold:5.1f}x, warm {old / warm:5.1f}x")
+    print("-" * 78)
+    bench_meta(validate_api_key(api_key)['user_id'], iterations)
+
+if __name__ == "__main__":
+    main()
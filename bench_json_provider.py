@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON serialization of a 100-movie page
+Compares Flask's default provider with FastJSONProvider, and the old
+decode/re-encode meta injection with add_json_fields
+"""
+
+import sys
+import timeit
+from datetime import datetime, timedelta
+from decimal import Decimal
+sys.path.append('.')
+sys.path.append('./src')
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from src.json_provider import FastJSONProvider, add_json_fields, orjson
+
+ITERATIONS = 500
+
+def build_page(count=100):
+    """Build a /api/movies page shaped like the RealDictRow-derived dicts the API returns"""
+    created = datetime(2024, 1, 1, 12, 0, 0)
+    movies = []
+    for i in range(count):
+        movies.append({
+            'id': i + 1,
+            'title': f'Movie Title {i}',
+            'year': 1950 + i % 70,
+            'runtime': 90 + i % 60,
+            'rating': Decimal(f'{5 + (i % 50) / 10:.1f}'),
+            'director': f'Director {i % 40}',
+            'plot': 'A long plot summary describing the story of the movie in some detail. ' * 4,
+            'poster_url': f'https://images.example.com/posters/{i}.jpg',
+            'created_at': created + timedelta(days=i),
+            'genres': ['Drama', 'Crime', 'Thriller'][: 1 + i % 3],
+            'cast': [f'Actor {i}', f'Actor {i + 1}', f'Actor {i + 2}', f'Actor {i + 3}']
+        })
+    return {
+        'movies': movies,
+        'pagination': {'page': 1, 'limit': count, 'total': 5000, 'pages': 50},
+        'user': 'someone@gmail.com'
+    }
+
+META = {
+    'user_email': 'someone@gmail.com',
+    'plan': 'free',
+    'usage': {'used': 42, 'limit': 100, 'remaining': 58}
+}
+
+def bench(label, func):
+    seconds = timeit.timeit(func, number=ITERATIONS)
+    print(f"  {label:<45} {seconds / ITERATIONS * 1e6:10.1f} µs/op")
+    return seconds
+
+def main():
+    page = build_page()
+
+    default_app = Flask('default')
+    default_app.json = DefaultJSONProvider(default_app)
+    fast_app = Flask('fast')
+    fast_app.json = FastJSONProvider(fast_app)
+
+    print(f"📊 JSON provider benchmark: 100-movie page, {ITERATIONS} iterations")
+    print(f"   orjson: {'available' if orjson else 'not installed (stdlib fallback)'}")
+    print("-" * 70)
+
+    with default_app.app_context():
+        default_response = default_app.json.response(page)
+        old = bench("jsonify (Flask default provider)", lambda: default_app.json.response(page))
+
+        def decode_reencode():
+            response = default_app.json.response(page)
+            data = response.get_json()
+            data['meta'] = META
+            return default_app.json.response(data)
+        old_meta = bench("jsonify + get_json() + re-jsonify with meta", decode_reencode)
+
+    with fast_app.app_context():
+        fast_response = fast_app.json.response(page)
+        new = bench("jsonify (FastJSONProvider)", lambda: fast_app.json.response(page))
+
+        def splice():
+            response = fast_app.json.response(page)
+            add_json_fields(response, meta=META)
+            return response
+        new_meta = bench("jsonify + add_json_fields(meta)", splice)
+
+    print("-" * 70)
+    print(f"  Serialization speedup:       {old / new:5.1f}x")
+    print(f"  Serialization + meta speedup: {old_meta / new_meta:5.1f}x")
+    print(f"  Body size: default {len(default_response.get_data())} bytes, "
+          f"fast {len(fast_response.get_data())} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Build the memory-mapped snapshot files
+Run on deploy or after bulk imports so API workers map ready-made files at
+startup instead of each rebuilding from Postgres.
+
+Usage: python build_snapshots.py [catalog] [similarity]
+"""
+
+import os
+import sys
+import time
+sys.path.append('.')
+sys.path.append('./src')
+
+from src.catalog import get_catalog_revision
+from src.catalog_snapshot import load_snapshot
+from src.similarity import SimilarityIndex
+from src.snapshot_file import snapshot_path
+
+STRUCTURES = ('catalog', 'similarity')
+
+def build(name: str, revision: int) -> None:
+    start = time.time()
+    if name == 'catalog':
+        load_snapshot(version=0).save(revision)
+    else:
+        index = SimilarityIndex()
+        index.build()
+        index.save(revision)
+
+    path = snapshot_path(name)
+    print(f"✅ {name}: {path} ({os.path.getsize(path) / 1e6:.1f} MB, {time.time() - start:.1f}s)")
+
+def main():
+    names = sys.argv[1:] or list(STRUCTURES)
+    unknown = [name for name in names if name not in STRUCTURES]
+    if unknown:
+        print(f"Usage: python build_snapshots.py [{'] ['.join(STRUCTURES)}]")
+        sys.exit(1)
+
+    # Read before loading, so the label can only understate what the files contain
+    revision = get_catalog_revision()
+    print(f"📦 Building snapshot files at catalog revision {revision}")
+    for name in names:
+        build(name, revision)
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ import os
 sys.path.append('src')
 
 from src.database import execute_query
+from src.catalog import get_catalog_stats
 from src.validator import MovieCSVValidator
 from src.importer import MovieCSVImporter
 from src.test_phase1 import test_phase1_criteria
@@ -19,9 +20,10 @@ def show_movie_stats():
     print("-" * 40)
     
     # Get counts
-    movies_count = execute_query("SELECT COUNT(*) as count FROM movies", fetch=True)[0]['count']
-    genres_count = execute_query("SELECT COUNT(*) as count FROM movie_genres", fetch=True)[0]['count']
-    cast_count = execute_query("SELECT COUNT(*) as count FROM movie_cast", fetch=True)[0]['count']
+    stats = get_catalog_stats()
+    movies_count = stats['movies_total']
+    genres_count = stats['genres_total']
+    cast_count = stats['cast_total']
     
     print(f"Movies: {movies_count}")
     print(f"Genres: {genres_count}")
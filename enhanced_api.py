@@ -5,6 +5,7 @@ Enhanced Movie Database API with Authentication and Usage Tracking
 
 import sys
 import os
+import json
 from functools import wraps
 sys.path.append('.')
 sys.path.append('./src')
@@ -12,21 +13,48 @@ sys.path.append('./src')
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from src.database import execute_query
+from src.json_provider import FastJSONProvider, add_json_fields
+from src.compression import init_compression
+from src.catalog import ChangeFeedExpired, enable_document_cache, get_actor_movies, get_catalog_changes, get_catalog_changes_head, get_catalog_stats, get_director_movies, get_movie_document, get_movie_documents, get_movie_documents_by_id, genre_filter_sql, parse_genre_filter, parse_movie_ids, warm_movie_documents
+from src.catalog_events import CatalogCache, start_catalog_listener
+from src.key_cache import start_revocation_listener
+from src.catalog_snapshot import get_catalog_snapshot, start_catalog_snapshot
+from src.similarity import get_similarity_index, start_similarity_index
+from src.leaderboards import MAX_LEADERBOARD_SIZE, decade_of, get_leaderboards, start_leaderboards
+from src.popularity import get_popularity_tracker, start_popularity_tracking, track_movie_hits
+from src.semantic_search import get_semantic_index, start_semantic_index
 from src.auth_api import AuthManager
+from src.password_hashing import PasswordHashingBusy
 from src.auth import (
     check_user_rate_limit, check_and_increment_user_rate_limit, get_user_usage_stats, 
-    upgrade_user_to_premium, RateLimitError, validate_firebase_admin, init_firebase
+    upgrade_user_to_premium, RateLimitError, validate_firebase_admin, init_firebase,
+    rate_limit_headers, quota_usage
 )
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+init_compression(app)
 
 # Configure CORS for Replit environment
-CORS(app, origins="*")
+CORS(app, origins="*", expose_headers=["RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After"])
 
 # Configure Flask for development
 app.config['DEBUG'] = True
 app.config['SERVER_NAME'] = None
 
+# Listen for catalog writes (importer, admin endpoints) so cached catalog data
+# is dropped as soon as it changes
+start_catalog_listener()
+start_revocation_listener()
+catalog_cache = CatalogCache(ttl=24 * 3600)
+enable_document_cache(CatalogCache(ttl=24 * 3600, max_entries=5000))
+start_catalog_snapshot()
+start_similarity_index()
+start_leaderboards()
+start_semantic_index()
+get_popularity_tracker().add_warmer(warm_movie_documents)
+start_popularity_tracking()
+
 def require_firebase_admin(f):
     """Decorator to require Firebase admin authentication for admin endpoints"""
     @wraps(f)
@@ -62,6 +90,14 @@ def require_firebase_admin(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Admin views flatten genres/cast from the precomputed movie document instead
+# of joining movie_genres and movie_cast and re-aggregating per request
+ADMIN_DOCUMENT_COLUMNS = """
+    (SELECT STRING_AGG(g, ', ') FROM jsonb_array_elements_text(d.document->'genres') g) as genres,
+    (SELECT STRING_AGG(CONCAT(c->>'name', ' as ', c->>'role'), '; ')
+     FROM jsonb_array_elements(d.document->'cast') c) as cast
+"""
+
 # Admin endpoints (protected by Firebase authentication)
 @app.route('/admin/movies', methods=['GET'])
 @require_firebase_admin
@@ -77,14 +113,10 @@ def admin_list_movies():
         total = count_result[0]['total'] if count_result else 0
         
         # Get movies with pagination
-        movies = execute_query("""
-            SELECT m.*, 
-                   STRING_AGG(DISTINCT mg.genre, ', ') as genres,
-                   STRING_AGG(DISTINCT CONCAT(c.actor_name, ' as ', c.role), '; ') as cast
+        movies = execute_query(f"""
+            SELECT m.*, {ADMIN_DOCUMENT_COLUMNS}
             FROM movies m
-            LEFT JOIN movie_genres mg ON m.id = mg.movie_id  
-            LEFT JOIN movie_cast c ON m.id = c.movie_id
-            GROUP BY m.id
+            LEFT JOIN movie_documents d ON d.movie_id = m.id
             ORDER BY m.year DESC, m.title
             LIMIT %s OFFSET %s
         """, (limit, offset), fetch=True)
@@ -213,13 +245,17 @@ def require_api_key(f):
         
         # Atomically check rate limit and increment usage
         try:
-            check_and_increment_user_rate_limit(
+            decision = check_and_increment_user_rate_limit(
                 user_info['user_id'], 
                 user_info['api_key_id'], 
-                request.endpoint or 'unknown'
+                request.endpoint or 'unknown',
+                user_info
             )
         except RateLimitError as e:
-            return jsonify({'error': str(e)}), 429
+            response = jsonify({'error': str(e)})
+            if e.decision is not None:
+                response.headers.update(rate_limit_headers(e.decision))
+            return response, 429
         except Exception as e:
             # Fail-closed: Return 503 if rate limiting service fails
             print(f"Rate limiting service error: {e}")
@@ -233,43 +269,18 @@ def require_api_key(f):
         request.user_info = user_info
         
         # Execute the endpoint function
-        result = f(*args, **kwargs)
+        response = app.make_response(f(*args, **kwargs))
         
-        # Get current usage stats
-        usage_stats = get_user_usage_stats(user_info['user_id'])
-        
-        # Handle different response types
-        if isinstance(result, tuple) and len(result) == 2:
-            response_data, status_code = result
-        else:
-            response_data = result
-            status_code = 200
-        
-        # Extract JSON data from Flask Response objects
-        response_json = None
-        if hasattr(response_data, 'get_json'):
-            # It's a Flask Response object
-            response_json = response_data.get_json()
-        elif isinstance(response_data, dict):
-            # It's already a dict
-            response_json = response_data.copy()
-        
-        # Add meta information if we have JSON data
-        if response_json is not None:
-            response_json['meta'] = {
-                'user_email': user_info['email'],
-                'plan': usage_stats.get('plan_type', 'free'),
-                'usage': {
-                    'used': usage_stats.get('daily_usage', 0),
-                    'limit': usage_stats.get('daily_limit', 100),
-                    'remaining': usage_stats.get('remaining_requests', 0)
-                }
-            }
-            # Return new jsonify response with enhanced data
-            return jsonify(response_json) if status_code == 200 else (jsonify(response_json), status_code)
+        # Quota state comes from the limiter decision above, not another usage query
+        response.headers.update(rate_limit_headers(decision))
         
-        # Return original response if we can't enhance it
-        return response_data if status_code == 200 else (response_data, status_code)
+        # Splice meta into JSON object bodies without decoding/re-encoding them
+        add_json_fields(response, meta={
+            'user_email': user_info['email'],
+            'plan': user_info['plan_type'],
+            'usage': quota_usage(decision)
+        })
+        return response
     return decorated_function
 
 def require_api_key_no_limits(f):
@@ -295,15 +306,11 @@ def admin_movie_detail(movie_id):
     """Admin endpoint for single movie CRUD operations"""
     if request.method == 'GET':
         try:
-            movie = execute_query("""
-                SELECT m.*, 
-                       STRING_AGG(DISTINCT mg.genre, ', ') as genres,
-                       STRING_AGG(DISTINCT CONCAT(c.actor_name, ' as ', c.role), '; ') as cast
+            movie = execute_query(f"""
+                SELECT m.*, {ADMIN_DOCUMENT_COLUMNS}
                 FROM movies m
-                LEFT JOIN movie_genres mg ON m.id = mg.movie_id  
-                LEFT JOIN movie_cast c ON m.id = c.movie_id
+                LEFT JOIN movie_documents d ON d.movie_id = m.id
                 WHERE m.id = %s
-                GROUP BY m.id
             """, (movie_id,), fetch=True)
             
             if not movie:
@@ -382,6 +389,8 @@ def register():
             'api_key': result['api_key']
         })
     
+    except PasswordHashingBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -406,6 +415,8 @@ def login():
             'api_keys': [key['api_key'] for key in api_keys if key['is_active']]
         })
     
+    except PasswordHashingBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -462,74 +473,81 @@ def get_movies():
     try:
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 20))
-        genre = request.args.get('genre')
+        try:
+            genres, match_all = parse_genre_filter(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         year = request.args.get('year')
         search = request.args.get('search')
         
         offset = (page - 1) * limit
         
-        query = """
-            SELECT DISTINCT m.id, m.title, m.year, m.runtime, m.rating, 
-                   m.director, m.plot, m.poster_url
-            FROM movies m
-        """
+        # Answer from the in-memory columnar snapshot when it is enabled and
+        # current; text search and anything else it can't answer go to SQL
+        snapshot = get_catalog_snapshot() if not search else None
+        result = snapshot.query(genres, match_all, int(year) if year else None, offset, limit) if snapshot else None
+        
+        if result is not None:
+            enriched_movies, total_movies = result
+        else:
+            query = """
+                SELECT m.id, m.title, m.year, m.runtime, m.rating, 
+                       m.director, m.plot, m.poster_url
+                FROM movies m
+            """
         
-        conditions = []
-        params = []
+            conditions = []
+            params = []
         
-        if genre:
-            query += " LEFT JOIN movie_genres mg ON m.id = mg.movie_id"
-            conditions.append("mg.genre = %s")
-            params.append(genre)
+            if genres:
+                genre_clause, genre_params = genre_filter_sql(genres, match_all)
+                conditions.append(genre_clause)
+                params.extend(genre_params)
         
-        if search:
-            conditions.append("(m.title ILIKE %s OR m.director ILIKE %s OR m.plot ILIKE %s)")
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param])
+            if search:
+                conditions.append("(m.title ILIKE %s OR m.director ILIKE %s OR m.plot ILIKE %s)")
+                search_param = f"%{search}%"
+                params.extend([search_param, search_param, search_param])
         
-        if year:
-            conditions.append("m.year = %s")
-            params.append(int(year))
+            if year:
+                conditions.append("m.year = %s")
+                params.append(int(year))
         
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
         
-        query += " ORDER BY m.year DESC, m.title LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
+            query += " ORDER BY m.year DESC, m.title LIMIT %s OFFSET %s"
+            params.extend([limit, offset])
         
-        movies = execute_query(query, tuple(params), fetch=True)
+            movies = execute_query(query, tuple(params), fetch=True)
         
-        # Enrich with genres and cast
-        enriched_movies = []
-        for movie in movies:
-            movie_dict = dict(movie)
+            # Enrich with genres and cast
+            enriched_movies = []
+            for movie in movies:
+                movie_dict = dict(movie)
             
-            genres_result = execute_query(
-                "SELECT genre FROM movie_genres WHERE movie_id = %s ORDER BY genre",
-                (movie['id'],), fetch=True
-            )
-            movie_dict['genres'] = [g['genre'] for g in genres_result]
+                genres_result = execute_query(
+                    "SELECT genre FROM movie_genres WHERE movie_id = %s ORDER BY genre",
+                    (movie['id'],), fetch=True
+                )
+                movie_dict['genres'] = [g['genre'] for g in genres_result]
             
-            cast_result = execute_query(
-                "SELECT actor_name FROM movie_cast WHERE movie_id = %s ORDER BY actor_name",
-                (movie['id'],), fetch=True
-            )
-            movie_dict['cast'] = [c['actor_name'] for c in cast_result]
+                cast_result = execute_query(
+                    "SELECT actor_name FROM movie_cast WHERE movie_id = %s ORDER BY actor_name",
+                    (movie['id'],), fetch=True
+                )
+                movie_dict['cast'] = [c['actor_name'] for c in cast_result]
             
-            enriched_movies.append(movie_dict)
+                enriched_movies.append(movie_dict)
         
-        # Get total count
-        count_query = "SELECT COUNT(DISTINCT m.id) as total FROM movies m"
-        if genre:
-            count_query += " LEFT JOIN movie_genres mg ON m.id = mg.movie_id"
-        if conditions:
-            count_query += " WHERE " + " AND ".join(conditions[:-2] if year else conditions)
-            count_params = params[:-2] if conditions else []
-        else:
-            count_params = []
+            # Get total count
+            count_query = "SELECT COUNT(*) as total FROM movies m"
+            if conditions:
+                count_query += " WHERE " + " AND ".join(conditions)
+            count_params = params[:-2]
         
-        total_result = execute_query(count_query, tuple(count_params), fetch=True)
-        total_movies = total_result[0]['total']
+            total_result = execute_query(count_query, tuple(count_params), fetch=True)
+            total_movies = total_result[0]['total']
         
         return jsonify({
             'movies': enriched_movies,
@@ -547,36 +565,204 @@ def get_movies():
 
 @app.route('/api/movies/<int:movie_id>', methods=['GET'])
 @require_api_key
+@track_movie_hits(lambda movie_id: [movie_id])
 def get_movie(movie_id):
     """Get a specific movie by ID"""
     try:
-        movie_result = execute_query(
-            "SELECT * FROM movies WHERE id = %s",
-            (movie_id,), fetch=True
-        )
+        # Precomputed document (movie + genres + cast), sent through as-is
+        document = get_movie_document(movie_id)
         
-        if not movie_result:
+        if document is None:
             return jsonify({'error': 'Movie not found'}), 404
         
-        movie = dict(movie_result[0])
+        return app.response_class(
+            '{"movie": ' + document + ', "user": ' + json.dumps(request.user_info['email']) + '}',
+            mimetype='application/json'
+        )
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/movies/batch', methods=['GET'])
+@require_api_key
+@track_movie_hits(lambda: parse_movie_ids(request.args.get('ids', '')))
+def get_movies_batch():
+    """Get several movies by ID (?ids=1,2,3)"""
+    try:
+        try:
+            movie_ids = parse_movie_ids(request.args.get('ids', ''))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        documents, missing = get_movie_documents(movie_ids)
         
-        genres_result = execute_query(
-            "SELECT genre FROM movie_genres WHERE movie_id = %s ORDER BY genre",
-            (movie_id,), fetch=True
+        return app.response_class(
+            '{"movies": [' + ', '.join(documents) + '], "missing": ' + json.dumps(missing)
+            + ', "user": ' + json.dumps(request.user_info['email']) + '}',
+            mimetype='application/json'
         )
-        movie['genres'] = [g['genre'] for g in genres_result]
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/movies/popular', methods=['GET'])
+@require_api_key
+def get_popular_movies():
+    """Get the most viewed movies, weighted towards recent views (?n=)"""
+    try:
+        n = min(max(int(request.args.get('n', 10)), 1), 100)
+        
+        tracker = get_popularity_tracker()
+        popular = tracker.top(n)
+        documents = get_movie_documents_by_id([movie_id for movie_id, _ in popular])
+        entries = [
+            '{"score": %.2f, "movie": %s}' % (score, documents[movie_id])
+            for movie_id, score in popular if movie_id in documents
+        ]
+        as_of = tracker.ranked_at.isoformat() if tracker.ranked_at else None
+        
+        return app.response_class(
+            '{"movies": [' + ', '.join(entries) + '], "as_of": ' + json.dumps(as_of)
+            + ', "user": ' + json.dumps(request.user_info['email']) + '}',
+            mimetype='application/json'
+        )
+    
+    except ValueError:
+        return jsonify({'error': 'n must be an integer'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/movies/<int:movie_id>/similar', methods=['GET'])
+@require_api_key
+def get_similar_movies(movie_id):
+    """Get movies similar to a movie ("more like this")"""
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+        
+        similar = get_similarity_index().similar(movie_id, limit)
+        if similar is None:
+            return jsonify({'error': 'Movie not found'}), 404
+        
+        documents = get_movie_documents_by_id([similar_id for similar_id, _ in similar])
+        entries = [
+            '{"score": %.4f, "movie": %s}' % (score, documents[similar_id])
+            for similar_id, score in similar if similar_id in documents
+        ]
         
-        cast_result = execute_query(
-            "SELECT actor_name, role FROM movie_cast WHERE movie_id = %s ORDER BY actor_name",
-            (movie_id,), fetch=True
+        return app.response_class(
+            '{"movie_id": %d, "similar": [%s]' % (movie_id, ', '.join(entries)) + ', "user": ' + json.dumps(request.user_info['email']) + '}',
+            mimetype='application/json'
         )
-        movie['cast'] = [{'name': c['actor_name'], 'role': c['role']} for c in cast_result]
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/actors/<name>/movies', methods=['GET'])
+@require_api_key
+def get_actor_filmography(name):
+    """Get an actor's movies (?cursor= from the previous page, ?limit=)"""
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        
+        movies, next_cursor = get_actor_movies(name, after=cursor, limit=limit)
         
         return jsonify({
-            'movie': movie,
-            'user': request.user_info['email']
+            'actor': name,
+            'movies': movies,
+            'user': request.user_info['email'],
+            'pagination': {
+                'limit': limit,
+                'next_cursor': next_cursor
+            }
+        })
+    
+    except ValueError:
+        return jsonify({'error': 'cursor and limit must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/directors/<name>/movies', methods=['GET'])
+@require_api_key
+def get_director_filmography(name):
+    """Get a director's movies (?cursor= from the previous page, ?limit=)"""
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        
+        movies, next_cursor = get_director_movies(name, after=cursor, limit=limit)
+        
+        return jsonify({
+            'director': name,
+            'movies': movies,
+            'user': request.user_info['email'],
+            'pagination': {
+                'limit': limit,
+                'next_cursor': next_cursor
+            }
         })
     
+    except ValueError:
+        return jsonify({'error': 'cursor and limit must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/top', methods=['GET'])
+@require_api_key
+def get_top_movies():
+    """Get the top rated movies, optionally for a genre and/or decade (?genre=&decade=&n=)"""
+    try:
+        genre = request.args.get('genre') or None
+        decade = request.args.get('decade')
+        n = min(max(int(request.args.get('n', 10)), 1), MAX_LEADERBOARD_SIZE)
+        
+        if decade:
+            decade = decade_of(int(decade.rstrip('sS')))
+        else:
+            decade = None
+        
+        top = get_leaderboards().top(genre, decade, n)
+        documents = get_movie_documents_by_id([movie_id for movie_id, _ in top])
+        entries = [documents[movie_id] for movie_id, _ in top if movie_id in documents]
+        
+        return app.response_class(
+            '{"genre": %s, "decade": %s, "movies": [%s]' % (
+                json.dumps(genre), json.dumps(decade), ', '.join(entries)
+            ) + ', "user": ' + json.dumps(request.user_info['email']) + '}',
+            mimetype='application/json'
+        )
+    
+    except ValueError:
+        return jsonify({'error': 'decade and n must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/changes', methods=['GET'])
+@require_api_key
+def get_changes():
+    """Get catalog changes after a sequence number (?since=<seq>&limit=), oldest first"""
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(max(int(request.args.get('limit', 500)), 1), 5000)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    
+    try:
+        feed = get_catalog_changes(since, limit)
+        feed['user'] = request.user_info['email']
+        return jsonify(feed)
+    
+    except ChangeFeedExpired as e:
+        return jsonify({'error': str(e), 'purged_through': e.purged_through, 'head_seq': e.head_seq}), 410
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/changes/head', methods=['GET'])
+@require_api_key
+def get_changes_head():
+    """Get the current change feed position (where to start after a full resync)"""
+    try:
+        return jsonify(get_catalog_changes_head())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -585,11 +771,12 @@ def get_movie(movie_id):
 def get_genres():
     """Get all available genres"""
     try:
-        genres_result = execute_query(
-            "SELECT DISTINCT genre FROM movie_genres ORDER BY genre",
-            fetch=True
-        )
-        genres = [g['genre'] for g in genres_result]
+        genres = catalog_cache.get_or_set('genres', lambda: [
+            g['genre'] for g in execute_query(
+                "SELECT DISTINCT genre FROM movie_genres ORDER BY genre",
+                fetch=True
+            )
+        ])
         return jsonify({
             'genres': genres,
             'user': request.user_info['email']
@@ -603,11 +790,12 @@ def get_genres():
 def get_years():
     """Get all available years"""
     try:
-        years_result = execute_query(
-            "SELECT DISTINCT year FROM movies ORDER BY year DESC",
-            fetch=True
-        )
-        years = [y['year'] for y in years_result]
+        years = catalog_cache.get_or_set('years', lambda: [
+            y['year'] for y in execute_query(
+                "SELECT DISTINCT year FROM movies ORDER BY year DESC",
+                fetch=True
+            )
+        ])
         return jsonify({
             'years': years,
             'user': request.user_info['email']
@@ -621,22 +809,16 @@ def get_years():
 def get_stats():
     """Get database statistics"""
     try:
-        movies_count = execute_query("SELECT COUNT(*) as count FROM movies", fetch=True)[0]['count']
-        genres_count = execute_query("SELECT COUNT(*) as count FROM movie_genres", fetch=True)[0]['count']
-        cast_count = execute_query("SELECT COUNT(*) as count FROM movie_cast", fetch=True)[0]['count']
-        
-        year_range = execute_query(
-            "SELECT MIN(year) as min_year, MAX(year) as max_year FROM movies",
-            fetch=True
-        )[0]
+        # Single-row read of the trigger-maintained summary
+        stats = get_catalog_stats()
         
         return jsonify({
-            'movies_total': movies_count,
-            'genres_total': genres_count,
-            'cast_total': cast_count,
+            'movies_total': stats['movies_total'],
+            'genres_total': stats['genres_total'],
+            'cast_total': stats['cast_total'],
             'year_range': {
-                'min': year_range['min_year'],
-                'max': year_range['max_year']
+                'min': stats['min_year'],
+                'max': stats['max_year']
             },
             'user': request.user_info['email']
         })
@@ -653,6 +835,26 @@ def search_movies():
         if not query_param:
             return jsonify({'error': 'Search query is required'}), 400
         
+        mode = request.args.get('mode', 'text')
+        if mode not in ('text', 'semantic'):
+            return jsonify({'error': "mode must be 'text' or 'semantic'"}), 400
+        
+        if mode == 'semantic':
+            # Ranked by what the title and plot are about, not by substring matches
+            matches = get_semantic_index().search(query_param, 50)
+            documents = get_movie_documents_by_id([movie_id for movie_id, _ in matches])
+            entries = [
+                '{"score": %.4f, "movie": %s}' % (score, documents[movie_id])
+                for movie_id, score in matches if movie_id in documents
+            ]
+            
+            return app.response_class(
+                '{"movies": [' + ', '.join(entries) + '], "query": ' + json.dumps(query_param)
+                + ', "mode": "semantic", "count": ' + str(len(entries))
+                + ', "user": ' + json.dumps(request.user_info['email']) + '}',
+                mimetype='application/json'
+            )
+        
         search_param = f"%{query_param}%"
         movies = execute_query("""
             SELECT DISTINCT m.id, m.title, m.year, m.runtime, m.rating, 
@@ -730,9 +932,18 @@ if __name__ == '__main__':
     print("  DEL  /auth/account/{id}   - Delete account")
     print("  GET  /api/movies          - List movies (API KEY REQUIRED)")
     print("  GET  /api/movies/{id}     - Get specific movie (API KEY REQUIRED)")
+    print("  GET  /api/movies/batch?ids=1,2 - Get several movies (API KEY REQUIRED)")
+    print("  GET  /api/movies/popular  - Most viewed movies (API KEY REQUIRED)")
+    print("  GET  /api/movies/{id}/similar - Similar movies (API KEY REQUIRED)")
+    print("  GET  /api/actors/{name}/movies - Actor filmography (API KEY REQUIRED)")
+    print("  GET  /api/directors/{name}/movies - Director filmography (API KEY REQUIRED)")
+    print("  GET  /api/top             - Top rated by genre/decade (API KEY REQUIRED)")
+    print("  GET  /api/changes         - Catalog change feed (API KEY REQUIRED)")
+    print("  GET  /api/changes/head    - Change feed position (API KEY REQUIRED)")
     print("  GET  /api/genres          - List all genres (API KEY REQUIRED)")
     print("  GET  /api/years           - List all years (API KEY REQUIRED)")
     print("  GET  /api/stats           - Database statistics (API KEY REQUIRED)")
     print("  GET  /api/search?q=term   - Search movies (API KEY REQUIRED)")
+    print("  GET  /api/search?q=term&mode=semantic - Search plots by meaning (API KEY REQUIRED)")
     
     app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Export the Postgres catalog for the phase2-api D1 database
+Streams the catalog through server-side cursors into either a SQLite database
+or chunked SQL batch files for `wrangler d1 execute --file`. Exports record
+the change feed position they reflect (sync_state.catalog_seq), so later runs
+can emit only the changes since then.
+
+Usage:
+    python export_d1.py sqlite <movies.db>                 full export, or the delta since the file's last sync
+    python export_d1.py sql <out_dir> [--since SEQ]        full export, or a delta since SEQ
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, List, Optional, Set, Tuple
+sys.path.append('.')
+sys.path.append('./src')
+
+from src.database import open_connection
+from src.catalog import ChangeFeedExpired, normalize_person_name
+
+# D1 rejects statements longer than 100 KB
+MAX_STATEMENT_BYTES = 100_000
+DEFAULT_CHUNK_MB = 10
+FETCH_SIZE = 5000
+
+SCHEMA_SQL = [
+    "DROP TABLE IF EXISTS movie_documents",
+    "DROP TABLE IF EXISTS movie_cast",
+    "DROP TABLE IF EXISTS movie_genres",
+    "DROP TABLE IF EXISTS movies",
+    "DROP TABLE IF EXISTS genre_bits",
+    "DROP TABLE IF EXISTS sync_state",
+    """CREATE TABLE genre_bits (
+        genre TEXT PRIMARY KEY,
+        bit INTEGER NOT NULL UNIQUE
+    )""",
+    """CREATE TABLE movies (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        runtime INTEGER NOT NULL,
+        rating REAL,
+        poster_url TEXT,
+        director TEXT,
+        plot TEXT,
+        created_at TEXT,
+        director_key TEXT,
+        genre_mask INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE movie_genres (
+        id INTEGER PRIMARY KEY,
+        movie_id INTEGER NOT NULL REFERENCES movies(id) ON DELETE CASCADE,
+        genre TEXT NOT NULL,
+        UNIQUE(movie_id, genre)
+    )""",
+    """CREATE TABLE movie_cast (
+        id INTEGER PRIMARY KEY,
+        movie_id INTEGER NOT NULL REFERENCES movies(id) ON DELETE CASCADE,
+        actor_name TEXT NOT NULL,
+        role TEXT,
+        actor_key TEXT
+    )""",
+    """CREATE TABLE movie_documents (
+        movie_id INTEGER PRIMARY KEY,
+        document TEXT NOT NULL
+    )""",
+    """CREATE TABLE sync_state (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )"""
+]
+
+# Created after the bulk load; mirror the lookups the API serves
+INDEX_SQL = [
+    "CREATE INDEX idx_movies_year_title ON movies(year DESC, title)",
+    "CREATE INDEX idx_movies_director_key ON movies(director_key, id)",
+    "CREATE INDEX idx_movies_rating ON movies(rating DESC)",
+    "CREATE INDEX idx_movie_genres_movie_id ON movie_genres(movie_id)",
+    "CREATE INDEX idx_movie_genres_genre ON movie_genres(genre, movie_id)",
+    "CREATE INDEX idx_movie_cast_movie_id ON movie_cast(movie_id)",
+    "CREATE INDEX idx_movie_cast_actor_key ON movie_cast(actor_key, movie_id)"
+]
+
+# (table, columns, Postgres query producing those columns in order)
+EXPORT_TABLES = [
+    ('genre_bits', ['genre', 'bit'], "SELECT genre, bit FROM genre_bits ORDER BY bit"),
+    ('movies',
+     ['id', 'title', 'year', 'runtime', 'rating', 'poster_url', 'director', 'plot',
+      'created_at', 'director_key', 'genre_mask'],
+     """SELECT id, title, year, runtime, rating, poster_url, director, plot,
+               created_at, director_key, genre_mask
+        FROM movies ORDER BY id"""),
+    ('movie_genres', ['id', 'movie_id', 'genre'],
+     "SELECT id, movie_id, genre FROM movie_genres ORDER BY id"),
+    ('movie_cast', ['id', 'movie_id', 'actor_name', 'role', 'actor_key'],
+     "SELECT id, movie_id, actor_name, role, actor_key FROM movie_cast ORDER BY id"),
+    ('movie_documents', ['movie_id', 'document'],
+     "SELECT movie_id, document::text FROM movie_documents ORDER BY movie_id")
+]
+
+# Columns a change feed row image is applied to, per table
+CHANGE_COLUMNS = {
+    'movies': ['id', 'title', 'year', 'runtime', 'rating', 'poster_url', 'director', 'plot',
+               'created_at', 'director_key'],
+    'movie_genres': ['id', 'movie_id', 'genre'],
+    'movie_cast': ['id', 'movie_id', 'actor_name', 'role', 'actor_key']
+}
+
+def sql_literal(value: Any) -> str:
+    """Render a value as a SQLite literal"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    return "'" + str(value).replace("'", "''") + "'"
+
+class StatementTooLarge(ValueError):
+    """A single row can't be written in a statement under the D1 limit"""
+    pass
+
+def _check_row_size(table: str, row: Tuple, size: int) -> None:
+    if size > MAX_STATEMENT_BYTES:
+        raise StatementTooLarge(
+            f"{table} row {row[0]} needs a {size}-byte statement; D1 allows {MAX_STATEMENT_BYTES} bytes"
+        )
+
+def insert_statements(table: str, columns: List[str], rows: Iterable[Tuple]) -> Iterator[str]:
+    """Batch rows into multi-row INSERTs that stay under the D1 statement limit (in UTF-8 bytes)"""
+    head = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    head_size = len(head.encode('utf-8'))
+    values: List[str] = []
+    size = head_size
+    for row in rows:
+        tuple_sql = '(' + ', '.join(sql_literal(value) for value in row) + ')'
+        tuple_size = len(tuple_sql.encode('utf-8'))
+        _check_row_size(table, row, head_size + tuple_size)
+        if values and size + tuple_size + 2 > MAX_STATEMENT_BYTES:
+            yield head + ', '.join(values)
+            values, size = [], head_size
+        values.append(tuple_sql)
+        size += tuple_size + 2
+    if values:
+        yield head + ', '.join(values)
+
+def upsert_statement(table: str, columns: List[str], row: Tuple, key: str = 'id') -> str:
+    updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != key)
+    statement = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+                 f"({', '.join(sql_literal(value) for value in row)}) "
+                 f"ON CONFLICT({key}) DO UPDATE SET {updates}")
+    _check_row_size(table, row, len(statement.encode('utf-8')))
+    return statement
+
+def sync_state_statement(seq: int) -> str:
+    return ("INSERT INTO sync_state (key, value) VALUES ('catalog_seq', %d) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value" % seq)
+
+def stream(conn, query: str, params=None, name: str = 'export') -> Iterator[Tuple]:
+    """Iterate a query through a server-side cursor so the result never sits in memory"""
+    with conn.cursor(name=name) as cursor:
+        cursor.itersize = FETCH_SIZE
+        cursor.execute(query, params)
+        yield from cursor
+
+def id_chunks(ids: Iterable[int], size: int = 500) -> Iterator[List[int]]:
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+def current_seq(conn) -> int:
+    with conn.cursor() as cursor:
+        # After a purge that emptied the feed, the head is the purge watermark
+        cursor.execute("""
+            SELECT COALESCE((SELECT MAX(seq) FROM catalog_changes), changes_purged_through)
+            FROM catalog_stats WHERE id = 1
+        """)
+        return cursor.fetchone()[0]
+
+def full_statements(conn, seq: int) -> Iterator[str]:
+    """Schema, data, indexes and sync position for a complete export"""
+    yield from SCHEMA_SQL
+    for table, columns, query in EXPORT_TABLES:
+        yield from insert_statements(table, columns, stream(conn, query, name=f'export_{table}'))
+    yield from INDEX_SQL
+    yield sync_state_statement(seq)
+
+def delta_statements(conn, since: int, seq: int) -> Iterator[str]:
+    """Statements replaying the change feed from since (exclusive) to seq (inclusive)"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT changes_purged_through FROM catalog_stats WHERE id = 1")
+        purged_through = cursor.fetchone()[0]
+    if since < purged_through:
+        raise ChangeFeedExpired(f"Changes up to seq {purged_through} have been purged; run a full export",
+                                purged_through, seq)
+
+    touched: Set[int] = set()
+    genres_touched: Set[int] = set()
+    changes = stream(conn, """
+        SELECT table_name, op, row_id, movie_id, row_data
+        FROM catalog_changes
+        WHERE seq > %s AND seq <= %s
+        ORDER BY seq
+    """, (since, seq), name='export_changes')
+
+    for table, op, row_id, movie_id, row_data in changes:
+        if movie_id is not None:
+            touched.add(movie_id)
+        if table == 'movie_genres':
+            genres_touched.add(movie_id)
+
+        if op == 'DELETE':
+            yield f"DELETE FROM {table} WHERE id = {int(row_id)}"
+            continue
+
+        if table == 'movies':
+            row_data['director_key'] = normalize_person_name(row_data['director']) if row_data.get('director') else None
+        elif table == 'movie_cast':
+            row_data['actor_key'] = normalize_person_name(row_data['actor_name'])
+        columns = CHANGE_COLUMNS[table]
+        yield upsert_statement(table, columns, tuple(row_data.get(column) for column in columns))
+
+    # genre_mask is derived, so recompute it for movies whose genres changed
+    # (bits are distinct, so SUM is the bitwise OR)
+    for ids in id_chunks(genres_touched):
+        yield f"""UPDATE movies SET genre_mask = (
+            SELECT COALESCE(SUM(1 << gb.bit), 0)
+            FROM movie_genres mg JOIN genre_bits gb ON gb.genre = mg.genre
+            WHERE mg.movie_id = movies.id
+        ) WHERE id IN ({', '.join(map(str, ids))})"""
+
+    # Documents as of the same snapshot as the changes
+    for ids in id_chunks(touched):
+        yield f"DELETE FROM movie_documents WHERE movie_id IN ({', '.join(map(str, ids))})"
+        yield from insert_statements('movie_documents', ['movie_id', 'document'], stream(
+            conn, "SELECT movie_id, document::text FROM movie_documents WHERE movie_id = ANY(%s)",
+            (ids,), name='export_documents'
+        ))
+
+    yield sync_state_statement(seq)
+
+def open_snapshot(conn) -> int:
+    """Start a read-only repeatable-read transaction and return the change feed position it reflects"""
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    # Writers hold the change feed lock until commit, so every committed
+    # change is at or below this seq and nothing later can appear below it
+    return current_seq(conn)
+
+def write_sql_files(statements: Iterable[str], out_dir: str, prefix: str, chunk_bytes: int) -> List[str]:
+    """Write statements to numbered .sql files of at most chunk_bytes each"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths: List[str] = []
+    f = None
+    size = 0
+    try:
+        for statement in statements:
+            line = statement + ';\n'
+            line_bytes = len(line.encode('utf-8'))
+            if f is None or (size and size + line_bytes > chunk_bytes):
+                if f is not None:
+                    f.close()
+                paths.append(os.path.join(out_dir, f'{prefix}-{len(paths) + 1:04d}.sql'))
+                f = open(paths[-1], 'w', encoding='utf-8')
+                size = 0
+            f.write(line)
+            size += line_bytes
+    finally:
+        if f is not None:
+            f.close()
+    return paths
+
+def read_sqlite_seq(path: str) -> Optional[int]:
+    """The change feed position an existing SQLite export was synced to, if any"""
+    if not os.path.exists(path):
+        return None
+    db = sqlite3.connect(path)
+    try:
+        row = db.execute("SELECT value FROM sync_state WHERE key = 'catalog_seq'").fetchone()
+        return row[0] if row else None
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        db.close()
+
+def export_sqlite(path: str) -> None:
+    since = read_sqlite_seq(path)
+    conn = open_connection()
+    try:
+        seq = open_snapshot(conn)
+        if since is None:
+            statements = full_statements(conn, seq)
+            print(f"📦 Full export to {path} at seq {seq}")
+        else:
+            statements = delta_statements(conn, since, seq)
+            print(f"📦 Applying changes {since} → {seq} to {path}")
+
+        db = sqlite3.connect(path, isolation_level=None)
+        try:
+            db.execute("PRAGMA foreign_keys = ON")
+            db.execute("BEGIN")
+            count = 0
+            for statement in statements:
+                db.execute(statement)
+                count += 1
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+        print(f"✅ Executed {count} statements")
+    finally:
+        conn.close()
+
+def export_sql(out_dir: str, since: Optional[int], chunk_mb: int) -> None:
+    conn = open_connection()
+    try:
+        seq = open_snapshot(conn)
+        if since is None:
+            statements = full_statements(conn, seq)
+            prefix = f'full-{seq}'
+        else:
+            statements = delta_statements(conn, since, seq)
+            prefix = f'delta-{since}-{seq}'
+        paths = write_sql_files(statements, out_dir, prefix, chunk_mb * 1024 * 1024)
+        print(f"✅ Wrote {len(paths)} file(s) at seq {seq}; apply in order with:")
+        for path in paths:
+            print(f"   wrangler d1 execute movie-database --remote --file={path}")
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the catalog for Cloudflare D1")
+    targets = parser.add_subparsers(dest='target', required=True)
+
+    sqlite_parser = targets.add_parser('sqlite', help="Create or incrementally update a SQLite database")
+    sqlite_parser.add_argument('path')
+
+    sql_parser = targets.add_parser('sql', help="Write chunked SQL batch files for wrangler d1 execute")
+    sql_parser.add_argument('out_dir')
+    sql_parser.add_argument('--since', type=int, help="Write a delta from this change feed seq")
+    sql_parser.add_argument('--chunk-mb', type=int, default=DEFAULT_CHUNK_MB,
+                            help=f"Maximum size of each file (default {DEFAULT_CHUNK_MB} MB)")
+
+    args = parser.parse_args()
+    try:
+        if args.target == 'sqlite':
+            export_sqlite(args.path)
+        else:
+            export_sql(args.out_dir, args.since, args.chunk_mb)
+    except ChangeFeedExpired as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+    except Exception as e:
+        print(f"❌ Export failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
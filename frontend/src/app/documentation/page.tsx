@@ -288,7 +288,7 @@ export default function Documentation() {
                 <div className="text-green-400 ml-6">&quot;title&quot;: &quot;The Matrix&quot;,</div>
                 <div className="text-green-400 ml-6">&quot;year&quot;: 1999,</div>
                 <div className="text-green-400 ml-6">&quot;director&quot;: &quot;Wachowski&quot;,</div>
-                <div className="text-green-400 ml-6">&quot;rating&quot;: &quot;8.7&quot;,</div>
+                <div className="text-green-400 ml-6">&quot;rating&quot;: 8.7,</div>
                 <div className="text-green-400 ml-6">&quot;genres&quot;: [&quot;Action&quot;, &quot;Sci-Fi&quot;],</div>
                 <div className="text-green-400 ml-6">&quot;cast&quot;: [&quot;Keanu Reeves&quot;, &quot;Laurence Fishburne&quot;]</div>
                 <div className="text-yellow-300 ml-4">{'}'}</div>
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Database maintenance tasks
+Run periodically (e.g. daily from cron).
+
+Usage: python maintenance.py <task> [options]
+"""
+
+import argparse
+import os
+import sys
+sys.path.append('.')
+sys.path.append('./src')
+
+from src.catalog import purge_catalog_changes
+from src.popularity import purge_popularity_sketches
+from src.auth import purge_rate_limits
+from src.usage_writer import (
+    USAGE_PARTITIONS_AHEAD, drop_usage_log_partitions, ensure_usage_log_partitions, purge_hourly_usage
+)
+
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv('CHANGE_FEED_RETENTION_DAYS', 30))
+POPULARITY_SKETCH_MAX_AGE_DAYS = int(os.getenv('POPULARITY_SKETCH_MAX_AGE_DAYS', 7))
+# Longest window passed to check_rate_limit (signups: one hour)
+RATE_LIMIT_MAX_WINDOW_SECONDS = int(os.getenv('RATE_LIMIT_MAX_WINDOW_SECONDS', 3600))
+USAGE_LOG_RETENTION_MONTHS = int(os.getenv('USAGE_LOG_RETENTION_MONTHS', 12))
+USAGE_HOURLY_RETENTION_DAYS = int(os.getenv('USAGE_HOURLY_RETENTION_DAYS', 30))
+
+def purge_changes(args) -> None:
+    """Drop change feed entries older than the retention window"""
+    purged = purge_catalog_changes(args.days)
+    print(f"✅ Purged {purged} change feed entries older than {args.days} days")
+
+def purge_sketches(args) -> None:
+    """Drop popularity sketches left behind by workers that no longer run"""
+    purged = purge_popularity_sketches(args.days)
+    print(f"✅ Purged {purged} popularity sketches not synced for {args.days} days")
+
+def purge_rate_limit_counters(args) -> None:
+    """Drop signup/verification attempt counters that no window covers any more"""
+    purged = purge_rate_limits(args.seconds)
+    print(f"✅ Purged {purged} rate limit counters older than {args.seconds} seconds")
+
+def rotate_usage_logs(args) -> None:
+    """Create upcoming usage_logs partitions and drop the ones past retention"""
+    created = ensure_usage_log_partitions(USAGE_PARTITIONS_AHEAD)
+    dropped = drop_usage_log_partitions(args.months)
+    print(f"✅ Created {created} and dropped {dropped} usage log partitions (keeping {args.months} months)")
+
+def purge_hourly(args) -> None:
+    """Drop hourly usage rollups older than the retention window"""
+    purged = purge_hourly_usage(args.days)
+    print(f"✅ Purged {purged} hourly usage rows older than {args.days} days")
+
+def main():
+    parser = argparse.ArgumentParser(description="Database maintenance tasks")
+    tasks = parser.add_subparsers(dest='task', required=True)
+
+    purge = tasks.add_parser('purge-changes', help="Apply change feed retention")
+    purge.add_argument('--days', type=int, default=CHANGE_FEED_RETENTION_DAYS,
+                       help=f"Days of changes to keep (default {CHANGE_FEED_RETENTION_DAYS})")
+    purge.set_defaults(run=purge_changes)
+
+    sketches = tasks.add_parser('purge-sketches', help="Drop stale popularity sketches")
+    sketches.add_argument('--days', type=int, default=POPULARITY_SKETCH_MAX_AGE_DAYS,
+                          help=f"Age after which a worker's sketch is dropped (default {POPULARITY_SKETCH_MAX_AGE_DAYS})")
+    sketches.set_defaults(run=purge_sketches)
+
+    rate_limits = tasks.add_parser('purge-rate-limits', help="Drop expired rate limit counters")
+    rate_limits.add_argument('--seconds', type=int, default=RATE_LIMIT_MAX_WINDOW_SECONDS,
+                             help=f"Longest rate limit window in use (default {RATE_LIMIT_MAX_WINDOW_SECONDS})")
+    rate_limits.set_defaults(run=purge_rate_limit_counters)
+
+    usage = tasks.add_parser('rotate-usage-logs', help="Apply usage log partition retention")
+    usage.add_argument('--months', type=int, default=USAGE_LOG_RETENTION_MONTHS,
+                       help=f"Past months of usage logs to keep (default {USAGE_LOG_RETENTION_MONTHS})")
+    usage.set_defaults(run=rotate_usage_logs)
+
+    hourly = tasks.add_parser('purge-usage-hourly', help="Apply hourly usage rollup retention")
+    hourly.add_argument('--days', type=int, default=USAGE_HOURLY_RETENTION_DAYS,
+                        help=f"Days of hourly rollups to keep (default {USAGE_HOURLY_RETENTION_DAYS})")
+    hourly.set_defaults(run=purge_hourly)
+
+    args = parser.parse_args()
+    try:
+        args.run(args)
+    except Exception as e:
+        print(f"❌ {args.task} failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,23 @@ RESTful API endpoints for the movie database
 
 import sys
 import os
+import json
 sys.path.append('.')
 sys.path.append('./src')
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from src.database import execute_query
+from src.json_provider import FastJSONProvider
+from src.compression import init_compression
+from src.response_cache import cached_response
+from src.catalog import genre_filter_sql, get_catalog_stats, get_movie_document, get_movie_documents, parse_genre_filter, parse_movie_ids
+from src.catalog_events import CatalogCache, start_catalog_listener
+from src.catalog_snapshot import get_catalog_snapshot, start_catalog_snapshot
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+init_compression(app)
 
 # Configure CORS for Replit environment - allow all origins for development
 CORS(app, origins="*")
@@ -24,6 +33,12 @@ app.config['DEBUG'] = True
 # Essential for Replit: Disable host header checks for proxy environments
 app.config['SERVER_NAME'] = None
 
+# Listen for catalog writes (importer, admin endpoints) so cached catalog data
+# is dropped as soon as it changes
+start_catalog_listener()
+catalog_cache = CatalogCache(ttl=24 * 3600)
+start_catalog_snapshot()
+
 @app.route('/')
 def home():
     """API root endpoint"""
@@ -38,89 +53,97 @@ def home():
     })
 
 @app.route('/api/movies', methods=['GET'])
+@cached_response()
 def get_movies():
     """Get all movies with optional filtering and pagination"""
     try:
         # Get query parameters
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 20))
-        genre = request.args.get('genre')
+        try:
+            genres, match_all = parse_genre_filter(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         year = request.args.get('year')
         search = request.args.get('search')
         
         # Calculate offset
         offset = (page - 1) * limit
         
-        # Build base query
-        query = """
-            SELECT DISTINCT m.id, m.title, m.year, m.runtime, m.rating, 
-                   m.director, m.plot, m.poster_url
-            FROM movies m
-        """
+        # Answer from the in-memory columnar snapshot when it is enabled and
+        # current; text search and anything else it can't answer go to SQL
+        snapshot = get_catalog_snapshot() if not search else None
+        result = snapshot.query(genres, match_all, int(year) if year else None, offset, limit) if snapshot else None
         
-        conditions = []
-        params = []
+        if result is not None:
+            enriched_movies, total_movies = result
+        else:
+            # Build base query
+            query = """
+                SELECT m.id, m.title, m.year, m.runtime, m.rating, 
+                       m.director, m.plot, m.poster_url
+                FROM movies m
+            """
         
-        # Add genre filter
-        if genre:
-            query += " LEFT JOIN movie_genres mg ON m.id = mg.movie_id"
-            conditions.append("mg.genre = %s")
-            params.append(genre)
+            conditions = []
+            params = []
         
-        # Add search filter
-        if search:
-            conditions.append("(m.title ILIKE %s OR m.director ILIKE %s OR m.plot ILIKE %s)")
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param])
+            # Add genre filter
+            if genres:
+                genre_clause, genre_params = genre_filter_sql(genres, match_all)
+                conditions.append(genre_clause)
+                params.extend(genre_params)
         
-        # Add year filter
-        if year:
-            conditions.append("m.year = %s")
-            params.append(int(year))
+            # Add search filter
+            if search:
+                conditions.append("(m.title ILIKE %s OR m.director ILIKE %s OR m.plot ILIKE %s)")
+                search_param = f"%{search}%"
+                params.extend([search_param, search_param, search_param])
         
-        # Add WHERE clause if we have conditions
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
+            # Add year filter
+            if year:
+                conditions.append("m.year = %s")
+                params.append(int(year))
         
-        # Add ordering and pagination
-        query += " ORDER BY m.year DESC, m.title LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
+            # Add WHERE clause if we have conditions
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
         
-        movies = execute_query(query, tuple(params), fetch=True)
+            # Add ordering and pagination
+            query += " ORDER BY m.year DESC, m.title LIMIT %s OFFSET %s"
+            params.extend([limit, offset])
         
-        # Enrich with genres and cast for each movie
-        enriched_movies = []
-        for movie in movies:
-            movie_dict = dict(movie)
+            movies = execute_query(query, tuple(params), fetch=True)
+        
+            # Enrich with genres and cast for each movie
+            enriched_movies = []
+            for movie in movies:
+                movie_dict = dict(movie)
             
-            # Get genres
-            genres_result = execute_query(
-                "SELECT genre FROM movie_genres WHERE movie_id = %s ORDER BY genre",
-                (movie['id'],), fetch=True
-            )
-            movie_dict['genres'] = [g['genre'] for g in genres_result]
+                # Get genres
+                genres_result = execute_query(
+                    "SELECT genre FROM movie_genres WHERE movie_id = %s ORDER BY genre",
+                    (movie['id'],), fetch=True
+                )
+                movie_dict['genres'] = [g['genre'] for g in genres_result]
             
-            # Get cast
-            cast_result = execute_query(
-                "SELECT actor_name FROM movie_cast WHERE movie_id = %s ORDER BY actor_name",
-                (movie['id'],), fetch=True
-            )
-            movie_dict['cast'] = [c['actor_name'] for c in cast_result]
+                # Get cast
+                cast_result = execute_query(
+                    "SELECT actor_name FROM movie_cast WHERE movie_id = %s ORDER BY actor_name",
+                    (movie['id'],), fetch=True
+                )
+                movie_dict['cast'] = [c['actor_name'] for c in cast_result]
             
-            enriched_movies.append(movie_dict)
+                enriched_movies.append(movie_dict)
         
-        # Get total count for pagination
-        count_query = "SELECT COUNT(DISTINCT m.id) as total FROM movies m"
-        if genre:
-            count_query += " LEFT JOIN movie_genres mg ON m.id = mg.movie_id"
-        if conditions:
-            count_query += " WHERE " + " AND ".join(conditions[:-2] if year else conditions)
-            count_params = params[:-2] if conditions else []
-        else:
-            count_params = []
+            # Get total count for pagination
+            count_query = "SELECT COUNT(*) as total FROM movies m"
+            if conditions:
+                count_query += " WHERE " + " AND ".join(conditions)
+            count_params = params[:-2]
         
-        total_result = execute_query(count_query, tuple(count_params), fetch=True)
-        total_movies = total_result[0]['total']
+            total_result = execute_query(count_query, tuple(count_params), fetch=True)
+            total_movies = total_result[0]['total']
         
         return jsonify({
             'movies': enriched_movies,
@@ -136,89 +159,88 @@ def get_movies():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/movies/<int:movie_id>', methods=['GET'])
+@cached_response(movie_ids=lambda movie_id: [movie_id])
 def get_movie(movie_id):
     """Get a specific movie by ID"""
     try:
-        # Get movie details
-        movie_result = execute_query(
-            "SELECT * FROM movies WHERE id = %s",
-            (movie_id,), fetch=True
-        )
+        # Precomputed document (movie + genres + cast), sent through as-is
+        document = get_movie_document(movie_id)
         
-        if not movie_result:
+        if document is None:
             return jsonify({'error': 'Movie not found'}), 404
         
-        movie = dict(movie_result[0])
+        return app.response_class('{"movie": ' + document + '}', mimetype='application/json')
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/movies/batch', methods=['GET'])
+@cached_response(movie_ids=lambda: parse_movie_ids(request.args.get('ids', '')))
+def get_movies_batch():
+    """Get several movies by ID (?ids=1,2,3)"""
+    try:
+        try:
+            movie_ids = parse_movie_ids(request.args.get('ids', ''))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Get genres
-        genres_result = execute_query(
-            "SELECT genre FROM movie_genres WHERE movie_id = %s ORDER BY genre",
-            (movie_id,), fetch=True
-        )
-        movie['genres'] = [g['genre'] for g in genres_result]
+        documents, missing = get_movie_documents(movie_ids)
         
-        # Get cast
-        cast_result = execute_query(
-            "SELECT actor_name, role FROM movie_cast WHERE movie_id = %s ORDER BY actor_name",
-            (movie_id,), fetch=True
+        return app.response_class(
+            '{"movies": [' + ', '.join(documents) + '], "missing": ' + json.dumps(missing) + '}',
+            mimetype='application/json'
         )
-        movie['cast'] = [{'name': c['actor_name'], 'role': c['role']} for c in cast_result]
-        
-        return jsonify({'movie': movie})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/genres', methods=['GET'])
+@cached_response()
 def get_genres():
     """Get all available genres"""
     try:
-        genres_result = execute_query(
-            "SELECT DISTINCT genre FROM movie_genres ORDER BY genre",
-            fetch=True
-        )
-        genres = [g['genre'] for g in genres_result]
+        genres = catalog_cache.get_or_set('genres', lambda: [
+            g['genre'] for g in execute_query(
+                "SELECT DISTINCT genre FROM movie_genres ORDER BY genre",
+                fetch=True
+            )
+        ])
         return jsonify({'genres': genres})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/years', methods=['GET'])
+@cached_response()
 def get_years():
     """Get all available years"""
     try:
-        years_result = execute_query(
-            "SELECT DISTINCT year FROM movies ORDER BY year DESC",
-            fetch=True
-        )
-        years = [y['year'] for y in years_result]
+        years = catalog_cache.get_or_set('years', lambda: [
+            y['year'] for y in execute_query(
+                "SELECT DISTINCT year FROM movies ORDER BY year DESC",
+                fetch=True
+            )
+        ])
         return jsonify({'years': years})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/stats', methods=['GET'])
+@cached_response()
 def get_stats():
     """Get database statistics"""
     try:
-        # Get counts
-        movies_count = execute_query("SELECT COUNT(*) as count FROM movies", fetch=True)[0]['count']
-        genres_count = execute_query("SELECT COUNT(*) as count FROM movie_genres", fetch=True)[0]['count']
-        cast_count = execute_query("SELECT COUNT(*) as count FROM movie_cast", fetch=True)[0]['count']
-        
-        # Get year range
-        year_range = execute_query(
-            "SELECT MIN(year) as min_year, MAX(year) as max_year FROM movies",
-            fetch=True
-        )[0]
+        # Single-row read of the trigger-maintained summary
+        stats = get_catalog_stats()
         
         return jsonify({
-            'movies_total': movies_count,
-            'genres_total': genres_count,
-            'cast_total': cast_count,
+            'movies_total': stats['movies_total'],
+            'genres_total': stats['genres_total'],
+            'cast_total': stats['cast_total'],
             'year_range': {
-                'min': year_range['min_year'],
-                'max': year_range['max_year']
+                'min': stats['min_year'],
+                'max': stats['max_year']
             }
         })
     
@@ -226,6 +248,7 @@ def get_stats():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/search', methods=['GET'])
+@cached_response()
 def search_movies():
     """Search movies by title, director, or plot"""
     try:
@@ -277,6 +300,7 @@ if __name__ == '__main__':
     print("  GET /                     - API info")
     print("  GET /api/movies          - List movies (with pagination & filters)")
     print("  GET /api/movies/{id}     - Get specific movie")
+    print("  GET /api/movies/batch?ids=1,2 - Get several movies")
     print("  GET /api/genres          - List all genres")
     print("  GET /api/years           - List all years")
     print("  GET /api/stats           - Database statistics")
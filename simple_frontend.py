@@ -9,8 +9,13 @@ import sys
 import os
 sys.path.append('./src')
 from src.database import execute_query
+from src.json_provider import FastJSONProvider
+from src.compression import init_compression
+from src.catalog import get_catalog_stats
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+init_compression(app)
 CORS(app, origins="*")
 
 # Landing Page HTML matching first uploaded image
@@ -830,14 +835,12 @@ def dashboard():
 def api_stats():
     """Get movie database statistics"""
     try:
-        movies_count = execute_query("SELECT COUNT(*) as count FROM movies", fetch=True)[0]['count']
-        genres_count = execute_query("SELECT COUNT(*) as count FROM movie_genres", fetch=True)[0]['count'] 
-        cast_count = execute_query("SELECT COUNT(*) as count FROM movie_cast", fetch=True)[0]['count']
+        stats = get_catalog_stats()
         
         return jsonify({
-            'movies_total': movies_count,
-            'genres_total': genres_count, 
-            'cast_total': cast_count,
+            'movies_total': stats['movies_total'],
+            'genres_total': stats['genres_total'], 
+            'cast_total': stats['cast_total'],
             'active_users': 1234,
             'magic_links': 856,
             'sms_otp': 523
@@ -7,13 +7,19 @@ Handles user signup, email verification, and API key management
 import os
 import uuid
 import hashlib
-import bcrypt
 import re
 import json
+import math
 import time
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List
 from src.database import execute_query
+from src.key_cache import ApiKeyCache, evict_api_keys
+from src.usage_writer import pending_daily_usage, record_usage
+from src.rate_limiter import RateLimitDecision, RateLimiterFull, get_rate_limiter
+from src.password_hashing import PasswordHashingBusy, get_password_hasher
 import firebase_admin
 from firebase_admin import auth as firebase_auth, credentials
 
@@ -95,13 +101,18 @@ DISPOSABLE_DOMAINS = [
     'sharklasers.com', 'guerrillamailblock.com', 'pokemail.net', 'spam4.me'
 ]
 
+# Validated API keys (sha256-hashed key scheme of this module)
+_key_cache = ApiKeyCache()
+
 class AuthError(Exception):
     """Custom authentication error"""
     pass
 
 class RateLimitError(Exception):
-    """Rate limit exceeded error"""
-    pass
+    """Rate limit exceeded error (with the limiter's decision when there is one)"""
+    def __init__(self, message: str = '', decision: Optional[RateLimitDecision] = None):
+        super().__init__(message)
+        self.decision = decision
 
 def init_firebase(credentials_path: str = "firebase-service-account.json"):
     """Initialize Firebase Admin SDK"""
@@ -165,12 +176,17 @@ def validate_email_format(email: str) -> bool:
     return True
 
 def hash_password(password: str) -> str:
-    """Hash password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    """
+    Hash password using bcrypt (on the bounded hashing pool, see src/password_hashing.py)
+
+    Raises PasswordHashingBusy when the pool is saturated, which callers
+    report as 503 rather than as bad input.
+    """
+    return get_password_hasher().hash(password)
 
 def verify_password(password: str, hashed: str) -> bool:
-    """Verify password against hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    """Verify password against hash (raises PasswordHashingBusy like hash_password)"""
+    return get_password_hasher().verify(password, hashed)
 
 def generate_api_key() -> str:
     """Generate a unique API key"""
@@ -180,6 +196,10 @@ def hash_api_key(api_key: str) -> str:
     """Hash API key for storage"""
     return hashlib.sha256(api_key.encode()).hexdigest()
 
+# Sliding windows are counted in this many buckets (so they slide in steps
+# of window / RATE_LIMIT_BUCKETS)
+RATE_LIMIT_BUCKETS = int(os.getenv('RATE_LIMIT_BUCKETS', 15))
+
 def check_rate_limit(identifier: str, action: str, limit: int = 5, window: int = 900) -> bool:
     """
     Check rate limit for user actions
@@ -189,35 +209,46 @@ def check_rate_limit(identifier: str, action: str, limit: int = 5, window: int =
         limit: Maximum attempts allowed
         window: Time window in seconds (default 15 minutes)
     """
-    current_time = int(time.time())
-    window_start = current_time - window
-    
-    # Clean up old rate limit entries
-    execute_query("""
-        DELETE FROM rate_limits 
-        WHERE timestamp < %s
-    """, (window_start,))
+    bucket_size = max(1, window // RATE_LIMIT_BUCKETS)
+    current_bucket = int(time.time()) // bucket_size * bucket_size
+    window_start = current_bucket - window + bucket_size
     
-    # Check current attempts
-    attempts = execute_query("""
-        SELECT COUNT(*) as count 
-        FROM rate_limits 
-        WHERE identifier = %s AND action = %s AND timestamp >= %s
-    """, (identifier, action, window_start), fetch=True)
-    
-    current_attempts = attempts[0]['count'] if attempts else 0
+    # One statement: sum the earlier buckets of the window and count this
+    # attempt in the current bucket only if the total stays under the limit.
+    # Old buckets are removed by maintenance.py, not here.
+    result = execute_query("""
+        WITH earlier AS (
+            SELECT COALESCE(SUM(count), 0) AS attempts
+            FROM rate_limits
+            WHERE identifier = %(identifier)s AND action = %(action)s
+              AND window_bucket >= %(window_start)s AND window_bucket < %(bucket)s
+        ), counted AS (
+            INSERT INTO rate_limits (identifier, action, window_bucket, count)
+            SELECT %(identifier)s, %(action)s, %(bucket)s, 1
+            FROM earlier WHERE earlier.attempts < %(limit)s
+            ON CONFLICT (identifier, action, window_bucket)
+            DO UPDATE SET count = rate_limits.count + 1
+            WHERE rate_limits.count + (SELECT attempts FROM earlier) < %(limit)s
+            RETURNING count
+        )
+        SELECT EXISTS (SELECT 1 FROM counted) AS allowed
+    """, {
+        'identifier': identifier, 'action': action, 'bucket': current_bucket,
+        'window_start': window_start, 'limit': limit
+    }, fetch=True)
     
-    if current_attempts >= limit:
+    if not result or not result[0]['allowed']:
         raise RateLimitError(f"Rate limit exceeded for {action}. Try again in {window // 60} minutes.")
     
-    # Record this attempt
-    execute_query("""
-        INSERT INTO rate_limits (identifier, action, timestamp) 
-        VALUES (%s, %s, %s)
-    """, (identifier, action, current_time))
-    
     return True
 
+def purge_rate_limits(max_window: int) -> int:
+    """Delete attempt counters older than the longest rate limit window, returning how many were removed"""
+    return execute_query(
+        "DELETE FROM rate_limits WHERE window_bucket < %s",
+        (int(time.time()) - max_window,)
+    )
+
 def create_user(email: str, password: str) -> Dict:
     """Create a new user account with Firebase email verification"""
     try:
@@ -241,6 +272,9 @@ def create_user(email: str, password: str) -> Dict:
         if not firebase_app:
             raise AuthError("Email verification service is not available. Please contact support.")
         
+        # Hash first: if the hashing pool is saturated, reject before creating the Firebase user
+        password_hash = hash_password(password)
+        
         try:
             # Create Firebase user
             firebase_user = firebase_auth.create_user(
@@ -259,14 +293,12 @@ def create_user(email: str, password: str) -> Dict:
             if existing_user:
                 # Update existing unverified user
                 user_id = existing_user[0]['id']
-                password_hash = hash_password(password)
                 execute_query(
                     "UPDATE users SET password_hash = %s WHERE id = %s",
                     (password_hash, user_id)
                 )
             else:
                 # Create new user
-                password_hash = hash_password(password)
                 result = execute_query("""
                     INSERT INTO users (email, password_hash, is_verified, created_at)
                     VALUES (%s, %s, FALSE, CURRENT_TIMESTAMP)
@@ -318,7 +350,7 @@ def create_user(email: str, password: str) -> Dict:
             else:
                 raise AuthError(f"Failed to create Firebase user: {error_message}")
             
-    except (AuthError, RateLimitError) as e:
+    except (AuthError, RateLimitError, PasswordHashingBusy) as e:
         raise e
     except Exception as e:
         raise AuthError(f"Failed to create user: {str(e)}")
@@ -438,30 +470,46 @@ def resend_verification(email: str) -> Dict:
     except Exception as e:
         raise AuthError(f"Failed to resend verification: {str(e)}")
 
+DEFAULT_PLAN = {'plan_type': 'free', 'daily_limit': 100}
+
+def _load_api_key(api_key: str) -> Optional[Dict]:
+    """Look up an API key with its user and plan in one query"""
+    hashed_key = hash_api_key(api_key)
+    
+    result = execute_query("""
+        SELECT ak.id, ak.user_id, u.email, u.is_verified,
+               COALESCE(us.plan_type, %s) AS plan_type,
+               COALESCE(us.daily_limit, %s) AS daily_limit
+        FROM api_keys ak
+        JOIN users u ON ak.user_id = u.id
+        LEFT JOIN user_subscriptions us ON us.user_id = ak.user_id
+        WHERE ak.api_key = %s AND ak.is_active = TRUE AND u.is_verified = TRUE
+    """, (DEFAULT_PLAN['plan_type'], DEFAULT_PLAN['daily_limit'], hashed_key), fetch=True)
+    
+    if result:
+        return {
+            'api_key_id': result[0]['id'],
+            'user_id': result[0]['user_id'],
+            'email': result[0]['email'],
+            'verified': result[0]['is_verified'],
+            'plan_type': result[0]['plan_type'],
+            'daily_limit': result[0]['daily_limit']
+        }
+    return None
+
 def validate_api_key(api_key: str) -> Optional[Dict]:
-    """Validate API key and return user info"""
+    """Validate API key and return user info and plan (cached, see src/key_cache.py)"""
     try:
-        hashed_key = hash_api_key(api_key)
-        
-        result = execute_query("""
-            SELECT ak.id, ak.user_id, u.email, u.is_verified
-            FROM api_keys ak
-            JOIN users u ON ak.user_id = u.id
-            WHERE ak.api_key = %s AND ak.is_active = TRUE AND u.is_verified = TRUE
-        """, (hashed_key,), fetch=True)
-        
-        if result:
-            return {
-                'api_key_id': result[0]['id'],
-                'user_id': result[0]['user_id'],
-                'email': result[0]['email'],
-                'verified': result[0]['is_verified']
-            }
-        return None
-        
+        # Lookup errors propagate out of the loader, so they are never cached
+        return _key_cache.get_or_load(api_key, _load_api_key)
     except Exception as e:
         return None
 
+def rate_limit_message(plan_type: str, daily_limit: int) -> str:
+    """Error message for a user who has used up their daily limit"""
+    plan_name = "free plan" if plan_type == 'free' else "premium plan"
+    return f"Your {plan_name} has reached its daily limit of {daily_limit} requests. Please upgrade to premium for higher limits or try again tomorrow."
+
 def get_user_subscription(user_id: int) -> Dict:
     """Get user's subscription plan and daily limit"""
     try:
@@ -488,7 +536,7 @@ def get_user_subscription(user_id: int) -> Dict:
         return {'plan_type': 'free', 'daily_limit': 100}
 
 def get_user_daily_usage(user_id: int) -> int:
-    """Get user's total daily usage across all API keys"""
+    """Get user's total daily usage across all API keys (including this worker's unflushed requests)"""
     try:
         today = datetime.now().date()
         result = execute_query("""
@@ -498,7 +546,8 @@ def get_user_daily_usage(user_id: int) -> int:
             WHERE ak.user_id = %s AND du.date = %s
         """, (user_id, today), fetch=True)
         
-        return result[0]['total_requests'] if result else 0
+        total = result[0]['total_requests'] if result else 0
+        return total + pending_daily_usage(user_id, today)
     except Exception as e:
         print(f"Error getting user daily usage: {e}")
         return 0
@@ -510,8 +559,7 @@ def check_user_rate_limit(user_id: int) -> bool:
         current_usage = get_user_daily_usage(user_id)
         
         if current_usage >= subscription['daily_limit']:
-            plan_name = "free plan" if subscription['plan_type'] == 'free' else "premium plan"
-            raise RateLimitError(f"Your {plan_name} has reached its daily limit of {subscription['daily_limit']} requests. Please upgrade to premium for higher limits or try again tomorrow.")
+            raise RateLimitError(rate_limit_message(subscription['plan_type'], subscription['daily_limit']))
         
         return True
     except RateLimitError:
@@ -521,61 +569,125 @@ def check_user_rate_limit(user_id: int) -> bool:
         # Fail-closed: Raise error if rate limit check fails
         raise RateLimitError("Rate limit service temporarily unavailable. Please try again later.")
 
-def check_and_increment_user_rate_limit(user_id: int, api_key_id: int, endpoint: str) -> bool:
-    """Atomically check rate limit and increment usage counter"""
-    from datetime import datetime
+RATE_LIMIT_RECONCILE_SECONDS = float(os.getenv('RATE_LIMIT_RECONCILE_SECONDS', 30))
+# Optional per-key burst limit (token bucket); 0 disables it
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 0))
+RATE_LIMIT_PER_SECOND = float(os.getenv('RATE_LIMIT_PER_SECOND', 5))
+
+# user_id -> monotonic time the limiter's daily count was last raised to
+# daily_usage, oldest first. Entries older than RATE_LIMIT_RECONCILE_SECONDS
+# mean the same as a missing one and are pruned, so this only holds users
+# seen within the reconcile interval.
+_reconciled_at: 'OrderedDict[int, float]' = OrderedDict()
+_reconciled_lock = threading.Lock()
+
+def _needs_reconcile(user_id: int) -> bool:
+    """Whether the user's count is due to be raised to daily_usage (marks it done if so)"""
+    now = time.monotonic()
+    with _reconciled_lock:
+        while _reconciled_at and now - next(iter(_reconciled_at.values())) >= RATE_LIMIT_RECONCILE_SECONDS:
+            _reconciled_at.popitem(last=False)
+        if user_id in _reconciled_at:
+            return False
+        _reconciled_at[user_id] = now
+        return True
+
+def _end_of_day() -> float:
+    """Unix time of the next local midnight, when daily quotas reset"""
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+
+def _flushed_daily_usage(user_id: int) -> int:
+    """Today's requests by a user as recorded in daily_usage (every worker and host)"""
+    result = execute_query("""
+        SELECT COALESCE(SUM(du.request_count), 0) as total_requests
+        FROM daily_usage du
+        JOIN api_keys ak ON du.api_key_id = ak.id
+        WHERE ak.user_id = %s AND du.date = %s
+    """, (user_id, datetime.now().date()), fetch=True)
+    return result[0]['total_requests']
+
+# Decisions the shared limiter couldn't make because its table was full
+_limiter_full_count = 0
+
+def _limiter_full(what: str, e: Exception) -> None:
+    global _limiter_full_count
+    _limiter_full_count += 1
+    if _limiter_full_count % 1000 == 1:
+        print(f"⚠️ Rate limiter table full ({_limiter_full_count} times so far), {what}: {e}")
+
+def consume_daily_quota(user_id: int, api_key_id: int, daily_limit: int) -> RateLimitDecision:
+    """
+    Count one request against the user's daily quota (and the key's burst limit)
+    
+    Decisions come from the shared rate limiter (src/rate_limiter.py). Every
+    RATE_LIMIT_RECONCILE_SECONDS per user the count is raised to what
+    daily_usage holds, which covers limiter state lost on restart and
+    requests served by other hosts. If the limiter has no room for the user,
+    the quota is checked against daily_usage directly.
+    """
+    limiter = get_rate_limiter()
+    if RATE_LIMIT_BURST > 0:
+        try:
+            burst = limiter.token_bucket(f'burst:{api_key_id}', RATE_LIMIT_BURST, RATE_LIMIT_PER_SECOND)
+        except RateLimiterFull as e:
+            # The daily quota below still applies
+            _limiter_full("skipping the burst check", e)
+        else:
+            if not burst.allowed:
+                raise RateLimitError("Too many requests in a short time. Please slow down and try again.", burst)
+    
+    window_end = _end_of_day()
+    floor = None
+    if _needs_reconcile(user_id):
+        try:
+            floor = _flushed_daily_usage(user_id)
+        except Exception:
+            # Try again on the next request
+            with _reconciled_lock:
+                _reconciled_at.pop(user_id, None)
+            raise
     
     try:
-        today = datetime.now().date()
-        
-        # Atomic operation: check current usage and increment in single transaction
-        result = execute_query("""
-            WITH current_usage AS (
-                SELECT COALESCE(SUM(du.request_count), 0) as total_requests
-                FROM daily_usage du
-                JOIN api_keys ak ON du.api_key_id = ak.id
-                WHERE ak.user_id = %s AND du.date = %s
-            ),
-            user_plan AS (
-                SELECT COALESCE(us.daily_limit, 100) as daily_limit,
-                       COALESCE(us.plan_type, 'free') as plan_type
-                FROM user_subscriptions us
-                WHERE us.user_id = %s
-                UNION ALL
-                SELECT 100 as daily_limit, 'free' as plan_type
-                WHERE NOT EXISTS (SELECT 1 FROM user_subscriptions WHERE user_id = %s)
-                LIMIT 1
-            )
-            SELECT cu.total_requests, up.daily_limit, up.plan_type
-            FROM current_usage cu, user_plan up
-        """, (user_id, today, user_id, user_id), fetch=True)
-        
-        if not result:
-            raise Exception("Failed to get rate limit data")
-        
-        current_usage = result[0]['total_requests']
-        daily_limit = result[0]['daily_limit']
-        plan_type = result[0]['plan_type']
-        
-        # Check if limit would be exceeded
-        if current_usage >= daily_limit:
-            plan_name = "free plan" if plan_type == 'free' else "premium plan"
-            raise RateLimitError(f"Your {plan_name} has reached its daily limit of {daily_limit} requests. Please upgrade to premium for higher limits or try again tomorrow.")
-        
-        # Atomically increment usage counter
-        execute_query("""
-            INSERT INTO usage_logs (api_key_id, endpoint, timestamp, status_code)
-            VALUES (%s, %s, CURRENT_TIMESTAMP, 200)
-        """, (api_key_id, endpoint))
-        
-        execute_query("""
-            INSERT INTO daily_usage (api_key_id, date, request_count)
-            VALUES (%s, %s, 1)
-            ON CONFLICT (api_key_id, date)
-            DO UPDATE SET request_count = daily_usage.request_count + 1
-        """, (api_key_id, today))
-        
-        return True
+        return limiter.fixed_window(f'daily:{user_id}:{int(window_end)}', daily_limit, window_end, floor=floor)
+    except RateLimiterFull as e:
+        _limiter_full("checking daily_usage instead", e)
+        used = (floor if floor is not None else _flushed_daily_usage(user_id)) + pending_daily_usage(user_id)
+        allowed = used < daily_limit
+        return RateLimitDecision(allowed, daily_limit, max(0, daily_limit - used - (1 if allowed else 0)), window_end)
+
+def check_and_increment_user_rate_limit(user_id: int, api_key_id: int, endpoint: str,
+                                        plan: Optional[Dict] = None) -> RateLimitDecision:
+    """
+    Atomically check rate limit and increment usage counter
+    
+    Args:
+        plan: The user's plan_type and daily_limit if already known (e.g. the
+            cached user info from validate_api_key); looked up otherwise
+    
+    Returns:
+        The limiter's decision (limit, remaining, reset time)
+    """
+    try:
+        if plan is None:
+            result = execute_query("""
+                SELECT COALESCE(us.plan_type, %s) AS plan_type, COALESCE(us.daily_limit, %s) AS daily_limit
+                FROM users u
+                LEFT JOIN user_subscriptions us ON us.user_id = u.id
+                WHERE u.id = %s
+            """, (DEFAULT_PLAN['plan_type'], DEFAULT_PLAN['daily_limit'], user_id), fetch=True)
+            if not result:
+                raise Exception("Failed to get rate limit data")
+            plan = result[0]
+        
+        decision = consume_daily_quota(user_id, api_key_id, plan['daily_limit'])
+        if not decision.allowed:
+            raise RateLimitError(rate_limit_message(plan['plan_type'], plan['daily_limit']), decision)
+        
+        # Count the request; the usage writer batches it into usage_logs and daily_usage
+        record_usage(api_key_id, endpoint, 200, user_id)
+        
+        return decision
         
     except RateLimitError:
         raise
@@ -584,6 +696,29 @@ def check_and_increment_user_rate_limit(user_id: int, api_key_id: int, endpoint:
         # Fail-closed: Raise error if atomic operation fails
         raise RateLimitError("Rate limit service temporarily unavailable. Please try again later.")
 
+def rate_limit_headers(decision: RateLimitDecision) -> Dict[str, str]:
+    """RateLimit-* response headers (IETF draft fields) for a limiter decision"""
+    now = time.time()
+    headers = {
+        'RateLimit-Limit': str(decision.limit),
+        'RateLimit-Remaining': str(decision.remaining),
+        'RateLimit-Reset': str(max(0, math.ceil(decision.reset_at - now)))
+    }
+    if not decision.allowed:
+        # When the request could go through, not when the limit is fully restored
+        retry_at = decision.retry_at if decision.retry_at is not None else decision.reset_at
+        headers['Retry-After'] = str(max(1, math.ceil(retry_at - now)))
+    return headers
+
+def quota_usage(decision: RateLimitDecision) -> Dict:
+    """The usage block of response meta, straight from a limiter decision"""
+    return {
+        'used': decision.limit - decision.remaining,
+        'limit': decision.limit,
+        'remaining': decision.remaining,
+        'resets_at': datetime.fromtimestamp(decision.reset_at).isoformat()
+    }
+
 def upgrade_user_to_premium(user_id: int):
     """Upgrade user to premium plan"""
     try:
@@ -596,28 +731,17 @@ def upgrade_user_to_premium(user_id: int):
                 daily_limit = 500,
                 updated_at = CURRENT_TIMESTAMP
         """, (user_id,))
+        # Cached plans of other workers are dropped by the user_subscriptions trigger
+        evict_api_keys(user_ids=[user_id])
         print(f"✅ User {user_id} upgraded to premium")
     except Exception as e:
         print(f"Error upgrading user to premium: {e}")
         raise
 
-def log_api_usage(api_key_id: int, endpoint: str, status_code: int):
-    """Log API usage for analytics"""
+def log_api_usage(api_key_id: int, endpoint: str, status_code: int, user_id: Optional[int] = None):
+    """Log API usage for analytics (queued; written in batches by src/usage_writer.py)"""
     try:
-        execute_query("""
-            INSERT INTO usage_logs (api_key_id, endpoint, timestamp, status_code)
-            VALUES (%s, %s, CURRENT_TIMESTAMP, %s)
-        """, (api_key_id, endpoint, status_code))
-        
-        # Update daily usage counter
-        today = datetime.now().date()
-        execute_query("""
-            INSERT INTO daily_usage (api_key_id, date, request_count)
-            VALUES (%s, %s, 1)
-            ON CONFLICT (api_key_id, date)
-            DO UPDATE SET request_count = daily_usage.request_count + 1
-        """, (api_key_id, today))
-        
+        record_usage(api_key_id, endpoint, status_code, user_id)
     except Exception as e:
         # Don't fail the request if logging fails
         print(f"Failed to log API usage: {e}")
@@ -6,8 +6,15 @@ Authentication and API Key Management System
 import os
 import secrets
 import hashlib
+import hmac
 from datetime import datetime, timedelta
 from database import execute_query
+from src.key_cache import ApiKeyCache, evict_api_keys
+from src.usage_writer import record_usage
+from src.password_hashing import PasswordHashingBusy, get_password_hasher
+
+# Validated API keys (plain mk_ key scheme of AuthManager)
+_key_cache = ApiKeyCache()
 
 class AuthManager:
     """Handle user authentication and API key management"""
@@ -19,15 +26,33 @@ class AuthManager:
     
     @staticmethod
     def hash_password(password):
-        """Hash a password"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Hash a password (bcrypt on the bounded hashing pool)"""
+        return get_password_hasher().hash(password)
+    
+    @staticmethod
+    def _check_password(password, password_hash):
+        """
+        Check a password against its stored hash
+        
+        Returns (valid, replacement hash or None). Unsalted sha256 hashes from
+        before bcrypt, and bcrypt hashes of another cost factor, are replaced
+        on a successful login.
+        """
+        if not password_hash.startswith('$2'):
+            legacy_hash = hashlib.sha256(password.encode()).hexdigest()
+            if not hmac.compare_digest(legacy_hash, password_hash):
+                return False, None
+            try:
+                return True, AuthManager.hash_password(password)
+            except PasswordHashingBusy:
+                return True, None
+        return get_password_hasher().verify_and_rehash(password, password_hash)
     
     @staticmethod
     def create_user(email, password):
         """Create a new user"""
+        password_hash = AuthManager.hash_password(password)
         try:
-            password_hash = AuthManager.hash_password(password)
-            
             # First create the user
             user_result = execute_query(
                 "INSERT INTO users (email, password_hash, is_verified) VALUES (%s, %s, TRUE) RETURNING id",
@@ -55,16 +80,28 @@ class AuthManager:
     def authenticate_user(email, password):
         """Authenticate user login"""
         try:
-            password_hash = AuthManager.hash_password(password)
             user = execute_query(
-                "SELECT id, email FROM users WHERE email = %s AND password_hash = %s AND is_verified = TRUE",
-                (email, password_hash),
+                "SELECT id, email, password_hash FROM users WHERE email = %s AND is_verified = TRUE",
+                (email,),
                 fetch=True
             )
+            if not user:
+                return None
             
-            if user:
-                return user[0]
-            return None
+            user = dict(user[0])
+            stored_hash = user.pop('password_hash')
+            valid, new_hash = AuthManager._check_password(password, stored_hash)
+            if not valid:
+                return None
+            if new_hash:
+                # Only if nobody changed the password in the meantime
+                execute_query(
+                    "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+                    (new_hash, user['id'], stored_hash)
+                )
+            return user
+        except PasswordHashingBusy:
+            raise
         except Exception:
             return None
     
@@ -88,57 +125,47 @@ class AuthManager:
         return api_key
     
     @staticmethod
-    def validate_api_key(api_key):
-        """Validate API key and return user info"""
+    def _load_api_key(api_key):
+        """Look up an API key, its user and the user's plan in the database"""
         result = execute_query(
-            """SELECT ak.id as api_key_id, ak.user_id, u.email 
+            """SELECT ak.id as api_key_id, ak.user_id, u.email,
+                      COALESCE(us.plan_type, 'free') as plan_type,
+                      COALESCE(us.daily_limit, 100) as daily_limit
                FROM api_keys ak 
                JOIN users u ON ak.user_id = u.id 
+               LEFT JOIN user_subscriptions us ON us.user_id = u.id
                WHERE ak.api_key = %s AND ak.is_active = TRUE AND u.is_verified = TRUE""",
             (api_key,),
             fetch=True
         )
-        return result[0] if result else None
+        return dict(result[0]) if result else None
+    
+    @staticmethod
+    def validate_api_key(api_key):
+        """Validate API key and return user info (cached, see src/key_cache.py)"""
+        return _key_cache.get_or_load(api_key, AuthManager._load_api_key)
     
     @staticmethod
     def log_api_usage(api_key_id, endpoint, status_code):
-        """Log API usage"""
-        execute_query(
-            "INSERT INTO usage_logs (api_key_id, endpoint, status_code) VALUES (%s, %s, %s)",
-            (api_key_id, endpoint, status_code)
-        )
-        
-        # Update daily usage
-        today = datetime.now().date()
-        execute_query(
-            """INSERT INTO daily_usage (api_key_id, date, request_count) 
-               VALUES (%s, %s, 1) 
-               ON CONFLICT (api_key_id, date) 
-               DO UPDATE SET request_count = daily_usage.request_count + 1""",
-            (api_key_id, today)
-        )
+        """Log API usage (queued; written in batches by src/usage_writer.py)"""
+        record_usage(api_key_id, endpoint, status_code)
     
     @staticmethod
     def get_usage_stats(user_id):
-        """Get usage statistics for a user"""
-        # Total requests
-        total_requests = execute_query(
-            """SELECT COUNT(*) as count FROM usage_logs ul 
-               JOIN api_keys ak ON ul.api_key_id = ak.id 
+        """Get usage statistics for a user (from the daily_usage and usage_hourly rollups)"""
+        # Total and this month's requests in one pass over the user's days
+        this_month_start = datetime.now().date().replace(day=1)
+        totals = execute_query(
+            """SELECT COALESCE(SUM(du.request_count), 0) as total_requests,
+                      COALESCE(SUM(du.request_count) FILTER (WHERE du.date >= %s), 0) as this_month_requests
+               FROM daily_usage du 
+               JOIN api_keys ak ON du.api_key_id = ak.id 
                WHERE ak.user_id = %s""",
-            (user_id,),
+            (this_month_start, user_id),
             fetch=True
-        )[0]['count']
-        
-        # This month requests
-        this_month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        this_month_requests = execute_query(
-            """SELECT COUNT(*) as count FROM usage_logs ul 
-               JOIN api_keys ak ON ul.api_key_id = ak.id 
-               WHERE ak.user_id = %s AND ul.timestamp >= %s""",
-            (user_id, this_month_start),
-            fetch=True
-        )[0]['count']
+        )[0]
+        total_requests = totals['total_requests']
+        this_month_requests = totals['this_month_requests']
         
         # API key count
         api_key_count = execute_query(
@@ -149,11 +176,11 @@ class AuthManager:
         
         # Last 24 hours usage for chart
         chart_data = execute_query(
-            """SELECT EXTRACT(HOUR FROM ul.timestamp) as hour, COUNT(*) as requests
-               FROM usage_logs ul 
-               JOIN api_keys ak ON ul.api_key_id = ak.id 
-               WHERE ak.user_id = %s AND ul.timestamp >= NOW() - INTERVAL '24 hours'
-               GROUP BY EXTRACT(HOUR FROM ul.timestamp)
+            """SELECT EXTRACT(HOUR FROM uh.hour) as hour, SUM(uh.request_count) as requests
+               FROM usage_hourly uh 
+               JOIN api_keys ak ON uh.api_key_id = ak.id 
+               WHERE ak.user_id = %s AND uh.hour >= date_trunc('hour', NOW() - INTERVAL '24 hours')
+               GROUP BY EXTRACT(HOUR FROM uh.hour)
                ORDER BY hour""",
             (user_id,),
             fetch=True
@@ -173,8 +200,11 @@ class AuthManager:
             "UPDATE api_keys SET is_active = FALSE WHERE id = %s AND user_id = %s",
             (api_key_id, user_id)
         )
+        # Other workers are told by the api_keys revocation trigger
+        evict_api_keys(api_key_ids=[api_key_id])
     
     @staticmethod
     def delete_user_account(user_id):
         """Permanently delete user account and all data"""
-        execute_query("DELETE FROM users WHERE id = %s", (user_id,))
\ No newline at end of file
+        execute_query("DELETE FROM users WHERE id = %s", (user_id,))
+        evict_api_keys(user_ids=[user_id])
\ No newline at end of file
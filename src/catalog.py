@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Catalog read helpers shared by the API apps
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.catalog_events import CatalogCache, catalog_version
+from src.database import execute_query
+from src.validator import MovieCSVValidator
+
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_person_name(name: str) -> str:
+    """Normalize an actor/director name for matching: trimmed, lowercased, single-spaced"""
+    return _WHITESPACE.sub(' ', name.strip()).lower()
+
+def get_catalog_stats() -> Dict:
+    """Return catalog totals and year range from the trigger-maintained summary row"""
+    result = execute_query("""
+        SELECT movies_total, genres_total, cast_total, min_year, max_year
+        FROM catalog_stats
+        WHERE id = 1
+    """, fetch=True)
+
+    if not result:
+        return {'movies_total': 0, 'genres_total': 0, 'cast_total': 0,
+                'min_year': None, 'max_year': None}
+    return dict(result[0])
+
+def refresh_catalog_stats() -> None:
+    """Recompute the summary row from scratch (repair after bulk loads that bypass triggers)"""
+    execute_query("SELECT refresh_catalog_stats()")
+
+def get_catalog_revision() -> int:
+    """Return the catalog revision (bumped by every committed catalog write)"""
+    result = execute_query("SELECT revision FROM catalog_stats WHERE id = 1", fetch=True)
+    return result[0]['revision'] if result else 0
+
+class ChangeFeedExpired(Exception):
+    """The requested change feed position has been purged; the client must resync"""
+    def __init__(self, message: str, purged_through: int, head_seq: int):
+        super().__init__(message)
+        self.purged_through = purged_through
+        self.head_seq = head_seq
+
+def get_catalog_changes_head() -> Dict:
+    """
+    Return the feed position: {'head_seq': last committed seq, 'purged_through': highest purged seq}
+    
+    A client resyncing from a full export reads head_seq first and then
+    follows the feed from there.
+    """
+    result = execute_query("""
+        SELECT COALESCE((SELECT MAX(seq) FROM catalog_changes), changes_purged_through) AS head_seq,
+               changes_purged_through AS purged_through
+        FROM catalog_stats
+        WHERE id = 1
+    """, fetch=True)
+    if not result:
+        return {'head_seq': 0, 'purged_through': 0}
+    return dict(result[0])
+
+def get_catalog_changes(since: int, limit: int = 500) -> Dict:
+    """
+    Read the change feed after a sequence number
+
+    Args:
+        since: Last seq the client has applied (0 starts from the oldest retained change)
+        limit: Maximum number of changes to return
+
+    Returns:
+        {'changes': [...], 'next_since': seq to pass next, 'has_more': bool,
+         'head_seq': last committed seq}
+
+    Raises:
+        ChangeFeedExpired: Changes after since have already been purged
+    """
+    rows = execute_query("""
+        SELECT seq, table_name, op, row_id, movie_id, row_data, changed_at
+        FROM catalog_changes
+        WHERE seq > %s
+        ORDER BY seq
+        LIMIT %s
+    """, (since, limit + 1), fetch=True)
+
+    # Checked after reading, so a purge that ran while reading is caught too.
+    # since=0 never expires: it means "from the oldest change still retained".
+    head = get_catalog_changes_head()
+    if 0 < since < head['purged_through']:
+        raise ChangeFeedExpired(
+            f"Changes up to seq {head['purged_through']} have been purged; resync from a full export",
+            head['purged_through'], head['head_seq']
+        )
+
+    changes = [dict(row) for row in rows[:limit]]
+    return {
+        'changes': changes,
+        'next_since': changes[-1]['seq'] if changes else since,
+        'has_more': len(rows) > limit,
+        'head_seq': head['head_seq']
+    }
+
+def purge_catalog_changes(retention_days: int) -> int:
+    """Delete change feed rows older than the retention window, returning how many were removed"""
+    result = execute_query("""
+        WITH purged AS (
+            DELETE FROM catalog_changes
+            WHERE changed_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+            RETURNING seq
+        ), watermark AS (
+            UPDATE catalog_stats
+            SET changes_purged_through = GREATEST(changes_purged_through, (SELECT MAX(seq) FROM purged))
+            WHERE id = 1 AND EXISTS (SELECT 1 FROM purged)
+        )
+        SELECT COUNT(*) AS purged FROM purged
+    """, (retention_days,), fetch=True)
+    return result[0]['purged']
+
+# Optional per-worker cache of movie documents, enabled by API workers that
+# listen for catalog changes (see enable_document_cache)
+_document_cache: Optional[CatalogCache] = None
+
+def enable_document_cache(cache: CatalogCache) -> None:
+    """Serve movie documents through cache; only safe once the catalog listener is running"""
+    global _document_cache
+    _document_cache = cache
+
+def get_movie_document(movie_id: int) -> Optional[str]:
+    """Return the precomputed JSON document for a movie, or None if it doesn't exist"""
+    return get_movie_documents_by_id([movie_id]).get(movie_id)
+
+def get_movie_documents_by_id(movie_ids: Iterable[int]) -> Dict[int, str]:
+    """Fetch precomputed JSON documents for several movies in one indexed read"""
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return {}
+
+    cache = _document_cache
+    documents = {}
+    if cache is not None:
+        for movie_id in movie_ids:
+            document = cache.get(('document', movie_id))
+            if document is not None:
+                documents[movie_id] = document
+        movie_ids = [movie_id for movie_id in movie_ids if movie_id not in documents]
+        if not movie_ids:
+            return documents
+
+    version = catalog_version()
+    rows = execute_query(
+        "SELECT movie_id, document::text AS document FROM movie_documents WHERE movie_id = ANY(%s)",
+        (movie_ids,), fetch=True
+    )
+    # Don't cache documents that may predate a change seen while reading
+    store = cache is not None and catalog_version() == version
+    for row in rows:
+        documents[row['movie_id']] = row['document']
+        if store:
+            cache.set(('document', row['movie_id']), row['document'], [row['movie_id']])
+    return documents
+
+def warm_movie_documents(movie_ids: Iterable[int]) -> None:
+    """Load documents for the given movies into the document cache ahead of requests"""
+    if _document_cache is not None:
+        get_movie_documents_by_id(movie_ids)
+
+def get_movie_documents(movie_ids: Iterable[int]) -> Tuple[List[str], List[int]]:
+    """
+    Fetch precomputed JSON documents for several movies in one indexed read
+
+    Returns:
+        (documents in the requested order, IDs that were not found)
+    """
+    movie_ids = list(dict.fromkeys(movie_ids))
+    by_id = get_movie_documents_by_id(movie_ids)
+
+    documents = [by_id[movie_id] for movie_id in movie_ids if movie_id in by_id]
+    missing = [movie_id for movie_id in movie_ids if movie_id not in by_id]
+    return documents, missing
+
+def rebuild_movie_documents() -> None:
+    """Rebuild every movie document (initial backfill for an existing catalog)"""
+    execute_query("SELECT refresh_movie_documents(ARRAY(SELECT id FROM movies))")
+
+# Shared by the filmography queries: movie columns plus genres aggregated per row
+_FILMOGRAPHY_COLUMNS = """
+    m.id, m.title, m.year, m.runtime, m.rating, m.director, m.plot, m.poster_url,
+    COALESCE(g.genres, ARRAY[]::VARCHAR[]) AS genres
+"""
+_FILMOGRAPHY_GENRES_JOIN = """
+    LEFT JOIN LATERAL (
+        SELECT array_agg(mg.genre ORDER BY mg.genre) AS genres
+        FROM movie_genres mg
+        WHERE mg.movie_id = m.id
+    ) g ON TRUE
+"""
+
+def _keyset_page(rows: List[Dict], limit: int) -> Tuple[List[Dict], Optional[int]]:
+    """Split limit + 1 rows into (page, cursor for the next page or None)"""
+    movies = [dict(row) for row in rows[:limit]]
+    next_cursor = movies[-1]['id'] if len(rows) > limit else None
+    return movies, next_cursor
+
+def get_actor_movies(name: str, after: int = 0, limit: int = 20) -> Tuple[List[Dict], Optional[int]]:
+    """
+    Movies featuring an actor, ordered by movie ID, one keyset page at a time
+
+    Args:
+        name: Actor name (matched case- and whitespace-insensitively)
+        after: Cursor from the previous page (last movie ID seen)
+        limit: Page size
+
+    Returns:
+        (movies with their roles and genres, cursor for the next page or None)
+    """
+    rows = execute_query(f"""
+        WITH page AS (
+            SELECT movie_id,
+                   array_agg(role ORDER BY role) FILTER (WHERE role IS NOT NULL) AS roles
+            FROM movie_cast
+            WHERE actor_key = %s AND movie_id > %s
+            GROUP BY movie_id
+            ORDER BY movie_id
+            LIMIT %s
+        )
+        SELECT {_FILMOGRAPHY_COLUMNS},
+               COALESCE(p.roles, ARRAY[]::VARCHAR[]) AS roles
+        FROM page p
+        JOIN movies m ON m.id = p.movie_id
+        {_FILMOGRAPHY_GENRES_JOIN}
+        ORDER BY m.id
+    """, (normalize_person_name(name), after, limit + 1), fetch=True)
+    return _keyset_page(rows, limit)
+
+def get_director_movies(name: str, after: int = 0, limit: int = 20) -> Tuple[List[Dict], Optional[int]]:
+    """Movies by a director, ordered by movie ID, one keyset page at a time (see get_actor_movies)"""
+    rows = execute_query(f"""
+        SELECT {_FILMOGRAPHY_COLUMNS}
+        FROM movies m
+        {_FILMOGRAPHY_GENRES_JOIN}
+        WHERE m.director_key = %s AND m.id > %s
+        ORDER BY m.id
+        LIMIT %s
+    """, (normalize_person_name(name), after, limit + 1), fetch=True)
+    return _keyset_page(rows, limit)
+
+def parse_movie_ids(raw: str, max_ids: int = 100) -> List[int]:
+    """Parse a comma-separated ?ids= parameter, raising ValueError on bad input"""
+    movie_ids = [int(part) for part in raw.split(',') if part.strip()]
+    if not movie_ids:
+        raise ValueError("At least one movie ID is required")
+    if len(movie_ids) > max_ids:
+        raise ValueError(f"At most {max_ids} movie IDs per request")
+    return movie_ids
+
+def parse_genre_filter(args) -> Tuple[List[str], bool]:
+    """
+    Read the genre filter from request args: ?genres=A,B&genre_match=all|any
+    (or the single-genre ?genre=), raising ValueError on a bad genre_match
+
+    Returns:
+        (genres, True if every genre must match)
+    """
+    genres = [part.strip() for part in args.get('genres', '').split(',') if part.strip()]
+    if args.get('genre'):
+        genres.append(args['genre'])
+
+    match = args.get('genre_match', 'all')
+    if match not in ('all', 'any'):
+        raise ValueError("genre_match must be 'all' or 'any'")
+    return list(dict.fromkeys(genres)), match == 'all'
+
+def genre_filter_sql(genres: List[str], match_all: bool = True, alias: str = 'm') -> Tuple[str, List]:
+    """
+    Build a join-free WHERE predicate for a genre filter on movies
+
+    Genres in the bitmask vocabulary are tested against genre_mask; any other
+    genre (e.g. added through the admin API) falls back to an EXISTS lookup.
+    """
+    mask = 0
+    clauses = []
+    params: List = []
+    for genre in genres:
+        bit = MovieCSVValidator.GENRE_BITS.get(genre)
+        if bit is None:
+            clauses.append(
+                f"EXISTS (SELECT 1 FROM movie_genres mg WHERE mg.movie_id = {alias}.id AND mg.genre = %s)"
+            )
+            params.append(genre)
+        else:
+            mask |= bit
+
+    if mask and match_all:
+        clauses.insert(0, f"({alias}.genre_mask & %s) = %s")
+        params[0:0] = [mask, mask]
+    elif mask:
+        clauses.insert(0, f"({alias}.genre_mask & %s) <> 0")
+        params.insert(0, mask)
+
+    return "(" + (" AND " if match_all else " OR ").join(clauses) + ")", params
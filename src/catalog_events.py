@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Catalog change events
+Translates the 'catalog_changes' NOTIFY payloads emitted by the catalog table
+triggers into a catalog version bump and targeted cache invalidations
+"""
+
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from src.notifications import get_listener
+
+CATALOG_CHANNEL = 'catalog_changes'
+
+# Subscribers receive the set of changed movie IDs, or None when every movie
+# may have changed (e.g. notifications were lost while reconnecting)
+CatalogCallback = Callable[[Optional[Set[int]]], None]
+
+_version = 0
+_version_lock = threading.Lock()
+_subscribers: List[CatalogCallback] = []
+_started = False
+_start_lock = threading.Lock()
+
+def catalog_version() -> int:
+    """Monotonic counter bumped on every batch of catalog changes seen by this worker"""
+    return _version
+
+def subscribe(callback: CatalogCallback) -> None:
+    """Register a callback for catalog changes"""
+    _subscribers.append(callback)
+
+def unsubscribe(callback: CatalogCallback) -> None:
+    """Remove a callback registered with subscribe"""
+    try:
+        _subscribers.remove(callback)
+    except ValueError:
+        pass
+
+def publish(movie_ids: Optional[Set[int]]) -> None:
+    """Bump the catalog version and notify every subscriber"""
+    global _version
+    with _version_lock:
+        _version += 1
+
+    for callback in list(_subscribers):
+        try:
+            callback(movie_ids)
+        except Exception as e:
+            print(f"Catalog change subscriber error: {e}")
+
+def _handle_payloads(payloads: List[str]) -> None:
+    """Collapse one poll's worth of NOTIFY payloads into a single publish"""
+    movie_ids = set()
+    for payload in payloads:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            # Unknown payload format: be safe and drop everything
+            publish(None)
+            return
+        if event.get('movie_id') is not None:
+            movie_ids.add(int(event['movie_id']))
+
+    if movie_ids:
+        publish(movie_ids)
+
+def start_catalog_listener() -> None:
+    """Start listening for catalog changes in this worker (idempotent)"""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        get_listener().subscribe(
+            CATALOG_CHANNEL,
+            _handle_payloads,
+            on_reconnect=lambda: publish(None)
+        )
+        _started = True
+
+class CatalogUpdater:
+    """
+    Applies catalog changes to an in-memory structure on its own thread
+
+    The listener thread only queues the changed movie IDs; a worker thread
+    applies them, merging whatever arrived meanwhile into one update. Changes
+    that arrive while the initial build runs are queued too and applied right
+    after it, so they aren't overwritten by the build's older read.
+    """
+
+    def __init__(self, apply: CatalogCallback, name: str):
+        self._apply = apply
+        self._name = name
+        # Movie IDs waiting to be applied; None means everything
+        self._pending: Optional[Set[int]] = set()
+        self._running = False
+        self._lock = threading.Lock()
+
+    def start(self, build: Callable[[], None]) -> None:
+        """Subscribe, run the initial build on this thread, then apply changes seen during it"""
+        with self._lock:
+            self._running = True
+        subscribe(self.queue)
+        try:
+            build()
+        except Exception:
+            unsubscribe(self.queue)
+            raise
+        self._drain()
+
+    def queue(self, movie_ids: Optional[Set[int]]) -> None:
+        """Catalog subscriber: record the change and wake the worker"""
+        with self._lock:
+            if movie_ids is None:
+                self._pending = None
+            elif self._pending is not None:
+                self._pending |= movie_ids
+            if self._running:
+                return
+            self._running = True
+        threading.Thread(target=self._drain, name=self._name, daemon=True).start()
+
+    def _drain(self) -> None:
+        """Apply queued changes until none are left"""
+        while True:
+            with self._lock:
+                movie_ids, self._pending = self._pending, set()
+                # Cleared under the lock so a change queued right after this
+                # check finds the worker stopped and starts a new one
+                if movie_ids is not None and not movie_ids:
+                    self._running = False
+                    return
+            try:
+                self._apply(movie_ids)
+            except Exception as e:
+                print(f"Catalog update error in {self._name}: {e}")
+
+class CatalogCache:
+    """
+    TTL cache for catalog-derived values, invalidated by catalog changes
+
+    Entries tagged with movie IDs are dropped when one of those movies changes;
+    untagged entries depend on the whole catalog and are dropped on any change.
+    Since invalidation is push-based, TTLs can be long.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Any, tuple] = {}
+        self._by_movie: Dict[int, Set[Any]] = {}
+        self._untagged: Set[Any] = set()
+        self._lock = threading.Lock()
+        subscribe(self.invalidate)
+
+    def get(self, key: Any) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            return value
+
+    def set(self, key: Any, value: Any, movie_ids: Optional[Iterable[int]] = None) -> None:
+        """Store a value; movie_ids narrows which changes invalidate it"""
+        tags = frozenset(movie_ids) if movie_ids is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            elif len(self._entries) >= self.max_entries:
+                # Drop the oldest entry (dicts keep insertion order)
+                self._remove(next(iter(self._entries)))
+
+            self._entries[key] = (value, time.monotonic() + self.ttl, tags)
+            if tags is None:
+                self._untagged.add(key)
+            for movie_id in tags or ():
+                self._by_movie.setdefault(movie_id, set()).add(key)
+
+    def get_or_set(self, key: Any, loader: Callable[[], Any],
+                   movie_ids: Optional[Iterable[int]] = None) -> Any:
+        """Return the cached value, computing and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            version = catalog_version()
+            value = loader()
+            # Don't store a value that may predate a change seen while loading
+            if catalog_version() == version:
+                self.set(key, value, movie_ids)
+        return value
+
+    def invalidate(self, movie_ids: Optional[Set[int]] = None) -> None:
+        """Drop entries affected by a change to movie_ids (None drops everything)"""
+        with self._lock:
+            if movie_ids is None:
+                self._entries.clear()
+                self._by_movie.clear()
+                self._untagged.clear()
+                return
+
+            stale = list(self._untagged)
+            for movie_id in movie_ids:
+                stale.extend(self._by_movie.get(movie_id, ()))
+            for key in stale:
+                self._remove(key)
+
+    def _remove(self, key: Any) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._untagged.discard(key)
+        for movie_id in entry[2] or ():
+            keys = self._by_movie.get(movie_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_movie[movie_id]
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+In-process columnar catalog snapshot
+Optional (CATALOG_SNAPSHOT=1). Holds the movie list in NumPy arrays, stored in
+the /api/movies sort order, so genre/year filters, counts and pagination are
+array operations instead of Postgres queries. A rebuilt snapshot is swapped in
+whole once it matches the current catalog version; until then requests fall
+back to SQL. Snapshots are also written to a memory-mapped file (see
+snapshot_file.py) that other workers map instead of rebuilding.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from src.database import execute_query
+from src.catalog import get_catalog_revision
+from src.catalog_events import catalog_version, subscribe
+from src.validator import MovieCSVValidator
+from src.snapshot_file import SnapshotFile, encode_strings, open_snapshot_file, snapshot_path, write_snapshot_file
+
+SNAPSHOT_ENABLED = os.getenv('CATALOG_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+
+GENRE_BITS = MovieCSVValidator.GENRE_BITS
+GENRE_BIT_ORDER = MovieCSVValidator.GENRE_BIT_ORDER
+
+def intern_strings(values: Iterable[Optional[str]]) -> Tuple[np.ndarray, List[str]]:
+    """Encode strings as int32 codes into a table of distinct values (None -> -1)"""
+    table: Dict[str, int] = {}
+    codes = [-1 if value is None else table.setdefault(value, len(table)) for value in values]
+    return np.asarray(codes, dtype=np.int32), list(table)
+
+class CatalogSnapshot:
+    """One immutable columnar copy of the catalog, rows ordered by year DESC, title"""
+
+    # Array columns, and string tables (lists in memory, StringTables when mapped)
+    ARRAYS = ('ids', 'year', 'runtime', 'rating', 'genre_mask', 'title_codes',
+              'director_codes', 'cast_codes', 'cast_indptr')
+    STRINGS = ('titles', 'directors', 'actors', 'plots', 'poster_urls')
+
+    def __init__(self, version: int, columns: Dict[str, Any], extra_genres: Dict[int, List[str]]):
+        self.version = version
+        for name in self.ARRAYS + self.STRINGS:
+            setattr(self, name, columns[name])
+        # Genres outside the bitmask vocabulary, by row; they render normally
+        # but filters on them go to SQL
+        self.extra_genres = extra_genres
+
+    @classmethod
+    def from_rows(cls, version: int, movies: List[Dict], extra_genres: List[Dict],
+                  cast: List[Dict]) -> 'CatalogSnapshot':
+        """Build a snapshot from catalog query results"""
+        count = len(movies)
+        columns: Dict[str, Any] = {
+            'ids': np.fromiter((m['id'] for m in movies), dtype=np.int64, count=count),
+            'year': np.fromiter((m['year'] for m in movies), dtype=np.int32, count=count),
+            'runtime': np.fromiter((m['runtime'] for m in movies), dtype=np.int32, count=count),
+            'rating': np.fromiter(
+                (np.nan if m['rating'] is None else float(m['rating']) for m in movies),
+                dtype=np.float64, count=count
+            ),
+            'genre_mask': np.fromiter((m['genre_mask'] for m in movies), dtype=np.int32, count=count),
+            'plots': [m['plot'] for m in movies],
+            'poster_urls': [m['poster_url'] for m in movies]
+        }
+        columns['title_codes'], columns['titles'] = intern_strings(m['title'] for m in movies)
+        columns['director_codes'], columns['directors'] = intern_strings(m['director'] for m in movies)
+        row_of = {movie_id: row for row, movie_id in enumerate(columns['ids'].tolist())}
+
+        extra: Dict[int, List[str]] = {}
+        for row in extra_genres:
+            position = row_of.get(row['movie_id'])
+            if position is not None:
+                extra.setdefault(position, []).append(row['genre'])
+
+        # Cast as CSR: names of row r are actors[cast_codes[cast_indptr[r]:cast_indptr[r + 1]]]
+        cast = [row for row in cast if row['movie_id'] in row_of]
+        cast_rows = np.fromiter((row_of[row['movie_id']] for row in cast), dtype=np.int64, count=len(cast))
+        actor_codes, columns['actors'] = intern_strings(row['actor_name'] for row in cast)
+        columns['cast_codes'] = actor_codes[np.argsort(cast_rows, kind='stable')]
+        columns['cast_indptr'] = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cast_rows, minlength=count), out=columns['cast_indptr'][1:])
+
+        return cls(version, columns, extra)
+
+    @classmethod
+    def from_file(cls, version: int, snapshot_file: SnapshotFile) -> 'CatalogSnapshot':
+        """Use a mapped snapshot file in place"""
+        columns: Dict[str, Any] = {name: snapshot_file.array(name) for name in cls.ARRAYS}
+        for name in cls.STRINGS:
+            columns[name] = snapshot_file.strings(name)
+        extra = {int(row): genres for row, genres in snapshot_file.meta['extra_genres'].items()}
+        return cls(version, columns, extra)
+
+    def save(self, revision: int) -> None:
+        """Write this snapshot to its file, labelled with the catalog revision it reflects"""
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        for name in self.STRINGS:
+            arrays.update(encode_strings(name, list(getattr(self, name))))
+        write_snapshot_file(snapshot_path('catalog'), arrays, {
+            'revision': revision,
+            'extra_genres': {str(row): genres for row, genres in self.extra_genres.items()}
+        })
+
+    def query(self, genres: Optional[List[str]] = None, match_all: bool = True,
+              year: Optional[int] = None, offset: int = 0,
+              limit: int = 20) -> Optional[Tuple[List[Dict], int]]:
+        """
+        Filter and paginate the movie list
+
+        Returns:
+            (page of movies, total matches), or None if the snapshot can't
+            answer the request and the caller should use SQL
+        """
+        if offset < 0 or limit < 0:
+            return None
+
+        selected = None
+        if genres:
+            if any(genre not in GENRE_BITS for genre in genres):
+                return None
+            mask = 0
+            for genre in genres:
+                mask |= GENRE_BITS[genre]
+            if match_all:
+                selected = (self.genre_mask & mask) == mask
+            else:
+                selected = (self.genre_mask & mask) != 0
+        if year is not None:
+            matches_year = self.year == year
+            selected = matches_year if selected is None else selected & matches_year
+
+        if selected is None:
+            total = len(self.ids)
+            page = np.arange(offset, min(offset + limit, total))
+        else:
+            positions = np.flatnonzero(selected)
+            total = len(positions)
+            page = positions[offset:offset + limit]
+
+        return [self.movie(int(row)) for row in page], total
+
+    def movie(self, row: int) -> Dict:
+        """Materialize one row in the shape /api/movies returns"""
+        rating = self.rating[row]
+        director = self.director_codes[row]
+        start, end = self.cast_indptr[row], self.cast_indptr[row + 1]
+        return {
+            'id': int(self.ids[row]),
+            'title': self.titles[self.title_codes[row]],
+            'year': int(self.year[row]),
+            'runtime': int(self.runtime[row]),
+            'rating': None if np.isnan(rating) else float(rating),
+            'director': None if director < 0 else self.directors[director],
+            'plot': self.plots[row],
+            'poster_url': self.poster_urls[row],
+            'genres': self.genres(row),
+            'cast': [self.actors[code] for code in self.cast_codes[start:end]]
+        }
+
+    def genres(self, row: int) -> List[str]:
+        mask = int(self.genre_mask[row])
+        genres = [genre for genre in GENRE_BIT_ORDER if mask & GENRE_BITS[genre]]
+        if row in self.extra_genres:
+            genres = sorted(genres + self.extra_genres[row])
+        return genres
+
+def load_snapshot(version: int) -> CatalogSnapshot:
+    """Read the catalog tables into a new snapshot"""
+    movies = execute_query("""
+        SELECT id, title, year, runtime, rating, director, plot, poster_url, genre_mask
+        FROM movies
+        ORDER BY year DESC, title
+    """, fetch=True)
+    extra_genres = execute_query(
+        "SELECT movie_id, genre FROM movie_genres WHERE genre NOT IN (SELECT genre FROM genre_bits)",
+        fetch=True
+    )
+    cast = execute_query(
+        "SELECT movie_id, actor_name FROM movie_cast ORDER BY movie_id, actor_name",
+        fetch=True
+    )
+    return CatalogSnapshot.from_rows(version, movies, extra_genres, cast)
+
+_current: Optional[CatalogSnapshot] = None
+_rebuilding = False
+_rebuild_lock = threading.Lock()
+_subscribed = False
+
+def _load_or_build(version: int) -> CatalogSnapshot:
+    """Map the snapshot file if it matches the catalog revision, else build from Postgres and save it"""
+    # Read before the catalog itself, so the label can only understate what the snapshot contains
+    revision = get_catalog_revision()
+    snapshot_file = open_snapshot_file('catalog', revision)
+    if snapshot_file is not None:
+        return CatalogSnapshot.from_file(version, snapshot_file)
+
+    snapshot = load_snapshot(version)
+    try:
+        snapshot.save(revision)
+    except OSError as e:
+        print(f"Could not write catalog snapshot file: {e}")
+    return snapshot
+
+def _rebuild() -> None:
+    """Build snapshots until one matches the catalog version, swapping each in"""
+    global _current, _rebuilding
+    try:
+        while True:
+            version = catalog_version()
+            _current = _load_or_build(version)
+            # Checked under the lock so a change published right after this
+            # check finds _rebuilding cleared and schedules its own rebuild
+            with _rebuild_lock:
+                if catalog_version() == version:
+                    _rebuilding = False
+                    return
+    except Exception as e:
+        print(f"Catalog snapshot rebuild failed: {e}")
+        with _rebuild_lock:
+            _rebuilding = False
+
+def schedule_rebuild(movie_ids=None) -> None:
+    """Start a background rebuild unless one is already running"""
+    global _rebuilding
+    with _rebuild_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_rebuild, name='catalog-snapshot-build', daemon=True).start()
+
+def get_catalog_snapshot() -> Optional[CatalogSnapshot]:
+    """
+    Return the snapshot if it is enabled and current, otherwise None
+
+    A stale or missing snapshot schedules a rebuild; callers use SQL meanwhile.
+    """
+    if not SNAPSHOT_ENABLED:
+        return None
+    snapshot = _current
+    if snapshot is not None and snapshot.version == catalog_version():
+        return snapshot
+    schedule_rebuild()
+    return None
+
+def start_catalog_snapshot() -> None:
+    """Build the snapshot at startup and rebuild it whenever the catalog changes"""
+    global _subscribed
+    if not SNAPSHOT_ENABLED:
+        return
+    with _rebuild_lock:
+        if not _subscribed:
+            subscribe(schedule_rebuild)
+            _subscribed = True
+    schedule_rebuild()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+HTTP response compression
+Negotiates gzip/brotli from Accept-Encoding and compresses responses above a
+minimum size; brotli is used only when the optional 'brotli' package is installed
+"""
+
+import gzip
+import os
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Bodies smaller than this aren't worth the CPU or the header overhead
+MIN_COMPRESS_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'application/xml',
+    'image/svg+xml', 'text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml'
+}
+
+# Preferred order when the client accepts several encodings equally
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header, or None for identity"""
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+
+    best = None
+    best_quality = 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress(body: bytes, encoding: str, precompress: bool = False) -> bytes:
+    """
+    Compress body with the given encoding
+
+    Args:
+        precompress: Use a slower, denser setting for bodies that are
+            compressed once and then served many times from cache
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=9 if precompress else 4)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9 if precompress else 6, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+def is_compressible(response) -> bool:
+    """True if the response is a candidate for compression"""
+    return (
+        response.mimetype in COMPRESSIBLE_MIMETYPES
+        and 200 <= response.status_code < 300
+        and response.status_code != 204
+        and not response.direct_passthrough
+        and not response.is_streamed
+        and 'Content-Encoding' not in response.headers
+    )
+
+def init_compression(app) -> None:
+    """Register an after_request hook that compresses eligible responses"""
+    from flask import request
+
+    @app.after_request
+    def compress_response(response):
+        if not is_compressible(response):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        body = response.get_data()
+        if len(body) < MIN_COMPRESS_SIZE:
+            return response
+
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
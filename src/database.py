@@ -14,18 +14,22 @@ PGUSER = os.getenv('PGUSER')
 PGPASSWORD = os.getenv('PGPASSWORD')
 PGDATABASE = os.getenv('PGDATABASE')
 
+def open_connection():
+    """Open a new database connection (caller is responsible for closing it)"""
+    return psycopg2.connect(
+        host=PGHOST,
+        port=PGPORT,
+        user=PGUSER,
+        password=PGPASSWORD,
+        database=PGDATABASE
+    )
+
 @contextmanager
 def get_db_connection():
     """Context manager for database connections"""
     conn = None
     try:
-        conn = psycopg2.connect(
-            host=PGHOST,
-            port=PGPORT,
-            user=PGUSER,
-            password=PGPASSWORD,
-            database=PGDATABASE
-        )
+        conn = open_connection()
         yield conn
     except Exception as e:
         if conn:
@@ -70,10 +74,17 @@ def create_schema():
     
     # Drop tables if they exist (for clean setup)
     drop_tables_sql = """
+    DROP TABLE IF EXISTS popularity_sketches CASCADE;
+    DROP TABLE IF EXISTS catalog_changes CASCADE;
+    DROP TABLE IF EXISTS movie_documents CASCADE;
+    DROP TABLE IF EXISTS genre_bits CASCADE;
+    DROP TABLE IF EXISTS catalog_stats CASCADE;
     DROP TABLE IF EXISTS rate_limits CASCADE;
     DROP TABLE IF EXISTS user_subscriptions CASCADE;
+    DROP TABLE IF EXISTS usage_hourly CASCADE;
     DROP TABLE IF EXISTS daily_usage CASCADE;
     DROP TABLE IF EXISTS usage_logs CASCADE;
+    DROP TABLE IF EXISTS endpoints CASCADE;
     DROP TABLE IF EXISTS api_keys CASCADE;
     DROP TABLE IF EXISTS email_verifications CASCADE;
     DROP TABLE IF EXISTS movie_cast CASCADE;
@@ -122,6 +133,10 @@ def create_schema():
         director VARCHAR(255),
         plot TEXT,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        -- Normalized director name for indexed lookups (see catalog.normalize_person_name)
+        director_key VARCHAR(255) GENERATED ALWAYS AS (lower(regexp_replace(btrim(director), '\\s+', ' ', 'g'))) STORED,
+        -- Bitmask of the movie's genres (see genre_bits), maintained by triggers on movie_genres
+        genre_mask INTEGER NOT NULL DEFAULT 0,
         UNIQUE(title, year)
     );
     
@@ -133,24 +148,40 @@ def create_schema():
         UNIQUE(movie_id, genre)
     );
     
+    -- Bit position of each genre in movies.genre_mask
+    CREATE TABLE genre_bits (
+        genre VARCHAR(100) PRIMARY KEY,
+        bit SMALLINT UNIQUE NOT NULL CHECK (bit BETWEEN 0 AND 30)
+    );
+    
     -- Movie cast table (many-to-many)
     CREATE TABLE movie_cast (
         id SERIAL PRIMARY KEY,
         movie_id INTEGER REFERENCES movies(id) ON DELETE CASCADE,
         actor_name VARCHAR(255) NOT NULL,
         role VARCHAR(255),
+        -- Normalized actor name for indexed lookups (see catalog.normalize_person_name)
+        actor_key VARCHAR(255) GENERATED ALWAYS AS (lower(regexp_replace(btrim(actor_name), '\\s+', ' ', 'g'))) STORED,
         UNIQUE(movie_id, actor_name, role)
     );
     
     -- Usage logs table (stub for Phase 3)
-    CREATE TABLE usage_logs (
-        id SERIAL PRIMARY KEY,
-        api_key_id INTEGER REFERENCES api_keys(id) ON DELETE CASCADE,
-        endpoint VARCHAR(255) NOT NULL,
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        status_code INTEGER NOT NULL
+    -- Endpoint names referenced by usage_logs (dictionary encoding)
+    CREATE TABLE endpoints (
+        id SMALLSERIAL PRIMARY KEY,
+        name VARCHAR(255) UNIQUE NOT NULL
     );
     
+    -- One row per request, range partitioned by month (usage_logs_YYYY_MM);
+    -- partitions are created ahead and dropped after the retention period by
+    -- ensure_usage_log_partitions / drop_usage_log_partitions below
+    CREATE TABLE usage_logs (
+        api_key_id INTEGER NOT NULL REFERENCES api_keys(id) ON DELETE CASCADE,
+        endpoint_id SMALLINT NOT NULL REFERENCES endpoints(id),
+        timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        status_code SMALLINT NOT NULL
+    ) PARTITION BY RANGE (timestamp);
+    
     -- Daily usage table (stub for Phase 3)
     CREATE TABLE daily_usage (
         id SERIAL PRIMARY KEY,
@@ -160,6 +191,15 @@ def create_schema():
         UNIQUE(api_key_id, date)
     );
 
+    -- Requests per key and hour, maintained by the usage writer with each
+    -- usage_logs batch (daily_usage is the per-day rollup)
+    CREATE TABLE usage_hourly (
+        api_key_id INTEGER NOT NULL REFERENCES api_keys(id) ON DELETE CASCADE,
+        hour TIMESTAMP NOT NULL,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (api_key_id, hour)
+    );
+
     -- User subscriptions table for plan management
     CREATE TABLE user_subscriptions (
         id SERIAL PRIMARY KEY,
@@ -171,29 +211,525 @@ def create_schema():
     );
 
     -- Rate limiting table for general rate limiting
+    -- Attempt counters per identifier, action and time bucket (unix time of
+    -- the bucket start); a sliding window sums the buckets it covers
     CREATE TABLE rate_limits (
-        id SERIAL PRIMARY KEY,
         identifier VARCHAR(255) NOT NULL,
         action VARCHAR(100) NOT NULL,
-        timestamp INTEGER NOT NULL
+        window_bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (identifier, action, window_bucket)
+    );
+    
+    -- Catalog summary row maintained by triggers (single row, id = 1)
+    CREATE TABLE catalog_stats (
+        id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        movies_total BIGINT NOT NULL DEFAULT 0,
+        genres_total BIGINT NOT NULL DEFAULT 0,
+        cast_total BIGINT NOT NULL DEFAULT 0,
+        min_year INTEGER,
+        max_year INTEGER,
+        -- Bumped in the same transaction as every catalog write, so it labels
+        -- exactly which committed catalog state a snapshot was built from
+        revision BIGINT NOT NULL DEFAULT 0,
+        -- Highest catalog_changes.seq removed by retention; older cursors must resync
+        changes_purged_through BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO catalog_stats (id) VALUES (1);
+    
+    -- Change feed: one row per insert/update/delete on movies, movie_genres and
+    -- movie_cast, in commit order (see record_catalog_change)
+    CREATE TABLE catalog_changes (
+        seq BIGSERIAL PRIMARY KEY,
+        table_name VARCHAR(20) NOT NULL,
+        op VARCHAR(6) NOT NULL,
+        row_id INTEGER NOT NULL,
+        movie_id INTEGER,
+        row_data JSONB NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    -- Ready-to-serve movie detail documents (movie row + genres + cast)
+    CREATE TABLE movie_documents (
+        movie_id INTEGER PRIMARY KEY REFERENCES movies(id) ON DELETE CASCADE,
+        document JSONB NOT NULL,
+        refreshed_xid BIGINT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    -- Per-worker movie popularity sketches (zlib-compressed float32 count-min
+    -- counters in forward-decay units relative to landmark, a Unix timestamp)
+    CREATE TABLE popularity_sketches (
+        worker_id VARCHAR(255) PRIMARY KEY,
+        landmark DOUBLE PRECISION NOT NULL,
+        counts BYTEA NOT NULL,
+        candidates INTEGER[] NOT NULL DEFAULT '{}',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
     
     -- Create indexes for performance
     CREATE INDEX idx_movies_year ON movies(year);
     CREATE INDEX idx_movies_title ON movies(title);
+    CREATE INDEX idx_movies_year_title ON movies(year DESC, title);
     CREATE INDEX idx_movie_genres_movie_id ON movie_genres(movie_id);
     CREATE INDEX idx_movie_cast_movie_id ON movie_cast(movie_id);
-    CREATE INDEX idx_usage_logs_timestamp ON usage_logs(timestamp);
+    CREATE INDEX idx_movie_cast_actor_key ON movie_cast(actor_key, movie_id) INCLUDE (role);
+    CREATE INDEX idx_movies_director_key ON movies(director_key, id);
+    CREATE INDEX idx_catalog_changes_changed_at ON catalog_changes(changed_at);
+    -- Rows arrive in time order, so a BRIN index is enough to skip old ranges
+    CREATE INDEX idx_usage_logs_timestamp ON usage_logs USING BRIN (timestamp);
+    CREATE INDEX idx_usage_logs_api_key_id ON usage_logs(api_key_id);
     CREATE INDEX idx_daily_usage_date ON daily_usage(date);
+    CREATE INDEX idx_usage_hourly_hour ON usage_hourly(hour);
     CREATE INDEX idx_user_subscriptions_user_id ON user_subscriptions(user_id);
-    CREATE INDEX idx_rate_limits_identifier_action ON rate_limits(identifier, action);
-    CREATE INDEX idx_rate_limits_timestamp ON rate_limits(timestamp);
+    CREATE INDEX idx_rate_limits_window_bucket ON rate_limits(window_bucket);
+    """
+    
+    # Catalog change notifications: every write to the catalog tables emits a
+    # NOTIFY on 'catalog_changes' carrying the affected movie ID, so API workers
+    # can invalidate their caches (see src/catalog_events.py). Identical payloads
+    # within one transaction are collapsed by Postgres. The same writes are also
+    # recorded in the catalog_changes table for /api/changes consumers.
+    create_triggers_sql = """
+    CREATE OR REPLACE FUNCTION notify_catalog_change() RETURNS TRIGGER AS $$
+    DECLARE
+        affected_id INTEGER;
+    BEGIN
+        IF TG_TABLE_NAME = 'movies' THEN
+            affected_id := CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END;
+        ELSE
+            affected_id := CASE WHEN TG_OP = 'DELETE' THEN OLD.movie_id ELSE NEW.movie_id END;
+        END IF;
+        
+        PERFORM pg_notify('catalog_changes', json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'movie_id', affected_id
+        )::text);
+        
+        -- A movie_id change moves a genre/cast row between movies
+        IF TG_OP = 'UPDATE' AND TG_TABLE_NAME <> 'movies' AND OLD.movie_id IS DISTINCT FROM NEW.movie_id THEN
+            PERFORM pg_notify('catalog_changes', json_build_object(
+                'table', TG_TABLE_NAME,
+                'op', TG_OP,
+                'movie_id', OLD.movie_id
+            )::text);
+        END IF;
+        
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    -- Writers take this lock before their first catalog_changes row and hold it
+    -- until commit, so seq order is commit order: once a reader sees seq N, no
+    -- lower seq can still appear
+    CREATE OR REPLACE FUNCTION record_catalog_change() RETURNS TRIGGER AS $$
+    DECLARE
+        row_data JSONB;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            row_data := to_jsonb(OLD) - 'director_key' - 'genre_mask' - 'actor_key';
+        ELSE
+            row_data := to_jsonb(NEW) - 'director_key' - 'genre_mask' - 'actor_key';
+            -- Skip updates that only touched derived columns (e.g. genre_mask)
+            IF TG_OP = 'UPDATE' AND row_data = to_jsonb(OLD) - 'director_key' - 'genre_mask' - 'actor_key' THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        
+        PERFORM pg_advisory_xact_lock(hashtext('catalog_changes'));
+        
+        INSERT INTO catalog_changes (table_name, op, row_id, movie_id, row_data)
+        VALUES (
+            TG_TABLE_NAME, TG_OP, (row_data->>'id')::INTEGER,
+            CASE WHEN TG_TABLE_NAME = 'movies' THEN (row_data->>'id')::INTEGER
+                 ELSE (row_data->>'movie_id')::INTEGER END,
+            row_data
+        );
+        
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE TRIGGER trg_movies_changes
+        AFTER INSERT OR UPDATE OR DELETE ON movies
+        FOR EACH ROW EXECUTE FUNCTION record_catalog_change();
+    
+    CREATE TRIGGER trg_movie_genres_changes
+        AFTER INSERT OR UPDATE OR DELETE ON movie_genres
+        FOR EACH ROW EXECUTE FUNCTION record_catalog_change();
+    
+    CREATE TRIGGER trg_movie_cast_changes
+        AFTER INSERT OR UPDATE OR DELETE ON movie_cast
+        FOR EACH ROW EXECUTE FUNCTION record_catalog_change();
+    
+    CREATE TRIGGER trg_movies_notify
+        AFTER INSERT OR UPDATE OR DELETE ON movies
+        FOR EACH ROW EXECUTE FUNCTION notify_catalog_change();
+    
+    CREATE TRIGGER trg_movie_genres_notify
+        AFTER INSERT OR UPDATE OR DELETE ON movie_genres
+        FOR EACH ROW EXECUTE FUNCTION notify_catalog_change();
+    
+    CREATE TRIGGER trg_movie_cast_notify
+        AFTER INSERT OR UPDATE OR DELETE ON movie_cast
+        FOR EACH ROW EXECUTE FUNCTION notify_catalog_change();
+    """
+    
+    # catalog_stats maintenance: statement-level triggers with transition tables
+    # apply one delta per statement, so bulk writes cost a single row update.
+    # Every writer updates the same row, which serializes concurrent imports on
+    # the row lock; MIN/MAX are only recomputed (via idx_movies_year) when a
+    # boundary year is removed, and only after that lock is held so the
+    # recompute sees every committed writer.
+    create_stats_triggers_sql = """
+    CREATE OR REPLACE FUNCTION refresh_catalog_stats() RETURNS VOID AS $$
+    BEGIN
+        UPDATE catalog_stats SET
+            movies_total = (SELECT COUNT(*) FROM movies),
+            genres_total = (SELECT COUNT(*) FROM movie_genres),
+            cast_total = (SELECT COUNT(*) FROM movie_cast),
+            min_year = (SELECT MIN(year) FROM movies),
+            max_year = (SELECT MAX(year) FROM movies),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE OR REPLACE FUNCTION catalog_stats_movies_changed() RETURNS TRIGGER AS $$
+    DECLARE
+        added BIGINT := 0;
+        removed BIGINT := 0;
+        new_min INTEGER;
+        new_max INTEGER;
+        old_min INTEGER;
+        old_max INTEGER;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            SELECT COUNT(*), MIN(year), MAX(year) INTO added, new_min, new_max FROM new_rows;
+        ELSIF TG_OP = 'DELETE' THEN
+            SELECT COUNT(*), MIN(year), MAX(year) INTO removed, old_min, old_max FROM old_rows;
+        ELSE
+            SELECT MIN(n.year), MAX(n.year), MIN(o.year), MAX(o.year)
+            INTO new_min, new_max, old_min, old_max
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE n.year IS DISTINCT FROM o.year;
+        END IF;
+        
+        IF added = 0 AND removed = 0 AND new_min IS NULL AND old_min IS NULL THEN
+            RETURN NULL;
+        END IF;
+        
+        UPDATE catalog_stats SET
+            movies_total = movies_total + added - removed,
+            min_year = LEAST(min_year, new_min),
+            max_year = GREATEST(max_year, new_max),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+        
+        IF old_min IS NOT NULL THEN
+            UPDATE catalog_stats SET
+                min_year = (SELECT MIN(year) FROM movies),
+                max_year = (SELECT MAX(year) FROM movies)
+            WHERE id = 1 AND (old_min <= min_year OR old_max >= max_year);
+        END IF;
+        
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE OR REPLACE FUNCTION catalog_stats_rows_changed() RETURNS TRIGGER AS $$
+    DECLARE
+        delta BIGINT;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            SELECT COUNT(*) INTO delta FROM new_rows;
+        ELSE
+            SELECT -COUNT(*) INTO delta FROM old_rows;
+        END IF;
+        
+        IF delta = 0 THEN
+            RETURN NULL;
+        END IF;
+        
+        IF TG_TABLE_NAME = 'movie_genres' THEN
+            UPDATE catalog_stats SET genres_total = genres_total + delta, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        ELSE
+            UPDATE catalog_stats SET cast_total = cast_total + delta, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        END IF;
+        
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE OR REPLACE FUNCTION bump_catalog_revision() RETURNS TRIGGER AS $$
+    BEGIN
+        -- Same lock as record_catalog_change, taken before the catalog_stats row
+        -- lock so every writer acquires the two in the same order
+        PERFORM pg_advisory_xact_lock(hashtext('catalog_changes'));
+        UPDATE catalog_stats SET revision = revision + 1 WHERE id = 1;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE TRIGGER trg_movies_stats_insert
+        AFTER INSERT ON movies REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_stats_movies_changed();
+    CREATE TRIGGER trg_movies_stats_update
+        AFTER UPDATE ON movies REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_stats_movies_changed();
+    CREATE TRIGGER trg_movies_stats_delete
+        AFTER DELETE ON movies REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_stats_movies_changed();
+    
+    CREATE TRIGGER trg_movie_genres_stats_insert
+        AFTER INSERT ON movie_genres REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_stats_rows_changed();
+    CREATE TRIGGER trg_movie_genres_stats_delete
+        AFTER DELETE ON movie_genres REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_stats_rows_changed();
+    
+    CREATE TRIGGER trg_movie_cast_stats_insert
+        AFTER INSERT ON movie_cast REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_stats_rows_changed();
+    CREATE TRIGGER trg_movie_cast_stats_delete
+        AFTER DELETE ON movie_cast REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_stats_rows_changed();
+    
+    CREATE TRIGGER trg_movies_revision
+        AFTER INSERT OR UPDATE OR DELETE ON movies
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_revision();
+    CREATE TRIGGER trg_movie_genres_revision
+        AFTER INSERT OR UPDATE OR DELETE ON movie_genres
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_revision();
+    CREATE TRIGGER trg_movie_cast_revision
+        AFTER INSERT OR UPDATE OR DELETE ON movie_cast
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_revision();
+    """
+    
+    # movies.genre_mask maintenance: statement-level triggers on movie_genres
+    # recompute the mask of each touched movie from genre_bits, so genre filters
+    # are single-table predicates instead of a join plus DISTINCT
+    create_genre_mask_sql = """
+    CREATE OR REPLACE FUNCTION refresh_genre_masks(ids INTEGER[]) RETURNS VOID AS $$
+    BEGIN
+        UPDATE movies m
+        SET genre_mask = masks.genre_mask
+        FROM (
+            SELECT t.movie_id, COALESCE((
+                SELECT bit_or(1 << gb.bit)
+                FROM movie_genres mg
+                JOIN genre_bits gb ON gb.genre = mg.genre
+                WHERE mg.movie_id = t.movie_id
+            ), 0) AS genre_mask
+            FROM unnest(ids) AS t(movie_id)
+        ) masks
+        WHERE m.id = masks.movie_id
+          AND m.genre_mask <> masks.genre_mask;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE OR REPLACE FUNCTION movie_genres_mask_changed() RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM refresh_genre_masks(ARRAY(SELECT DISTINCT movie_id FROM new_rows));
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM refresh_genre_masks(ARRAY(SELECT DISTINCT movie_id FROM old_rows));
+        ELSE
+            PERFORM refresh_genre_masks(ARRAY(
+                SELECT movie_id FROM new_rows UNION SELECT movie_id FROM old_rows
+            ));
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE TRIGGER trg_movie_genres_mask_insert
+        AFTER INSERT ON movie_genres REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION movie_genres_mask_changed();
+    CREATE TRIGGER trg_movie_genres_mask_update
+        AFTER UPDATE ON movie_genres REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION movie_genres_mask_changed();
+    CREATE TRIGGER trg_movie_genres_mask_delete
+        AFTER DELETE ON movie_genres REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION movie_genres_mask_changed();
+    """
+    
+    # movie_documents maintenance: deferred constraint triggers rebuild the
+    # document of each touched movie once at commit, after all of the
+    # transaction's genre/cast rewrites have happened
+    create_document_triggers_sql = """
+    CREATE OR REPLACE FUNCTION refresh_movie_documents(ids INTEGER[]) RETURNS VOID AS $$
+    BEGIN
+        INSERT INTO movie_documents (movie_id, document, refreshed_xid, updated_at)
+        SELECT m.id,
+               (to_jsonb(m) - 'director_key' - 'genre_mask') || jsonb_build_object(
+                   'genres', COALESCE((
+                       SELECT jsonb_agg(g.genre ORDER BY g.genre)
+                       FROM movie_genres g WHERE g.movie_id = m.id
+                   ), '[]'::jsonb),
+                   'cast', COALESCE((
+                       SELECT jsonb_agg(jsonb_build_object('name', c.actor_name, 'role', c.role) ORDER BY c.actor_name)
+                       FROM movie_cast c WHERE c.movie_id = m.id
+                   ), '[]'::jsonb)
+               ),
+               txid_current(),
+               CURRENT_TIMESTAMP
+        FROM movies m
+        WHERE m.id = ANY(ids)
+        ON CONFLICT (movie_id) DO UPDATE SET
+            document = EXCLUDED.document,
+            refreshed_xid = EXCLUDED.refreshed_xid,
+            updated_at = EXCLUDED.updated_at;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE OR REPLACE FUNCTION movie_document_changed() RETURNS TRIGGER AS $$
+    DECLARE
+        affected_id INTEGER;
+    BEGIN
+        IF TG_TABLE_NAME = 'movies' THEN
+            affected_id := NEW.id;
+        ELSIF TG_OP = 'DELETE' THEN
+            affected_id := OLD.movie_id;
+        ELSE
+            affected_id := NEW.movie_id;
+        END IF;
+        
+        -- Deferred triggers all run at commit, so one rebuild per movie per
+        -- transaction already sees the final state
+        IF NOT EXISTS (
+            SELECT 1 FROM movie_documents
+            WHERE movie_id = affected_id AND refreshed_xid = txid_current()
+        ) THEN
+            PERFORM refresh_movie_documents(ARRAY[affected_id]);
+        END IF;
+        
+        IF TG_OP = 'UPDATE' AND TG_TABLE_NAME <> 'movies' AND OLD.movie_id IS DISTINCT FROM NEW.movie_id THEN
+            PERFORM refresh_movie_documents(ARRAY[OLD.movie_id]);
+        END IF;
+        
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE CONSTRAINT TRIGGER trg_movies_document
+        AFTER INSERT OR UPDATE ON movies
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW EXECUTE FUNCTION movie_document_changed();
+    
+    CREATE CONSTRAINT TRIGGER trg_movie_genres_document
+        AFTER INSERT OR UPDATE OR DELETE ON movie_genres
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW EXECUTE FUNCTION movie_document_changed();
+    
+    CREATE CONSTRAINT TRIGGER trg_movie_cast_document
+        AFTER INSERT OR UPDATE OR DELETE ON movie_cast
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW EXECUTE FUNCTION movie_document_changed();
+    """
+    
+    # API key revocations: deactivating/deleting a key, changing/deleting its
+    # user, or changing the user's plan emits a NOTIFY on 'api_key_revocations'
+    # so every worker drops the cached validation (see src/key_cache.py)
+    create_auth_triggers_sql = """
+    CREATE OR REPLACE FUNCTION notify_api_key_revocation() RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'api_keys' THEN
+            PERFORM pg_notify('api_key_revocations', json_build_object('api_key_id', OLD.id)::text);
+        ELSIF TG_TABLE_NAME = 'user_subscriptions' THEN
+            -- Validated keys carry their user's plan
+            PERFORM pg_notify('api_key_revocations', json_build_object(
+                'user_id', CASE WHEN TG_OP = 'DELETE' THEN OLD.user_id ELSE NEW.user_id END
+            )::text);
+        ELSE
+            PERFORM pg_notify('api_key_revocations', json_build_object('user_id', OLD.id)::text);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE TRIGGER trg_api_keys_revocation
+        AFTER UPDATE OF api_key, user_id, is_active OR DELETE ON api_keys
+        FOR EACH ROW EXECUTE FUNCTION notify_api_key_revocation();
+    
+    CREATE TRIGGER trg_users_revocation
+        AFTER UPDATE OF email, is_verified OR DELETE ON users
+        FOR EACH ROW EXECUTE FUNCTION notify_api_key_revocation();
+    
+    CREATE TRIGGER trg_user_subscriptions_revocation
+        AFTER INSERT OR UPDATE OR DELETE ON user_subscriptions
+        FOR EACH ROW EXECUTE FUNCTION notify_api_key_revocation();
+    """
+    
+    # Monthly usage_logs partitions. Both functions go by partition name
+    # (usage_logs_YYYY_MM) and return how many partitions they touched.
+    create_usage_partitions_sql = """
+    CREATE OR REPLACE FUNCTION ensure_usage_log_partitions(months_ahead INTEGER) RETURNS INTEGER AS $$
+    DECLARE
+        month_start DATE := date_trunc('month', CURRENT_DATE);
+        partition_name TEXT;
+        created INTEGER := 0;
+    BEGIN
+        FOR i IN 0..months_ahead LOOP
+            partition_name := 'usage_logs_' || to_char(month_start, 'YYYY_MM');
+            IF to_regclass(partition_name) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF usage_logs FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, month_start, (month_start + INTERVAL '1 month')::DATE
+                );
+                created := created + 1;
+            END IF;
+            month_start := (month_start + INTERVAL '1 month')::DATE;
+        END LOOP;
+        RETURN created;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE OR REPLACE FUNCTION drop_usage_log_partitions(retention_months INTEGER) RETURNS INTEGER AS $$
+    DECLARE
+        cutoff DATE := (date_trunc('month', CURRENT_DATE) - make_interval(months => retention_months))::DATE;
+        partition_name TEXT;
+        dropped INTEGER := 0;
+    BEGIN
+        FOR partition_name IN
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'usage_logs'::regclass AND c.relname ~ '^usage_logs_[0-9]{4}_[0-9]{2}$'
+        LOOP
+            -- Months that ended before the cutoff
+            IF to_date(substring(partition_name FROM 12), 'YYYY_MM') < cutoff THEN
+                EXECUTE format('ALTER TABLE usage_logs DETACH PARTITION %I', partition_name);
+                EXECUTE format('DROP TABLE %I', partition_name);
+                dropped := dropped + 1;
+            END IF;
+        END LOOP;
+        RETURN dropped;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    SELECT ensure_usage_log_partitions(2);
     """
     
     print("Creating database schema...")
     try:
         execute_query(drop_tables_sql)
         execute_query(create_tables_sql)
+        
+        # Bit positions come from the validator's genre list so Python and SQL agree
+        from validator import MovieCSVValidator
+        execute_query(
+            "INSERT INTO genre_bits (genre, bit) SELECT * FROM unnest(%s::VARCHAR[], %s::SMALLINT[])",
+            (list(MovieCSVValidator.GENRE_BIT_ORDER), list(range(len(MovieCSVValidator.GENRE_BIT_ORDER))))
+        )
+        
+        execute_query(create_triggers_sql)
+        execute_query(create_stats_triggers_sql)
+        execute_query(create_genre_mask_sql)
+        execute_query(create_document_triggers_sql)
+        execute_query(create_auth_triggers_sql)
+        execute_query(create_usage_partitions_sql)
         print("✅ Database schema created successfully!")
         
         # Verify tables were created
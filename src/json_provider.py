@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Fast JSON serialization for API responses
+Uses orjson when it is installed and falls back to the standard library, with
+native handling of the Decimal and datetime values psycopg2 returns.
+
+Wire format: Decimals (e.g. rating) are JSON numbers, dates and datetimes are
+ISO 8601 strings and keys keep their insertion order. Set
+JSON_FLASK_COMPAT=1 to get Flask's default encodings back instead: Decimals
+as strings, HTTP-date datetimes and sorted keys.
+"""
+
+import json
+import os
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+JSON_FLASK_COMPAT = os.getenv('JSON_FLASK_COMPAT', '').lower() in ('1', 'true', 'yes')
+
+def _default(obj: Any) -> Any:
+    """Serialize types that neither encoder handles on its own"""
+    if isinstance(obj, Decimal):
+        return str(obj) if JSON_FLASK_COMPAT else float(obj)
+    if JSON_FLASK_COMPAT and isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+    if JSON_FLASK_COMPAT:
+        # Route datetimes through _default and sort keys like Flask does
+        _ORJSON_OPTIONS |= orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize obj to compact UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize obj to compact UTF-8 JSON bytes"""
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':'),
+                          sort_keys=JSON_FLASK_COMPAT).encode('utf-8')
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (when available)"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            # Callers asking for stdlib options (indent, sort_keys...) get the stdlib encoder
+            kwargs.setdefault('default', _default)
+            return json.dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+def add_json_fields(response, **fields: Any) -> bool:
+    """
+    Append top-level fields to a JSON object response without decoding it
+
+    The serialized fields are spliced in before the closing brace, so the
+    existing body is never parsed or re-encoded. Returns False (leaving the
+    response untouched) when the body is not a JSON object.
+    """
+    if not fields or response.is_streamed or not response.is_json:
+        return False
+
+    body = response.get_data().rstrip()
+    if not body.endswith(b'}'):
+        return False
+
+    extra = dumps_bytes(fields)[1:-1]
+    head = body[:-1].rstrip()
+    separator = b'' if head.endswith(b'{') else b','
+    response.set_data(head + separator + extra + b'}')
+    return True
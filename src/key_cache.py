@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+API key validation cache
+Validated keys map to their user info in a bounded LRU with a TTL; unknown
+keys are remembered briefly too, so a client hammering with a bad key doesn't
+reach the database. Deactivating a key or changing/deleting its user fires a
+NOTIFY on 'api_key_revocations' (table triggers, see database.py), which every
+worker uses to evict the affected entries.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from src.notifications import get_listener
+
+API_KEY_CACHE_TTL = float(os.getenv('API_KEY_CACHE_TTL', 300))
+API_KEY_NEGATIVE_CACHE_TTL = float(os.getenv('API_KEY_NEGATIVE_CACHE_TTL', 30))
+API_KEY_CACHE_SIZE = int(os.getenv('API_KEY_CACHE_SIZE', 10000))
+
+REVOCATION_CHANNEL = 'api_key_revocations'
+
+_MISSING = (False, None)
+
+class ApiKeyCache:
+    """Bounded TTL LRU of API key -> user info (None for keys known to be invalid)"""
+
+    def __init__(self, ttl: float = API_KEY_CACHE_TTL, negative_ttl: float = API_KEY_NEGATIVE_CACHE_TTL,
+                 max_entries: int = API_KEY_CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # Keyed by key digest, so raw keys are never held in memory
+        self._entries: 'OrderedDict[bytes, Tuple[Optional[Dict], float]]' = OrderedDict()
+        # Bumped by every eviction, so a lookup that raced one isn't stored
+        self._generation = 0
+        self._lock = threading.Lock()
+        _caches.append(self)
+
+    @property
+    def generation(self) -> int:
+        """Eviction counter to pass to set() for a result loaded after reading it"""
+        return self._generation
+
+    @staticmethod
+    def _digest(api_key: str) -> bytes:
+        return hashlib.sha256(api_key.encode()).digest()
+
+    def get(self, api_key: str) -> Tuple[bool, Optional[Dict]]:
+        """Return (hit, user info); a hit with None means the key is known to be invalid"""
+        digest = self._digest(api_key)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return _MISSING
+            user_info, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[digest]
+                return _MISSING
+            self._entries.move_to_end(digest)
+            return True, user_info
+
+    def get_or_load(self, api_key: str, loader: Callable[[str], Optional[Dict]]) -> Optional[Dict]:
+        """Return the user info for a key, validating it with loader on a miss"""
+        hit, user_info = self.get(api_key)
+        if not hit:
+            generation = self.generation
+            user_info = loader(api_key)
+            self.set(api_key, user_info, generation)
+        return dict(user_info) if user_info is not None else None
+
+    def set(self, api_key: str, user_info: Optional[Dict], generation: Optional[int] = None) -> None:
+        """
+        Remember a validation result (None for an invalid key)
+
+        Args:
+            generation: Value of the eviction counter before the key was
+                validated; the result is dropped if an eviction happened since
+        """
+        ttl = self.ttl if user_info is not None else self.negative_ttl
+        digest = self._digest(api_key)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[digest] = (user_info, time.monotonic() + ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, api_key_ids: Iterable[int] = (), user_ids: Iterable[int] = ()) -> None:
+        """Drop cached validations of the given keys and of every key of the given users"""
+        api_key_ids, user_ids = set(api_key_ids), set(user_ids)
+        with self._lock:
+            self._generation += 1
+            stale = [
+                digest for digest, (user_info, _) in self._entries.items()
+                # A user change (e.g. verification) may also make unknown keys valid
+                if (user_info is None and user_ids)
+                or (user_info is not None
+                    and (user_info['api_key_id'] in api_key_ids or user_info['user_id'] in user_ids))
+            ]
+            for digest in stale:
+                del self._entries[digest]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+_caches: List[ApiKeyCache] = []
+_started = False
+_start_lock = threading.Lock()
+
+def evict_api_keys(api_key_ids: Iterable[int] = (), user_ids: Iterable[int] = ()) -> None:
+    """Evict keys from every cache in this worker (other workers hear it from the triggers)"""
+    api_key_ids, user_ids = list(api_key_ids), list(user_ids)
+    for cache in list(_caches):
+        cache.evict(api_key_ids, user_ids)
+
+def _handle_payloads(payloads: List[str]) -> None:
+    api_key_ids, user_ids = [], []
+    for payload in payloads:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            # Unknown payload format: be safe and drop everything
+            _clear_all()
+            return
+        if event.get('api_key_id') is not None:
+            api_key_ids.append(int(event['api_key_id']))
+        if event.get('user_id') is not None:
+            user_ids.append(int(event['user_id']))
+    evict_api_keys(api_key_ids, user_ids)
+
+def _clear_all() -> None:
+    for cache in list(_caches):
+        cache.clear()
+
+def start_revocation_listener() -> None:
+    """Start listening for API key revocations in this worker (idempotent)"""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        # Revocations sent while disconnected are lost, so start over after a reconnect
+        get_listener().subscribe(REVOCATION_CHANNEL, _handle_payloads, on_reconnect=_clear_all)
+        _started = True
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Top-rated leaderboards per (genre, decade)
+Each genre/decade combination (plus the all-genres and all-decades boards)
+keeps its best MAX_LEADERBOARD_SIZE movies in a sorted list, so "top N" is a
+list slice. Catalog change events re-slot just the movies that changed; a full
+board that loses an entry is refilled from Postgres.
+"""
+
+import threading
+from bisect import insort
+from typing import Dict, List, Optional, Set, Tuple
+from src.database import execute_query
+from src.catalog import genre_filter_sql
+from src.catalog_events import CatalogUpdater
+
+MAX_LEADERBOARD_SIZE = 100
+
+BoardKey = Tuple[Optional[str], Optional[int]]
+# Sort key: highest rating first, ties broken by movie ID
+Entry = Tuple[float, int]
+
+def decade_of(year: int) -> int:
+    """Return the decade a year belongs to (1994 -> 1990)"""
+    return year // 10 * 10
+
+def board_keys(year: int, genres: List[str]) -> List[BoardKey]:
+    """All boards a movie belongs to; None stands for "any genre" / "any decade" """
+    decade = decade_of(year)
+    keys = [(None, None), (None, decade)]
+    for genre in genres:
+        keys.append((genre, None))
+        keys.append((genre, decade))
+    return keys
+
+class Leaderboards:
+    """Capped top-rated lists built from the catalog tables and kept current by catalog events"""
+
+    def __init__(self):
+        # Each board holds the best min(MAX_LEADERBOARD_SIZE, movies on it) entries
+        self._boards: Dict[BoardKey, List[Entry]] = {}
+        # Boards each movie currently appears on
+        self._members: Dict[int, Set[BoardKey]] = {}
+        self._lock = threading.Lock()
+
+    def build(self) -> None:
+        """Load every rated movie from the catalog tables"""
+        boards: Dict[BoardKey, List[Entry]] = {}
+        for row in self._load(None):
+            entry = (-float(row['rating']), row['id'])
+            for key in board_keys(row['year'], row['genres']):
+                boards.setdefault(key, []).append(entry)
+        members: Dict[int, Set[BoardKey]] = {}
+        for key, board in boards.items():
+            board.sort()
+            del board[MAX_LEADERBOARD_SIZE:]
+            for _, movie_id in board:
+                members.setdefault(movie_id, set()).add(key)
+
+        with self._lock:
+            self._boards = boards
+            self._members = members
+
+    def refresh(self, movie_ids: Optional[Set[int]]) -> None:
+        """Re-slot only the given movies (None reloads everything)"""
+        if movie_ids is None:
+            self.build()
+            return
+
+        rows = {row['id']: row for row in self._load(movie_ids)}
+        refill = set()
+        with self._lock:
+            for movie_id in movie_ids:
+                refill |= self._remove(movie_id)
+                row = rows.get(movie_id)
+                if row is not None:
+                    self._insert(row)
+
+        # Whatever ranked just below a full board wasn't kept, so ask Postgres
+        boards = {key: self._load_board(key) for key in refill}
+        with self._lock:
+            for key, board in boards.items():
+                self._replace(key, board)
+
+    def top(self, genre: Optional[str] = None, decade: Optional[int] = None,
+            n: int = 10) -> List[Tuple[int, float]]:
+        """Top n (movie_id, rating) pairs for a genre/decade, best first"""
+        board = self._boards.get((genre, decade), [])
+        return [(movie_id, -negative_rating) for negative_rating, movie_id in board[:n]]
+
+    def _insert(self, row: Dict) -> None:
+        entry = (-float(row['rating']), row['id'])
+        for key in board_keys(row['year'], row['genres']):
+            board = self._boards.setdefault(key, [])
+            if len(board) >= MAX_LEADERBOARD_SIZE:
+                if entry >= board[-1]:
+                    continue
+                self._leave(board.pop()[1], key)
+            insort(board, entry)
+            self._members.setdefault(row['id'], set()).add(key)
+
+    def _remove(self, movie_id: int) -> Set[BoardKey]:
+        """Take a movie off its boards, returning the full ones that now need a refill"""
+        refill = set()
+        for key in self._members.pop(movie_id, ()):
+            board = self._boards[key]
+            if len(board) >= MAX_LEADERBOARD_SIZE:
+                refill.add(key)
+            board[:] = [entry for entry in board if entry[1] != movie_id]
+            if not board and key not in refill:
+                del self._boards[key]
+        return refill
+
+    def _replace(self, key: BoardKey, board: List[Entry]) -> None:
+        for _, movie_id in self._boards.pop(key, ()):
+            self._leave(movie_id, key)
+        if board:
+            self._boards[key] = board
+            for _, movie_id in board:
+                self._members.setdefault(movie_id, set()).add(key)
+
+    def _leave(self, movie_id: int, key: BoardKey) -> None:
+        keys = self._members.get(movie_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._members[movie_id]
+
+    def _load(self, movie_ids: Optional[Set[int]]) -> List[Dict]:
+        """Read rated movies (all, or just movie_ids) with their genres"""
+        query = """
+            SELECT m.id, m.rating, m.year,
+                   COALESCE(array_agg(mg.genre) FILTER (WHERE mg.genre IS NOT NULL), ARRAY[]::VARCHAR[]) AS genres
+            FROM movies m
+            LEFT JOIN movie_genres mg ON mg.movie_id = m.id
+            WHERE m.rating IS NOT NULL
+        """
+        params = None
+        if movie_ids is not None:
+            query += " AND m.id = ANY(%s)"
+            params = (list(movie_ids),)
+        query += " GROUP BY m.id"
+        return execute_query(query, params, fetch=True)
+
+    def _load_board(self, key: BoardKey) -> List[Entry]:
+        """Read the best MAX_LEADERBOARD_SIZE movies of one board"""
+        genre, decade = key
+        conditions = ["m.rating IS NOT NULL"]
+        params: List = []
+        if genre is not None:
+            predicate, genre_params = genre_filter_sql([genre])
+            conditions.append(predicate)
+            params.extend(genre_params)
+        if decade is not None:
+            conditions.append("m.year >= %s AND m.year < %s")
+            params.extend([decade, decade + 10])
+        params.append(MAX_LEADERBOARD_SIZE)
+        rows = execute_query(
+            f"SELECT m.id, m.rating FROM movies m WHERE {' AND '.join(conditions)} "
+            "ORDER BY m.rating DESC, m.id LIMIT %s",
+            tuple(params), fetch=True
+        )
+        return [(-float(row['rating']), row['id']) for row in rows]
+
+_leaderboards: Optional[Leaderboards] = None
+_leaderboards_lock = threading.Lock()
+
+def get_leaderboards() -> Leaderboards:
+    """Return this worker's leaderboards, building them on first use"""
+    global _leaderboards
+    with _leaderboards_lock:
+        if _leaderboards is None:
+            leaderboards = Leaderboards()
+            CatalogUpdater(leaderboards.refresh, 'leaderboards-refresh').start(leaderboards.build)
+            _leaderboards = leaderboards
+        return _leaderboards
+
+def start_leaderboards() -> None:
+    """Build the leaderboards in the background so the first request doesn't pay for it"""
+    def build():
+        try:
+            get_leaderboards()
+        except Exception as e:
+            print(f"Leaderboard build failed: {e}")
+    threading.Thread(target=build, name='leaderboards-build', daemon=True).start()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Postgres LISTEN/NOTIFY listener
+Runs one background thread per worker that dispatches notification payloads
+to the handlers subscribed to each channel
+"""
+
+import select
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from src.database import open_connection
+
+class NotificationListener(threading.Thread):
+    """Background thread that LISTENs on Postgres channels and dispatches payloads"""
+
+    def __init__(self, poll_timeout: float = 1.0, reconnect_delay: float = 5.0):
+        super().__init__(name='pg-notification-listener', daemon=True)
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self._handlers: Dict[str, List[Callable[[List[str]], None]]] = {}
+        self._reconnect_handlers: Dict[str, List[Callable[[], None]]] = {}
+        self._listening = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._conn = None
+
+    def subscribe(self, channel: str, handler: Callable[[List[str]], None],
+                  on_reconnect: Optional[Callable[[], None]] = None) -> None:
+        """
+        Register a handler for a channel
+
+        Args:
+            channel: Postgres NOTIFY channel name
+            handler: Called with the list of payloads received in one poll
+            on_reconnect: Called after the connection is re-established, since
+                notifications sent while disconnected are lost
+        """
+        with self._lock:
+            self._handlers.setdefault(channel, []).append(handler)
+            if on_reconnect:
+                self._reconnect_handlers.setdefault(channel, []).append(on_reconnect)
+
+    def stop(self) -> None:
+        """Ask the listener thread to exit"""
+        self._stop_event.set()
+
+    def run(self) -> None:
+        first_connect = True
+        while not self._stop_event.is_set():
+            try:
+                self._conn = open_connection()
+                self._conn.autocommit = True
+                self._listening = set()
+
+                # LISTEN before the reconnect handlers reload anything, so a
+                # change committed while they run is still delivered
+                self._listen_new_channels()
+                if not first_connect:
+                    self._fire_reconnect_handlers()
+                first_connect = False
+
+                while not self._stop_event.is_set():
+                    self._listen_new_channels()
+
+                    ready, _, _ = select.select([self._conn], [], [], self.poll_timeout)
+                    if not ready:
+                        continue
+
+                    self._conn.poll()
+                    self._dispatch(self._conn.notifies)
+                    self._conn.notifies.clear()
+
+            except Exception as e:
+                print(f"Notification listener error: {e}")
+                time.sleep(self.reconnect_delay)
+            finally:
+                if self._conn:
+                    try:
+                        self._conn.close()
+                    except Exception:
+                        pass
+                    self._conn = None
+
+    def _listen_new_channels(self) -> None:
+        """Issue LISTEN for channels subscribed since the last poll"""
+        with self._lock:
+            pending = [channel for channel in self._handlers if channel not in self._listening]
+
+        if not pending:
+            return
+
+        with self._conn.cursor() as cursor:
+            for channel in pending:
+                cursor.execute(f'LISTEN "{channel}"')
+                self._listening.add(channel)
+
+    def _dispatch(self, notifies) -> None:
+        """Group payloads by channel and hand each batch to its handlers"""
+        batches: Dict[str, List[str]] = {}
+        for notify in notifies:
+            batches.setdefault(notify.channel, []).append(notify.payload)
+
+        for channel, payloads in batches.items():
+            with self._lock:
+                handlers = list(self._handlers.get(channel, []))
+            for handler in handlers:
+                try:
+                    handler(payloads)
+                except Exception as e:
+                    print(f"Notification handler error on '{channel}': {e}")
+
+    def _fire_reconnect_handlers(self) -> None:
+        with self._lock:
+            handlers = [h for hs in self._reconnect_handlers.values() for h in hs]
+        for handler in handlers:
+            try:
+                handler()
+            except Exception as e:
+                print(f"Notification reconnect handler error: {e}")
+
+_listener: Optional[NotificationListener] = None
+_listener_lock = threading.Lock()
+
+def get_listener() -> NotificationListener:
+    """Return this worker's listener thread, starting it on first use"""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = NotificationListener()
+            _listener.start()
+        return _listener
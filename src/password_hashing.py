@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Bounded bcrypt password hashing
+bcrypt is deliberately slow, so hashes and checks run on a small dedicated
+thread pool instead of the request thread: at most PASSWORD_HASH_WORKERS run
+at once, leaving the other cores to catalog requests during a signup or
+login burst. A caller that can't get a slot within
+PASSWORD_HASH_QUEUE_TIMEOUT seconds is rejected with PasswordHashingBusy
+instead of queueing behind the storm.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple, TypeVar
+import bcrypt
+
+# bcrypt cost factor for new hashes; stored hashes with another cost are
+# rehashed on the next successful login
+PASSWORD_HASH_ROUNDS = int(os.getenv('PASSWORD_HASH_ROUNDS', 12))
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', 2.0))
+
+T = TypeVar('T')
+
+class PasswordHashingBusy(Exception):
+    """No hashing slot became free within the queue timeout"""
+    pass
+
+class PasswordHasher:
+    """bcrypt on a bounded executor with admission control"""
+
+    def __init__(self, rounds: int = PASSWORD_HASH_ROUNDS, workers: int = PASSWORD_HASH_WORKERS,
+                 queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT):
+        self.rounds = rounds
+        self.queue_timeout = queue_timeout
+        # One slot per worker thread, so admitted work never waits in the executor
+        self._slots = threading.BoundedSemaphore(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+    def hash(self, password: str) -> str:
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run(lambda: bcrypt.hashpw(password.encode('utf-8'), salt)).decode('utf-8')
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._run(lambda: bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8')))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """Whether a stored bcrypt hash was made with a different cost factor"""
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def verify_and_rehash(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        Check a password, returning (valid, new hash if the stored one should be replaced)
+
+        The rehash is best effort: if the pool is busy the old hash is kept
+        until a later login.
+        """
+        if not self.verify(password, hashed):
+            return False, None
+        if not self.needs_rehash(hashed):
+            return True, None
+        try:
+            return True, self.hash(password)
+        except PasswordHashingBusy:
+            return True, None
+
+    def _run(self, work: Callable[[], T]) -> T:
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise PasswordHashingBusy("Password hashing is busy. Please try again shortly.")
+        try:
+            return self._executor.submit(work).result()
+        finally:
+            self._slots.release()
+
+_hasher = PasswordHasher()
+
+def get_password_hasher() -> PasswordHasher:
+    return _hasher
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Movie popularity tracking
+Movie lookups are counted in an in-process count-min sketch with exponential
+time decay (forward decay: each hit is weighted by exp(rate * (t - landmark)),
+so old hits fade without touching the counters). Each worker periodically
+saves its sketch to Postgres and merges everyone's into the ranking behind
+/api/movies/popular, which also decides which movie documents to pre-warm.
+"""
+
+import math
+import os
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from flask import make_response
+from src.database import execute_query
+
+POPULARITY_HALF_LIFE_HOURS = float(os.getenv('POPULARITY_HALF_LIFE_HOURS', 24))
+POPULARITY_SYNC_SECONDS = int(os.getenv('POPULARITY_SYNC_SECONDS', 60))
+POPULARITY_WARM_COUNT = int(os.getenv('POPULARITY_WARM_COUNT', 200))
+
+DECAY_RATE = math.log(2) / (POPULARITY_HALF_LIFE_HOURS * 3600)
+SKETCH_WIDTH = 4096  # power of two (multiply-shift hashing)
+SKETCH_DEPTH = 4
+CANDIDATES = 500
+
+# Fixed odd multipliers and offsets so every worker hashes IDs identically
+# and sketches can be added together
+_HASH_MULTIPLIERS = np.array([
+    0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93
+], dtype=np.uint64)[:SKETCH_DEPTH]
+_HASH_OFFSETS = np.array([
+    0x27D4EB2F165667C5, 0x85EBCA77C2B2AE63, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9
+], dtype=np.uint64)[:SKETCH_DEPTH]
+_HASH_SHIFT = np.uint64(64 - int(math.log2(SKETCH_WIDTH)))
+
+# Rescale the counters before forward-decay weights get large enough to lose precision
+_MAX_LOG_WEIGHT = 30.0
+
+class DecayedCountMinSketch:
+    """Count-min sketch of time-decayed hit counts keyed by movie ID"""
+
+    def __init__(self, landmark: Optional[float] = None, counts: Optional[np.ndarray] = None):
+        self.landmark = time.time() if landmark is None else landmark
+        self.counts = np.zeros((SKETCH_DEPTH, SKETCH_WIDTH)) if counts is None else counts
+
+    @staticmethod
+    def _columns(movie_ids: np.ndarray) -> np.ndarray:
+        """Column of each ID in each row (depth x n), by multiply-shift hashing"""
+        keys = movie_ids.astype(np.uint64)[None, :]
+        with np.errstate(over='ignore'):
+            hashed = _HASH_MULTIPLIERS[:, None] * keys + _HASH_OFFSETS[:, None]
+        return (hashed >> _HASH_SHIFT).astype(np.intp)
+
+    def add(self, movie_ids: Iterable[int], now: Optional[float] = None) -> None:
+        """Count one hit for each ID (repeats count repeatedly)"""
+        movie_ids = np.fromiter(movie_ids, dtype=np.int64)
+        if len(movie_ids) == 0:
+            return
+        now = time.time() if now is None else now
+        if DECAY_RATE * (now - self.landmark) > _MAX_LOG_WEIGHT:
+            self.rebase(now)
+
+        columns = self._columns(movie_ids)
+        rows = np.repeat(np.arange(SKETCH_DEPTH), len(movie_ids))
+        np.add.at(self.counts, (rows, columns.ravel()), math.exp(DECAY_RATE * (now - self.landmark)))
+
+    def raw_estimates(self, movie_ids: Iterable[int]) -> np.ndarray:
+        """Estimates in landmark units: comparable with each other, not decayed to now"""
+        movie_ids = np.fromiter(movie_ids, dtype=np.int64)
+        if len(movie_ids) == 0:
+            return np.zeros(0)
+        columns = self._columns(movie_ids)
+        return self.counts[np.arange(SKETCH_DEPTH)[:, None], columns].min(axis=0)
+
+    def decay_factor(self, now: Optional[float] = None) -> float:
+        """Multiplier turning landmark-unit estimates into decayed hit counts as of now"""
+        now = time.time() if now is None else now
+        return math.exp(-DECAY_RATE * (now - self.landmark))
+
+    def rebase(self, landmark: float) -> None:
+        """Move the landmark, rescaling counters so estimates are unchanged"""
+        self.counts *= math.exp(-DECAY_RATE * (landmark - self.landmark))
+        self.landmark = landmark
+
+    def merge(self, other: 'DecayedCountMinSketch') -> None:
+        """Add another sketch's counts into this one"""
+        self.counts += other.counts * math.exp(-DECAY_RATE * (self.landmark - other.landmark))
+
+    def to_bytes(self) -> bytes:
+        """Compact form for storage: zlib-compressed float32 counters"""
+        return zlib.compress(self.counts.astype(np.float32).tobytes())
+
+    @classmethod
+    def from_bytes(cls, landmark: float, data: bytes) -> 'DecayedCountMinSketch':
+        counts = np.frombuffer(zlib.decompress(data), dtype=np.float32)
+        return cls(landmark, counts.astype(np.float64).reshape(SKETCH_DEPTH, SKETCH_WIDTH))
+
+class PopularityTracker:
+    """This worker's sketch and candidate set, plus the merged cross-worker ranking"""
+
+    def __init__(self):
+        self.worker_id = f'{socket.gethostname()}-{os.getpid()}'
+        self._sketch = DecayedCountMinSketch()
+        # Likely heavy hitters; the sketch alone can't enumerate its keys
+        self._candidates: Dict[int, float] = {}
+        self._ranking: Optional[List[Tuple[int, float]]] = None
+        self._ranked_at: Optional[datetime] = None
+        self._warmers: List[Callable[[List[int]], None]] = []
+        self._lock = threading.Lock()
+
+    def record(self, movie_ids: Iterable[int]) -> None:
+        """Count hits for the given movies"""
+        movie_ids = list(movie_ids)
+        if not movie_ids:
+            return
+        with self._lock:
+            self._sketch.add(movie_ids)
+            unique_ids = list(dict.fromkeys(movie_ids))
+            for movie_id, estimate in zip(unique_ids, self._sketch.raw_estimates(unique_ids)):
+                self._candidates[movie_id] = float(estimate)
+            if len(self._candidates) > 2 * CANDIDATES:
+                keep = sorted(self._candidates.items(), key=lambda item: item[1], reverse=True)[:CANDIDATES]
+                self._candidates = dict(keep)
+
+    def top(self, n: int = 10) -> List[Tuple[int, float]]:
+        """Top n (movie_id, decayed hit count) pairs, best first"""
+        ranking = self._ranking
+        if ranking is None:
+            # Not synced yet: rank from this worker's own counts
+            with self._lock:
+                factor = self._sketch.decay_factor()
+                ranking = sorted(
+                    ((movie_id, estimate * factor) for movie_id, estimate in self._candidates.items()),
+                    key=lambda item: item[1], reverse=True
+                )
+        return ranking[:n]
+
+    @property
+    def ranked_at(self) -> Optional[datetime]:
+        return self._ranked_at
+
+    def add_warmer(self, warmer: Callable[[List[int]], None]) -> None:
+        """Call warmer with the most popular movie IDs after every sync"""
+        self._warmers.append(warmer)
+
+    def sync(self) -> None:
+        """Save this worker's sketch, merge every worker's, and re-rank"""
+        with self._lock:
+            landmark = self._sketch.landmark
+            data = self._sketch.to_bytes()
+            candidates = list(self._candidates)
+
+        execute_query("""
+            INSERT INTO popularity_sketches (worker_id, landmark, counts, candidates, updated_at)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (worker_id) DO UPDATE SET
+                landmark = EXCLUDED.landmark,
+                counts = EXCLUDED.counts,
+                candidates = EXCLUDED.candidates,
+                updated_at = EXCLUDED.updated_at
+        """, (self.worker_id, landmark, data, candidates))
+
+        rows = execute_query(
+            "SELECT landmark, counts, candidates FROM popularity_sketches",
+            fetch=True
+        )
+        now = time.time()
+        merged = DecayedCountMinSketch(landmark=now)
+        all_candidates = set()
+        for row in rows:
+            merged.merge(DecayedCountMinSketch.from_bytes(row['landmark'], bytes(row['counts'])))
+            all_candidates.update(row['candidates'])
+
+        ids = list(all_candidates)
+        estimates = merged.raw_estimates(ids)
+        ranking = sorted(zip(ids, estimates.tolist()), key=lambda item: item[1], reverse=True)
+        self._ranking = [(movie_id, score) for movie_id, score in ranking[:CANDIDATES] if score > 0]
+        self._ranked_at = datetime.now()
+
+        popular = [movie_id for movie_id, _ in self._ranking[:POPULARITY_WARM_COUNT]]
+        for warmer in self._warmers:
+            try:
+                warmer(popular)
+            except Exception as e:
+                print(f"Popularity cache warmer error: {e}")
+
+    def run_sync_loop(self) -> None:
+        while True:
+            time.sleep(POPULARITY_SYNC_SECONDS)
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Popularity sync failed: {e}")
+
+_tracker = PopularityTracker()
+_started = False
+_start_lock = threading.Lock()
+
+def get_popularity_tracker() -> PopularityTracker:
+    return _tracker
+
+def start_popularity_tracking() -> None:
+    """Start this worker's periodic sketch sync (idempotent)"""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        threading.Thread(target=_tracker.run_sync_loop, name='popularity-sync', daemon=True).start()
+        _started = True
+
+def track_movie_hits(movie_ids: Callable[..., Iterable[int]]):
+    """
+    Count successful lookups of the movies a view serves
+
+    Args:
+        movie_ids: Function of the view's arguments returning the movie IDs
+            served; applied outside any response cache, so cached hits count
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                try:
+                    _tracker.record(movie_ids(*args, **kwargs))
+                except Exception:
+                    pass  # invalid IDs are reported by the view itself
+            return response
+        return decorated_function
+    return decorator
+
+def purge_popularity_sketches(max_age_days: int) -> int:
+    """Delete sketches of workers that stopped syncing, returning how many were removed"""
+    return execute_query(
+        "DELETE FROM popularity_sketches WHERE updated_at < CURRENT_TIMESTAMP - make_interval(days => %s)",
+        (max_age_days,)
+    )
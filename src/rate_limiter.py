@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Rate limiter engine
+Fixed-window counters (daily quotas) and token buckets (burst limits) with
+atomic check-and-consume. State lives either in a shared-memory hash table
+that every worker on the host maps (default), or in Redis when
+RATE_LIMIT_REDIS_URL is set so limits hold across hosts.
+
+Shared-memory layout: a 16-byte header (magic, slot count) followed by
+fixed-size slots of (key hash, window end / last refill time, count / tokens,
+expiry), found by linear probing. A slot is only reused for another key
+once it has expired (its window ended, or its bucket has refilled); when
+every slot in the probe range is live, the decision raises RateLimiterFull
+rather than forgetting someone's usage. Each decision holds an flock on the
+file, so it is atomic across processes; a process-local lock covers
+threads, which share the file description.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import NamedTuple, Optional
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL')
+RATE_LIMIT_SHM_PATH = os.getenv('RATE_LIMIT_SHM_PATH', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'movie-api-rate-limits'
+))
+RATE_LIMIT_SLOTS = int(os.getenv('RATE_LIMIT_SLOTS', 65536))
+
+MAGIC = b'MVRL0002'
+HEADER = struct.Struct('<8sQ')
+SLOT = struct.Struct('<Qddd')
+MAX_PROBES = 32
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Unix time at which the full limit is available again
+    reset_at: float
+    # Unix time at which a denied request would be allowed (None: reset_at)
+    retry_at: Optional[float] = None
+
+class RateLimiterFull(Exception):
+    """No free or expired slot for a new key; the limiter can't decide"""
+    pass
+
+def _key_hash(key: str) -> int:
+    # 0 marks an empty slot
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+class SharedMemoryRateLimiter:
+    """Limiter state in a memory-mapped file shared by every worker on this host"""
+
+    def __init__(self, path: str = RATE_LIMIT_SHM_PATH, slots: int = RATE_LIMIT_SLOTS):
+        self.slots = slots
+        size = HEADER.size + slots * SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock = threading.Lock()
+        with self._locked():
+            if os.fstat(self._fd).st_size != size or os.pread(self._fd, len(MAGIC), 0) != MAGIC:
+                # New file or a different layout: start over with an empty table
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, slots), 0)
+        self._map = mmap.mmap(self._fd, size)
+
+    def fixed_window(self, key: str, limit: int, window_end: float, cost: int = 1,
+                     floor: Optional[int] = None) -> RateLimitDecision:
+        """
+        Count cost against limit for the window ending at window_end
+
+        Args:
+            floor: Known usage from elsewhere (e.g. daily_usage); the count is
+                raised to at least this before deciding
+
+        Raises:
+            RateLimiterFull: The key has no slot and none can be freed
+        """
+        key_hash = _key_hash(key)
+        with self._locked():
+            offset, stored_end, count = self._find(key_hash, time.time())
+            if stored_end != window_end:
+                count = 0.0
+            if floor is not None and floor > count:
+                count = float(floor)
+            allowed = count + cost <= limit
+            if allowed:
+                count += cost
+            SLOT.pack_into(self._map, offset, key_hash, window_end, count, window_end)
+        return RateLimitDecision(allowed, limit, max(0, int(limit - count)), window_end)
+
+    def token_bucket(self, key: str, capacity: int, refill_per_second: float,
+                     cost: int = 1) -> RateLimitDecision:
+        """
+        Take cost tokens from a bucket of capacity refilled continuously
+
+        Raises:
+            RateLimiterFull: The key has no slot and none can be freed
+        """
+        key_hash = _key_hash(key)
+        now = time.time()
+        with self._locked():
+            offset, last_refill, tokens = self._find(key_hash, now)
+            if last_refill == 0.0:
+                tokens = float(capacity)
+            else:
+                tokens = min(float(capacity), tokens + (now - last_refill) * refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            full_at = now + (capacity - tokens) / refill_per_second
+            SLOT.pack_into(self._map, offset, key_hash, now, tokens, full_at)
+        retry_at = now + max(0.0, cost - tokens) / refill_per_second
+        return RateLimitDecision(allowed, capacity, int(tokens), full_at, retry_at)
+
+    def _find(self, key_hash: int, now: float):
+        """
+        Return (offset, time field, value field) of the key's slot, claiming one if needed
+
+        A claimed slot reads as (offset, 0.0, 0.0). When the probe range is
+        full, the slot that expired longest ago is reused; live slots (a
+        window that hasn't ended, a bucket that isn't full) never are.
+        """
+        start = key_hash % self.slots
+        victim, victim_expiry = None, None
+        for probe in range(MAX_PROBES):
+            offset = HEADER.size + ((start + probe) % self.slots) * SLOT.size
+            stored_hash, stored_time, value, expires_at = SLOT.unpack_from(self._map, offset)
+            if stored_hash == key_hash:
+                return offset, stored_time, value
+            if stored_hash == 0:
+                return offset, 0.0, 0.0
+            if expires_at <= now and (victim is None or expires_at < victim_expiry):
+                victim, victim_expiry = offset, expires_at
+        if victim is None:
+            raise RateLimiterFull(f"No free rate limit slot within {MAX_PROBES} probes; raise RATE_LIMIT_SLOTS")
+        return victim, 0.0, 0.0
+
+    def _locked(self):
+        return _FileLock(self._lock, self._fd)
+
+class _FileLock:
+    """Process-local lock plus an exclusive flock on the shared file"""
+
+    def __init__(self, lock: threading.Lock, fd: int):
+        self._lock = lock
+        self._fd = fd
+
+    def __enter__(self):
+        self._lock.acquire()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+# KEYS[1] = counter; ARGV = limit, window end (unix time), cost, floor
+_FIXED_WINDOW_SCRIPT = """
+local count = tonumber(redis.call('GET', KEYS[1]) or '0')
+local floor = tonumber(ARGV[4])
+if floor > count then count = floor end
+local allowed = 0
+if count + tonumber(ARGV[3]) <= tonumber(ARGV[1]) then
+    count = count + tonumber(ARGV[3])
+    allowed = 1
+end
+redis.call('SET', KEYS[1], count)
+redis.call('EXPIREAT', KEYS[1], math.ceil(tonumber(ARGV[2])))
+return {allowed, count}
+"""
+
+# KEYS[1] = bucket hash; ARGV = capacity, refill per second, cost
+_TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = capacity
+if state[1] then
+    tokens = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+end
+local allowed = 0
+if tokens >= tonumber(ARGV[3]) then
+    tokens = tokens - tonumber(ARGV[3])
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens), tostring(now)}
+"""
+
+class RedisRateLimiter:
+    """Limiter state in Redis (atomic Lua scripts), shared by every host"""
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL):
+        self._client = redis.Redis.from_url(url)
+        self._fixed_window = self._client.register_script(_FIXED_WINDOW_SCRIPT)
+        self._token_bucket = self._client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    def fixed_window(self, key: str, limit: int, window_end: float, cost: int = 1,
+                     floor: Optional[int] = None) -> RateLimitDecision:
+        # The window end is part of the key, so a new window starts from zero
+        allowed, count = self._fixed_window(
+            keys=[f'rl:fw:{key}:{int(window_end)}'], args=[limit, window_end, cost, floor or 0]
+        )
+        return RateLimitDecision(bool(allowed), limit, max(0, limit - int(count)), window_end)
+
+    def token_bucket(self, key: str, capacity: int, refill_per_second: float,
+                     cost: int = 1) -> RateLimitDecision:
+        allowed, tokens, now = self._token_bucket(keys=[f'rl:tb:{key}'], args=[capacity, refill_per_second, cost])
+        tokens, now = float(tokens), float(now)
+        return RateLimitDecision(bool(allowed), capacity, int(tokens), now + (capacity - tokens) / refill_per_second,
+                                 now + max(0.0, cost - tokens) / refill_per_second)
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Return this worker's limiter: Redis if configured and available, else shared memory"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            if RATE_LIMIT_REDIS_URL and redis is not None:
+                _limiter = RedisRateLimiter()
+            else:
+                if RATE_LIMIT_REDIS_URL:
+                    print("RATE_LIMIT_REDIS_URL is set but redis is not installed; using shared memory")
+                _limiter = SharedMemoryRateLimiter()
+        return _limiter
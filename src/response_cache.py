@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Catalog response cache
+Caches successful catalog responses by URL and keeps each body in its
+precompressed forms, so hot pages are compressed once instead of per request.
+Entries are dropped by catalog change notifications (see catalog_events.py).
+"""
+
+import os
+import threading
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional
+from flask import make_response, request
+from src.catalog_events import CatalogCache, catalog_version
+from src.compression import MIN_COMPRESS_SIZE, choose_encoding, compress, is_compressible
+
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 5000))
+
+class CachedBody:
+    """A response body plus its lazily built compressed variants"""
+
+    def __init__(self, body: bytes, mimetype: str, compressible: bool):
+        self.body = body
+        self.mimetype = mimetype
+        self.compressible = compressible and len(body) >= MIN_COMPRESS_SIZE
+        self._variants: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding: Optional[str]) -> bytes:
+        """Return the body in the given encoding, compressing it on first use"""
+        if encoding is None or not self.compressible:
+            return self.body
+        data = self._variants.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._variants.get(encoding)
+                if data is None:
+                    data = compress(self.body, encoding, precompress=True)
+                    self._variants[encoding] = data
+        return data
+
+_cache = CatalogCache(ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+
+def _serve(entry: CachedBody):
+    encoding = choose_encoding(request.headers.get('Accept-Encoding')) if entry.compressible else None
+    response = make_response(entry.variant(encoding))
+    response.mimetype = entry.mimetype
+    if entry.compressible:
+        response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def cached_response(movie_ids: Optional[Callable[..., Iterable[int]]] = None):
+    """
+    Cache a catalog endpoint's 200 responses, keyed by path and query string
+
+    Args:
+        movie_ids: Optional function of the view's arguments returning the
+            movies the response depends on; without it, any catalog change
+            invalidates the entry
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = request.full_path
+            entry = _cache.get(key)
+            if entry is not None:
+                return _serve(entry)
+
+            version = catalog_version()
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+
+            entry = CachedBody(response.get_data(), response.mimetype, is_compressible(response))
+            # Skip storing a body that may predate a change seen while rendering it
+            if catalog_version() == version:
+                tags = list(movie_ids(*args, **kwargs)) if movie_ids else None
+                _cache.set(key, entry, tags)
+            return _serve(entry)
+        return decorated_function
+    return decorator
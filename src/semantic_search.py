@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Semantic plot search
+Each movie's title and plot are embedded locally (no model download, no GPU):
+TF-IDF weighted word and bigram counts are projected to a small dense vector
+with a sparse random projection, where every token hashes (crc32) to a few
+signed dimensions. Vectors live in one float32 matrix, so a query is a single
+matrix-vector product. Rows are re-embedded as catalog events report changes.
+"""
+
+import math
+import re
+import threading
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from src.database import execute_query
+from src.catalog_events import CatalogUpdater
+
+EMBEDDING_DIMENSIONS = 256
+# Non-zero entries per token in the projection (its "hash functions")
+PROJECTION_NONZEROS = 8
+MIN_SCORE = 0.05
+# Share of freed (deleted movie) rows at which the matrix is compacted
+COMPACT_DEAD_FRACTION = 0.2
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset("""
+    a about after against all also an and any are as at be because been before
+    being between both but by can could did do does during each for from had has
+    have he her here him his how i if in into is it its just me more most movie
+    film my no not now of on once one only or other our out over own same she
+    should so some such than that the their them then there these they this
+    those through to too under until up very was we were what when where which
+    while who whom why will with would you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words (minus stopwords) and adjacent-word bigrams"""
+    words = [word for word in _TOKEN.findall(text.lower()) if word not in STOPWORDS]
+    return words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+
+@lru_cache(maxsize=200000)
+def _projection(token: str) -> Tuple[np.ndarray, np.ndarray]:
+    """The token's column of the random projection: (dimensions, signs)"""
+    encoded = token.encode('utf-8')
+    dimensions = np.empty(PROJECTION_NONZEROS, dtype=np.intp)
+    signs = np.empty(PROJECTION_NONZEROS, dtype=np.float32)
+    for i in range(PROJECTION_NONZEROS):
+        hashed = zlib.crc32(encoded, i * 0x9E3779B1 & 0xFFFFFFFF)
+        dimensions[i] = hashed % EMBEDDING_DIMENSIONS
+        signs[i] = 1.0 if hashed & 0x80000000 else -1.0
+    return dimensions, signs
+
+class SemanticIndex:
+    """Embedding matrix of the catalog, kept current by catalog events"""
+
+    def __init__(self):
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._matrix = np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        self._rows: Dict[int, int] = {}
+        # Document frequencies; kept current, but existing rows are only
+        # re-weighted on a full rebuild
+        self._document_frequency: Counter = Counter()
+        self._tokens: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def build(self) -> None:
+        """Embed every movie"""
+        texts = self._load_texts(None)
+        tokens = {movie_id: tokenize(text) for movie_id, text in texts.items()}
+        document_frequency = Counter()
+        for movie_tokens in tokens.values():
+            document_frequency.update(set(movie_tokens))
+
+        ids = np.array(sorted(tokens), dtype=np.int64)
+        matrix = np.zeros((len(ids), EMBEDDING_DIMENSIONS), dtype=np.float32)
+        with self._lock:
+            self._document_frequency = document_frequency
+            self._tokens = {movie_id: set(movie_tokens) for movie_id, movie_tokens in tokens.items()}
+            for row, movie_id in enumerate(ids.tolist()):
+                matrix[row] = self._embed(tokens[movie_id])
+            self._rows = {movie_id: row for row, movie_id in enumerate(ids.tolist())}
+            self._ids = ids
+            self._matrix = matrix
+
+    def refresh(self, movie_ids: Optional[Set[int]]) -> None:
+        """Re-embed only the given movies (None rebuilds everything)"""
+        if movie_ids is None:
+            self.build()
+            return
+
+        texts = self._load_texts(movie_ids)
+        with self._lock:
+            # Copy-on-write: search() scores the published arrays outside the lock
+            ids = self._ids.copy()
+            matrix = self._matrix.copy()
+            appended_ids = []
+            appended_vectors = []
+            for movie_id in movie_ids:
+                old_tokens = self._tokens.pop(movie_id, set())
+                self._document_frequency.subtract(old_tokens)
+                row = self._rows.get(movie_id)
+
+                if movie_id not in texts:
+                    if row is not None:
+                        # Free the row: it matches nothing, is skipped in results
+                        # and is dropped at the next compaction
+                        del self._rows[movie_id]
+                        ids[row] = -1
+                        matrix[row] = 0.0
+                    continue
+
+                tokens = tokenize(texts[movie_id])
+                self._tokens[movie_id] = set(tokens)
+                self._document_frequency.update(set(tokens))
+                vector = self._embed(tokens)
+                if row is not None:
+                    matrix[row] = vector
+                else:
+                    self._rows[movie_id] = len(ids) + len(appended_ids)
+                    appended_ids.append(movie_id)
+                    appended_vectors.append(vector)
+
+            if appended_ids:
+                ids = np.concatenate((ids, np.array(appended_ids, dtype=np.int64)))
+                matrix = np.vstack((matrix, np.array(appended_vectors, dtype=np.float32)))
+            if len(ids) - len(self._rows) > COMPACT_DEAD_FRACTION * len(ids):
+                live = ids >= 0
+                ids, matrix = ids[live], matrix[live]
+                self._rows = {movie_id: row for row, movie_id in enumerate(ids.tolist())}
+            self._ids = ids
+            self._matrix = matrix
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[int, float]]:
+        """Top-k (movie_id, cosine score) pairs for a free-text query"""
+        tokens = tokenize(query)
+        with self._lock:
+            vector = self._embed(tokens)
+            ids, matrix = self._ids, self._matrix
+        if not vector.any() or len(ids) == 0:
+            return []
+
+        scores = matrix @ vector
+        candidates = np.flatnonzero(scores >= MIN_SCORE)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(ids[row]), float(scores[row])) for row in candidates if ids[row] >= 0]
+
+    def _embed(self, tokens: Iterable[str]) -> np.ndarray:
+        """Unit-length projection of a token list's TF-IDF vector (caller holds the lock)"""
+        vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+        documents = max(len(self._tokens), 1)
+        for token, count in Counter(tokens).items():
+            frequency = self._document_frequency.get(token, 0)
+            if frequency == 0:
+                continue  # not in any movie, so it can only add noise
+            weight = (1.0 + math.log(count)) * (math.log((1 + documents) / (1 + frequency)) + 1.0)
+            dimensions, signs = _projection(token)
+            np.add.at(vector, dimensions, signs * weight)
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _load_texts(self, movie_ids: Optional[Set[int]]) -> Dict[int, str]:
+        """Title and plot of every movie (or just movie_ids)"""
+        query = "SELECT id, title, plot FROM movies"
+        params = None
+        if movie_ids is not None:
+            query += " WHERE id = ANY(%s)"
+            params = (list(movie_ids),)
+        return {
+            row['id']: f"{row['title'] or ''}. {row['plot'] or ''}"
+            for row in execute_query(query, params, fetch=True)
+        }
+
+_index: Optional[SemanticIndex] = None
+_index_lock = threading.Lock()
+
+def get_semantic_index() -> SemanticIndex:
+    """Return this worker's semantic index, building it on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = SemanticIndex()
+            CatalogUpdater(index.refresh, 'semantic-index-refresh').start(index.build)
+            _index = index
+        return _index
+
+def start_semantic_index() -> None:
+    """Build the index in the background so the first search doesn't pay for it"""
+    def build():
+        try:
+            get_semantic_index()
+        except Exception as e:
+            print(f"Semantic index build failed: {e}")
+    threading.Thread(target=build, name='semantic-index-build', daemon=True).start()
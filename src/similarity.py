@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+In-memory "more like this" index
+Each movie is a sparse feature vector (genres, cast, director, decade, rating
+band). Top-k lookups score every movie at once with a vectorized sparse dot
+product over the inverted feature index and rank by cosine similarity.
+The compiled arrays are saved to a memory-mapped snapshot file (see
+snapshot_file.py) so other workers can map them instead of rebuilding.
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from src.database import execute_query
+from src.catalog import get_catalog_revision, normalize_person_name
+from src.catalog_events import CatalogUpdater
+from src.snapshot_file import SnapshotFile, encode_strings, open_snapshot_file, snapshot_path, write_snapshot_file
+
+FEATURE_WEIGHTS = {
+    'genre': 1.0,
+    'director': 1.0,
+    'cast': 0.6,
+    'decade': 0.5,
+    'rating': 0.4
+}
+
+def movie_features(movie: Dict, genres: Iterable[str], cast: Iterable[str]) -> Dict[str, float]:
+    """Build the sparse feature vector of a movie as {feature name: weight}"""
+    features = {}
+    for genre in genres:
+        features[f'genre:{genre}'] = FEATURE_WEIGHTS['genre']
+    for actor in cast:
+        features[f'cast:{normalize_person_name(actor)}'] = FEATURE_WEIGHTS['cast']
+    if movie.get('director'):
+        features[f"director:{normalize_person_name(movie['director'])}"] = FEATURE_WEIGHTS['director']
+    if movie.get('year'):
+        features[f"decade:{movie['year'] // 10 * 10}"] = FEATURE_WEIGHTS['decade']
+    if movie.get('rating') is not None:
+        features[f"rating:{int(float(movie['rating']))}"] = FEATURE_WEIGHTS['rating']
+    return features
+
+class CompiledIndex:
+    """Immutable array form of the index: CSR rows plus an inverted (CSC) copy"""
+
+    ARRAYS = ('ids', 'row_indptr', 'row_features', 'row_weights',
+              'feature_indptr', 'feature_rows', 'feature_weights', 'norms')
+
+    def __init__(self, ids: np.ndarray, row_indptr: np.ndarray, row_features: np.ndarray,
+                 row_weights: np.ndarray, feature_indptr: np.ndarray, feature_rows: np.ndarray,
+                 feature_weights: np.ndarray, norms: np.ndarray):
+        # ids are sorted, so a movie's row is found with a binary search
+        self.ids = ids
+        self.row_indptr = row_indptr
+        self.row_features = row_features
+        self.row_weights = row_weights
+        self.feature_indptr = feature_indptr
+        self.feature_rows = feature_rows
+        self.feature_weights = feature_weights
+        self.norms = norms
+
+    @classmethod
+    def build(cls, ids: np.ndarray, row_indptr: np.ndarray, row_features: np.ndarray,
+              row_weights: np.ndarray, feature_count: int) -> 'CompiledIndex':
+        """Derive the inverted copy and row norms from the CSR rows"""
+        rows = np.repeat(np.arange(len(ids), dtype=np.int32), np.diff(row_indptr))
+        order = np.argsort(row_features, kind='stable')
+        feature_indptr = np.zeros(feature_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_features, minlength=feature_count), out=feature_indptr[1:])
+        norms = np.sqrt(np.bincount(rows, weights=row_weights ** 2, minlength=len(ids)))
+        return cls(ids, row_indptr, row_features, row_weights,
+                   feature_indptr, rows[order], row_weights[order], norms)
+
+    @classmethod
+    def from_file(cls, snapshot_file: SnapshotFile) -> 'CompiledIndex':
+        """Use a mapped snapshot file in place"""
+        return cls(*(snapshot_file.array(name) for name in cls.ARRAYS))
+
+    def row(self, movie_id: int) -> Optional[int]:
+        row = int(np.searchsorted(self.ids, movie_id))
+        if row < len(self.ids) and self.ids[row] == movie_id:
+            return row
+        return None
+
+    def features(self, names) -> Dict[int, Dict[str, float]]:
+        """Expand back into {movie_id: {feature name: weight}}"""
+        features = {}
+        for row, movie_id in enumerate(self.ids.tolist()):
+            start, end = self.row_indptr[row], self.row_indptr[row + 1]
+            features[movie_id] = {
+                names[feature]: float(weight)
+                for feature, weight in zip(self.row_features[start:end].tolist(),
+                                           self.row_weights[start:end].tolist())
+            }
+        return features
+
+    def top_k(self, movie_id: int, k: int) -> List[Tuple[int, float]]:
+        """Return up to k (movie_id, cosine score) pairs most similar to movie_id"""
+        row = self.row(movie_id)
+        if row is None:
+            return []
+
+        start, end = self.row_indptr[row], self.row_indptr[row + 1]
+        query_features = self.row_features[start:end]
+        query_weights = self.row_weights[start:end]
+        if len(query_features) == 0:
+            return []
+
+        # Gather every posting of the query's features in one go
+        starts = self.feature_indptr[query_features]
+        lengths = self.feature_indptr[query_features + 1] - starts
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        postings = offsets + np.arange(lengths.sum())
+
+        scores = np.bincount(
+            self.feature_rows[postings],
+            weights=self.feature_weights[postings] * np.repeat(query_weights, lengths),
+            minlength=len(self.ids)
+        )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = scores / (self.norms * self.norms[row])
+        scores[row] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(self.ids[i]), float(scores[i])) for i in candidates]
+
+class SimilarityIndex:
+    """Similarity index built from the catalog tables and kept current by catalog events"""
+
+    def __init__(self):
+        # None while serving a mapped snapshot file; expanded on the first refresh
+        self._features: Optional[Dict[int, Dict[str, float]]] = {}
+        # Feature names of the compiled index; always swapped in together with it
+        self._names: List[str] = []
+        self._compiled: Optional[CompiledIndex] = None
+        self._lock = threading.Lock()
+        # Serializes rebuilds, which compile outside _lock so lookups never wait on them
+        self._update_lock = threading.Lock()
+
+    def load(self) -> None:
+        """Map the snapshot file if it matches the catalog revision, else build and save it"""
+        # Read before the catalog itself, so the label can only understate what the index contains
+        revision = get_catalog_revision()
+        snapshot_file = open_snapshot_file('similarity', revision)
+        if snapshot_file is not None:
+            compiled = CompiledIndex.from_file(snapshot_file)
+            names = snapshot_file.strings('vocabulary')
+            with self._update_lock, self._lock:
+                self._features = None
+                self._names = names
+                self._compiled = compiled
+            return
+
+        self.build()
+        try:
+            self.save(revision)
+        except OSError as e:
+            print(f"Could not write similarity snapshot file: {e}")
+
+    def save(self, revision: int) -> None:
+        """Write the compiled index to its snapshot file, labelled with the catalog revision"""
+        with self._lock:
+            compiled, names = self._compiled, self._names
+        arrays = {name: getattr(compiled, name) for name in CompiledIndex.ARRAYS}
+        arrays.update(encode_strings('vocabulary', list(names)))
+        write_snapshot_file(snapshot_path('similarity'), arrays, {'revision': revision})
+
+    def build(self) -> None:
+        """Load every movie from the catalog tables"""
+        features = self._load_features(None)
+        with self._update_lock:
+            self._swap(features)
+
+    def refresh(self, movie_ids: Optional[Set[int]]) -> None:
+        """
+        Reload only the given movies (None reloads everything)
+
+        Recompiles the whole index, so it runs on the index's CatalogUpdater
+        thread rather than the listener thread, with changes that arrive
+        meanwhile merged into the next call. Lookups keep using the previous
+        index until the new one is swapped in.
+        """
+        if movie_ids is None:
+            self.build()
+            return
+
+        loaded = self._load_features(movie_ids)
+        with self._update_lock:
+            if self._features is None:
+                features = self._compiled.features(self._names)
+            else:
+                features = dict(self._features)
+            for movie_id in movie_ids:
+                if movie_id in loaded:
+                    features[movie_id] = loaded[movie_id]
+                else:
+                    features.pop(movie_id, None)
+            self._swap(features)
+
+    def similar(self, movie_id: int, k: int = 10) -> Optional[List[Tuple[int, float]]]:
+        """Top-k similar movies, or None if the movie isn't in the index"""
+        compiled = self._compiled
+        if compiled is None or compiled.row(movie_id) is None:
+            return None
+        return compiled.top_k(movie_id, k)
+
+    def _swap(self, features: Dict[int, Dict[str, float]]) -> None:
+        """Compile features and make them the live index (caller holds _update_lock)"""
+        compiled, names = self._compile(features)
+        with self._lock:
+            self._features = features
+            self._names = names
+            self._compiled = compiled
+
+    @staticmethod
+    def _compile(features: Dict[int, Dict[str, float]]) -> Tuple[CompiledIndex, List[str]]:
+        """
+        Compile feature vectors into a CompiledIndex and its feature names
+
+        The vocabulary is rebuilt each time, so features only deleted movies
+        had are dropped.
+        """
+        names: List[str] = []
+        vocabulary: Dict[str, int] = {}
+        ids = np.array(sorted(features), dtype=np.int64)
+        row_indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        row_features = []
+        row_weights = []
+        for row, movie_id in enumerate(ids.tolist()):
+            for name, weight in features[movie_id].items():
+                feature = vocabulary.get(name)
+                if feature is None:
+                    feature = vocabulary[name] = len(names)
+                    names.append(name)
+                row_features.append(feature)
+                row_weights.append(weight)
+            row_indptr[row + 1] = len(row_features)
+
+        compiled = CompiledIndex.build(
+            ids, row_indptr,
+            np.asarray(row_features, dtype=np.int32),
+            np.asarray(row_weights, dtype=np.float32),
+            len(names)
+        )
+        return compiled, names
+
+    def _load_features(self, movie_ids: Optional[Set[int]]) -> Dict[int, Dict[str, float]]:
+        """Read movies, genres and cast (all, or just movie_ids) and build their vectors"""
+        where, params = ("", None) if movie_ids is None else (" WHERE {col} = ANY(%s)", (list(movie_ids),))
+
+        movies = execute_query(
+            "SELECT id, year, rating, director FROM movies" + where.format(col='id'),
+            params, fetch=True
+        )
+        genres: Dict[int, List[str]] = {}
+        for row in execute_query(
+            "SELECT movie_id, genre FROM movie_genres" + where.format(col='movie_id'),
+            params, fetch=True
+        ):
+            genres.setdefault(row['movie_id'], []).append(row['genre'])
+        cast: Dict[int, List[str]] = {}
+        for row in execute_query(
+            "SELECT movie_id, actor_name FROM movie_cast" + where.format(col='movie_id'),
+            params, fetch=True
+        ):
+            cast.setdefault(row['movie_id'], []).append(row['actor_name'])
+
+        return {
+            movie['id']: movie_features(movie, genres.get(movie['id'], []), cast.get(movie['id'], []))
+            for movie in movies
+        }
+
+_index: Optional[SimilarityIndex] = None
+_index_lock = threading.Lock()
+
+def get_similarity_index() -> SimilarityIndex:
+    """Return this worker's similarity index, building it on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = SimilarityIndex()
+            CatalogUpdater(index.refresh, 'similarity-index-refresh').start(index.load)
+            _index = index
+        return _index
+
+def start_similarity_index() -> None:
+    """Build the index in the background so the first request doesn't pay for it"""
+    def build():
+        try:
+            get_similarity_index()
+        except Exception as e:
+            print(f"Similarity index build failed: {e}")
+    threading.Thread(target=build, name='similarity-index-build', daemon=True).start()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped snapshot files
+A snapshot file holds named NumPy arrays (and string tables encoded as arrays)
+behind a small JSON header. Workers mmap the file and use the arrays in place,
+so startup is near-instant and the pages are shared through the OS page cache.
+
+Layout:
+    magic (8 bytes) | header length (8 bytes, little-endian) | JSON header |
+    arrays, each starting on a 64-byte boundary
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence
+import numpy as np
+
+MAGIC = b'MVSNAP01'
+ALIGNMENT = 64
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'movie-api-snapshots'))
+
+def snapshot_path(name: str) -> str:
+    """Path of the snapshot file for a structure (e.g. 'catalog', 'similarity')"""
+    return os.path.join(SNAPSHOT_DIR, f'{name}.snap')
+
+class StringTable:
+    """Read-only list of strings (or None) decoded on access from a UTF-8 blob"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, nulls: Optional[np.ndarray] = None):
+        self.blob = blob
+        self.offsets = offsets
+        self.nulls = nulls
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        if self.nulls is not None and self.nulls[index]:
+            return None
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.blob[start:end].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+def encode_strings(name: str, values: Sequence[Optional[str]]) -> Dict[str, np.ndarray]:
+    """Encode strings as the arrays behind a StringTable, keyed under name"""
+    encoded = [b'' if value is None else value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    arrays = {
+        f'{name}.blob': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        f'{name}.offsets': offsets
+    }
+    if any(value is None for value in values):
+        arrays[f'{name}.nulls'] = np.fromiter((value is None for value in values), dtype=np.bool_, count=len(values))
+    return arrays
+
+def write_snapshot_file(path: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> None:
+    """
+    Write arrays and metadata to a snapshot file
+
+    The file is written under a temporary name and renamed into place, so
+    readers (including workers that have the old file mapped) never see a
+    partial file.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+
+    header = json.dumps({
+        'meta': meta,
+        'built_at': datetime.now().isoformat(),
+        'arrays': entries
+    }).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + entries[name]['offset'])
+            f.write(array.tobytes())
+        # Trailing empty arrays still need their offset to lie inside the file
+        f.truncate(data_start + offset)
+    os.replace(temp_path, path)
+
+class SnapshotFile:
+    """A mapped snapshot file; arrays are zero-copy views into the mapping"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        header_length, = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._mmap[header_start:header_start + header_length])
+
+        self.meta: Dict[str, Any] = header['meta']
+        self.built_at: str = header['built_at']
+        self._entries: Dict[str, Dict] = header['arrays']
+        self._data_start = -(-(header_start + header_length) // ALIGNMENT) * ALIGNMENT
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def array(self, name: str) -> np.ndarray:
+        entry = self._entries[name]
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        return np.frombuffer(
+            self._mmap, dtype=dtype, count=count, offset=self._data_start + entry['offset']
+        ).reshape(entry['shape'])
+
+    def strings(self, name: str) -> StringTable:
+        nulls = self.array(f'{name}.nulls') if f'{name}.nulls' in self else None
+        return StringTable(self.array(f'{name}.blob'), self.array(f'{name}.offsets'), nulls)
+
+def open_snapshot_file(name: str, revision: int) -> Optional[SnapshotFile]:
+    """Map the named snapshot file if it exists and was built at the given catalog revision"""
+    path = snapshot_path(name)
+    try:
+        snapshot = SnapshotFile(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring unreadable snapshot file {path}: {e}")
+        return None
+    return snapshot if snapshot.meta.get('revision') == revision else None
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Background usage-log writer
+Requests only enqueue a usage event; a background thread writes them to
+usage_logs in batches when the batch fills up or the flush interval passes.
+daily_usage is write-behind: requests bump in-process per-(key, day)
+counters that are flushed as one upsert per key every counter interval, and
+quota reads add the unflushed counts to what the table holds. Whatever is
+pending at interpreter exit is drained before the process goes away.
+
+usage_logs is partitioned by month and stores endpoint IDs from the
+endpoints table; the writer resolves names to IDs (cached per worker) and
+keeps the next months' partitions created. Each batch also adds its
+per-key, per-hour counts to the usage_hourly rollup in the same transaction.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from psycopg2.extras import execute_values
+from src.database import execute_query, get_db_connection
+
+USAGE_BATCH_SIZE = int(os.getenv('USAGE_BATCH_SIZE', 500))
+USAGE_FLUSH_SECONDS = float(os.getenv('USAGE_FLUSH_SECONDS', 1.0))
+USAGE_COUNTER_FLUSH_SECONDS = float(os.getenv('USAGE_COUNTER_FLUSH_SECONDS', 5.0))
+USAGE_QUEUE_SIZE = int(os.getenv('USAGE_QUEUE_SIZE', 50000))
+# Backpressure: how long a request may wait for room in a full queue before
+# its event is dropped (0 drops immediately)
+USAGE_QUEUE_WAIT_SECONDS = float(os.getenv('USAGE_QUEUE_WAIT_SECONDS', 0.05))
+# Months of usage_logs partitions to keep created ahead of the current one
+USAGE_PARTITIONS_AHEAD = int(os.getenv('USAGE_PARTITIONS_AHEAD', 2))
+USAGE_PARTITION_CHECK_SECONDS = 3600
+
+# (api_key_id, endpoint, status_code, timestamp)
+UsageEvent = Tuple[int, str, int, datetime]
+
+class DailyUsageCounters:
+    """Unflushed daily_usage increments per (api_key_id, date)"""
+
+    def __init__(self):
+        # Keyed by (api_key_id, date, user_id); user_id is None when unknown
+        self._deltas: Dict[Tuple[int, date, Optional[int]], int] = {}
+        # Taken by a flush that hasn't committed yet; still counted by pending()
+        self._flushing: Dict[Tuple[int, date, Optional[int]], int] = {}
+        # Running total of both of the above per (user_id, date), for pending()
+        self._user_totals: Dict[Tuple[int, date], int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, api_key_id: int, day: date, user_id: Optional[int] = None) -> None:
+        key = (api_key_id, day, user_id)
+        with self._lock:
+            self._deltas[key] = self._deltas.get(key, 0) + 1
+            if user_id is not None:
+                self._user_totals[(user_id, day)] = self._user_totals.get((user_id, day), 0) + 1
+
+    def pending(self, user_id: int, day: date) -> int:
+        """Requests by a user's keys on a day that aren't in daily_usage yet"""
+        with self._lock:
+            return self._user_totals.get((user_id, day), 0)
+
+    def flush(self) -> None:
+        """Write the counts as one upsert row per key and day"""
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._deltas = self._deltas, {}
+            if not self._flushing:
+                return
+            counts: Dict[Tuple[int, date], int] = {}
+            for (api_key_id, day, _), count in self._flushing.items():
+                counts[(api_key_id, day)] = counts.get((api_key_id, day), 0) + count
+            try:
+                write_daily_usage(counts)
+            except Exception as e:
+                print(f"Failed to write daily usage, will retry: {e}")
+                with self._lock:
+                    for key, count in self._flushing.items():
+                        self._deltas[key] = self._deltas.get(key, 0) + count
+                    self._flushing = {}
+                return
+            with self._lock:
+                for (_, day, user_id), count in self._flushing.items():
+                    if user_id is None:
+                        continue
+                    remaining = self._user_totals[(user_id, day)] - count
+                    if remaining:
+                        self._user_totals[(user_id, day)] = remaining
+                    else:
+                        del self._user_totals[(user_id, day)]
+                self._flushing = {}
+
+class UsageWriter:
+    """Bounded queue of usage events drained in batches by a daemon thread"""
+
+    def __init__(self):
+        self._queue: 'queue.Queue[UsageEvent]' = queue.Queue(maxsize=USAGE_QUEUE_SIZE)
+        # Batch that failed to write, retried with the next flush
+        self._retry: List[UsageEvent] = []
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.counters = DailyUsageCounters()
+        self.dropped = 0
+
+    def record(self, api_key_id: int, endpoint: str, status_code: int, user_id: Optional[int] = None) -> None:
+        """
+        Count one request and queue its usage event
+
+        Never waits longer than USAGE_QUEUE_WAIT_SECONDS; if the event is
+        dropped the request still counts towards daily usage.
+        """
+        self._ensure_started()
+        event = (api_key_id, endpoint, status_code, datetime.now())
+        self.counters.add(api_key_id, event[3].date(), user_id)
+        try:
+            if USAGE_QUEUE_WAIT_SECONDS > 0:
+                self._queue.put(event, timeout=USAGE_QUEUE_WAIT_SECONDS)
+            else:
+                self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"Usage queue full: dropped {self.dropped} usage events so far")
+
+    def flush(self) -> int:
+        """Write everything queued so far, returning the number of events written"""
+        written = 0
+        while True:
+            batch = self._retry or self._take(USAGE_BATCH_SIZE)
+            if not batch:
+                return written
+            try:
+                write_usage_events(batch)
+            except Exception as e:
+                # Retry the batch once with the next flush, then give up on it
+                if self._retry:
+                    print(f"Dropping {len(batch)} usage events after a failed retry: {e}")
+                    self._retry = []
+                else:
+                    print(f"Failed to write usage events, will retry: {e}")
+                    self._retry = batch
+                return written
+            self._retry = []
+            written += len(batch)
+
+    def stop(self) -> None:
+        """Stop the writer thread and drain the queue"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+        self.counters.flush()
+
+    def _take(self, limit: int) -> List[UsageEvent]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        counters_due = time.monotonic() + USAGE_COUNTER_FLUSH_SECONDS
+        partitions_due = time.monotonic()
+        while not self._stop_event.is_set():
+            if time.monotonic() >= partitions_due:
+                try:
+                    ensure_usage_log_partitions(USAGE_PARTITIONS_AHEAD)
+                except Exception as e:
+                    print(f"Failed to create usage log partitions: {e}")
+                partitions_due = time.monotonic() + USAGE_PARTITION_CHECK_SECONDS
+            deadline = min(time.monotonic() + USAGE_FLUSH_SECONDS, counters_due)
+            # Wake early once a full batch is waiting
+            while time.monotonic() < deadline and self._queue.qsize() < USAGE_BATCH_SIZE:
+                if self._stop_event.wait(min(0.05, USAGE_FLUSH_SECONDS)):
+                    return
+            self.flush()
+            if time.monotonic() >= counters_due:
+                self.counters.flush()
+                counters_due = time.monotonic() + USAGE_COUNTER_FLUSH_SECONDS
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='usage-writer', daemon=True)
+                thread.start()
+                atexit.register(self.stop)
+                self._thread = thread
+
+# Endpoint name -> endpoints.id; names are a small fixed set (Flask endpoints)
+_endpoint_ids: Dict[str, int] = {}
+
+def _resolve_endpoint_ids(cursor, names: Iterable[str]) -> Dict[str, int]:
+    """IDs of endpoint names, adding names seen for the first time (cached once committed)"""
+    endpoint_ids = dict(_endpoint_ids)
+    missing = sorted(set(names) - endpoint_ids.keys())
+    if missing:
+        execute_values(cursor, """
+            INSERT INTO endpoints (name) VALUES %s ON CONFLICT (name) DO NOTHING
+        """, [(name,) for name in missing])
+        cursor.execute("SELECT id, name FROM endpoints WHERE name = ANY(%s)", (missing,))
+        endpoint_ids.update({name: endpoint_id for endpoint_id, name in cursor.fetchall()})
+    return endpoint_ids
+
+def write_usage_events(events: List[UsageEvent]) -> None:
+    """Insert a batch of usage events into usage_logs in one statement per 1000 rows"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            endpoint_ids = _resolve_endpoint_ids(cursor, (event[1] for event in events))
+            rows = [(api_key_id, endpoint_ids[endpoint], status_code, logged_at)
+                    for api_key_id, endpoint, status_code, logged_at in events]
+            # Keys deleted since the request was served are skipped, not an error
+            execute_values(cursor, """
+                INSERT INTO usage_logs (api_key_id, endpoint_id, status_code, timestamp)
+                SELECT v.api_key_id, v.endpoint_id, v.status_code, v.logged_at
+                FROM (VALUES %s) AS v(api_key_id, endpoint_id, status_code, logged_at)
+                WHERE EXISTS (SELECT 1 FROM api_keys ak WHERE ak.id = v.api_key_id)
+            """, rows, page_size=1000)
+            # Sorted so concurrent writers lock rollup rows in the same order
+            hourly = Counter((api_key_id, logged_at.replace(minute=0, second=0, microsecond=0))
+                             for api_key_id, _, _, logged_at in events)
+            execute_values(cursor, """
+                INSERT INTO usage_hourly (api_key_id, hour, request_count)
+                SELECT v.api_key_id, v.hour, v.request_count
+                FROM (VALUES %s) AS v(api_key_id, hour, request_count)
+                WHERE EXISTS (SELECT 1 FROM api_keys ak WHERE ak.id = v.api_key_id)
+                ON CONFLICT (api_key_id, hour)
+                DO UPDATE SET request_count = usage_hourly.request_count + EXCLUDED.request_count
+            """, [(api_key_id, hour, count) for (api_key_id, hour), count in sorted(hourly.items())],
+                page_size=1000)
+        conn.commit()
+    _endpoint_ids.update(endpoint_ids)
+
+def write_daily_usage(counts: Dict[Tuple[int, date], int]) -> None:
+    """Add request counts to daily_usage, one upsert row per key and day"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            # Sorted so concurrent flushes from several workers lock rows in the same order
+            execute_values(cursor, """
+                INSERT INTO daily_usage (api_key_id, date, request_count)
+                SELECT v.api_key_id, v.date, v.request_count
+                FROM (VALUES %s) AS v(api_key_id, date, request_count)
+                WHERE EXISTS (SELECT 1 FROM api_keys ak WHERE ak.id = v.api_key_id)
+                ON CONFLICT (api_key_id, date)
+                DO UPDATE SET request_count = daily_usage.request_count + EXCLUDED.request_count
+            """, [(api_key_id, day, count) for (api_key_id, day), count in sorted(counts.items())],
+                page_size=1000)
+        conn.commit()
+
+_writer = UsageWriter()
+
+def get_usage_writer() -> UsageWriter:
+    return _writer
+
+def record_usage(api_key_id: int, endpoint: str, status_code: int, user_id: Optional[int] = None) -> None:
+    """
+    Log one API request without touching the database in the request path
+
+    Args:
+        user_id: Owner of the key; needed for pending_daily_usage to see this request
+    """
+    _writer.record(api_key_id, endpoint, status_code, user_id)
+
+def ensure_usage_log_partitions(months_ahead: int = USAGE_PARTITIONS_AHEAD) -> int:
+    """Create missing usage_logs partitions up to months_ahead, returning how many were created"""
+    return execute_query("SELECT ensure_usage_log_partitions(%s) AS created",
+                         (months_ahead,), fetch=True)[0]['created']
+
+def drop_usage_log_partitions(retention_months: int) -> int:
+    """Detach and drop usage_logs partitions of months past the retention period"""
+    return execute_query("SELECT drop_usage_log_partitions(%s) AS dropped",
+                         (retention_months,), fetch=True)[0]['dropped']
+
+def purge_hourly_usage(retention_days: int) -> int:
+    """Delete usage_hourly rows older than the retention window, returning how many were removed"""
+    return execute_query(
+        "DELETE FROM usage_hourly WHERE hour < CURRENT_TIMESTAMP - make_interval(days => %s)",
+        (retention_days,)
+    )
+
+def pending_daily_usage(user_id: int, day: Optional[date] = None) -> int:
+    """This worker's requests by a user that daily_usage doesn't include yet"""
+    return _writer.counters.pending(user_id, day or datetime.now().date())
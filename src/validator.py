@@ -7,12 +7,17 @@ class MovieCSVValidator:
     """Validates movie CSV files according to Phase 1 requirements"""
     
     REQUIRED_FIELDS = ['title', 'year', 'genre', 'runtime']
-    VALID_GENRES = {
-        'Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 
-        'Documentary', 'Drama', 'Family', 'Fantasy', 'Film-Noir', 'History', 
-        'Horror', 'Music', 'Musical', 'Mystery', 'Romance', 'Sci-Fi', 
+    # Bit position of each genre in genre bitmasks (catalog snapshot, movies.genre_mask).
+    # Masks may be persisted, so new genres go at the end and existing ones never move.
+    GENRE_BIT_ORDER = (
+        'Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime',
+        'Documentary', 'Drama', 'Family', 'Fantasy', 'Film-Noir', 'History',
+        'Horror', 'Music', 'Musical', 'Mystery', 'Romance', 'Sci-Fi',
         'Sport', 'Thriller', 'War', 'Western'
-    }
+    )
+    # Derived from the bit order so the two lists can't drift apart
+    VALID_GENRES = frozenset(GENRE_BIT_ORDER)
+    GENRE_BITS = {genre: 1 << bit for bit, genre in enumerate(GENRE_BIT_ORDER)}
     
     MIN_YEAR = 1900
     MAX_YEAR = 2025
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Offline tests for the shared-memory rate limiter (no database or API needed)
+Covers fixed windows, token buckets, atomicity across processes and what
+happens when the slot table fills up.
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+sys.path.append('.')
+sys.path.append('./src')
+
+from src.rate_limiter import RateLimiterFull, SharedMemoryRateLimiter
+
+# Removed at interpreter exit
+_state_dir = tempfile.TemporaryDirectory(prefix='rate-limits-')
+
+def new_limiter(name: str, slots: int = 1024) -> SharedMemoryRateLimiter:
+    return SharedMemoryRateLimiter(os.path.join(_state_dir.name, name), slots)
+
+def test_fixed_window_limit():
+    """A window allows exactly limit requests, and a new window starts over"""
+    limiter = new_limiter('fixed')
+    window_end = time.time() + 60
+    results = [limiter.fixed_window('user', 3, window_end).allowed for _ in range(5)]
+    assert results == [True, True, True, False, False]
+    assert limiter.fixed_window('user', 3, window_end + 60).remaining == 2
+
+def test_fixed_window_floor():
+    """Usage known from elsewhere raises the count"""
+    limiter = new_limiter('floor')
+    window_end = time.time() + 60
+    decision = limiter.fixed_window('user', 10, window_end, floor=9)
+    assert decision.allowed and decision.remaining == 0
+    assert not limiter.fixed_window('user', 10, window_end).allowed
+
+def test_token_bucket():
+    """A bucket allows its capacity at once, then refills over time"""
+    limiter = new_limiter('bucket')
+    assert [limiter.token_bucket('key', 2, 100).allowed for _ in range(3)] == [True, True, False]
+    time.sleep(0.02)
+    assert limiter.token_bucket('key', 2, 100).allowed
+
+def test_token_bucket_retry_at():
+    """A denied request can retry once the next token arrives, not when the bucket is full"""
+    limiter = new_limiter('retry')
+    for _ in range(10):
+        limiter.token_bucket('key', 10, 0.1)
+    decision = limiter.token_bucket('key', 10, 0.1)
+    assert not decision.allowed
+    assert decision.retry_at - time.time() <= 10.5
+    assert decision.reset_at - time.time() > 90
+
+def test_full_table_never_resets_live_windows():
+    """Exhausted quotas stay exhausted when there are more keys than slots"""
+    limiter = new_limiter('full', slots=64)
+    window_end = time.time() + 3600
+    tracked = []
+    for user in range(200):
+        try:
+            limiter.fixed_window(f'user:{user}', 1, window_end)
+            tracked.append(user)
+        except RateLimiterFull:
+            pass
+    assert len(tracked) <= 64
+
+    for user in tracked:
+        try:
+            assert not limiter.fixed_window(f'user:{user}', 1, window_end).allowed, \
+                f"user {user} got a fresh quota"
+        except RateLimiterFull:
+            pass
+
+def test_full_table_reuses_expired_slots():
+    """Slots of ended windows are reused for new keys"""
+    limiter = new_limiter('expired', slots=8)
+    for user in range(8):
+        limiter.fixed_window(f'old:{user}', 1, time.time() - 1)
+    assert limiter.fixed_window('new', 1, time.time() + 60).allowed
+
+def _consume(path: str, window_end: float) -> int:
+    limiter = SharedMemoryRateLimiter(path, 1024)
+    return sum(limiter.fixed_window('shared', 1000, window_end).allowed for _ in range(400))
+
+def test_atomic_across_processes():
+    """Concurrent workers never allow more than the limit in total"""
+    path = os.path.join(_state_dir.name, 'shared')
+    SharedMemoryRateLimiter(path, 1024)
+    window_end = time.time() + 60
+    with multiprocessing.Pool(4) as pool:
+        allowed = sum(pool.starmap(_consume, [(path, window_end)] * 4))
+    assert allowed == 1000
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing the shared-memory rate limiter")
+    print("=" * 50)
+    tests = [test_fixed_window_limit, test_fixed_window_floor, test_token_bucket,
+             test_token_bucket_retry_at,
+             test_full_table_never_resets_live_windows, test_full_table_reuses_expired_slots,
+             test_atomic_across_processes]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__doc__}: {e}")
+    print("=" * 50)
+    print(f"{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()